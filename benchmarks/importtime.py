@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Check that the neicio modules import quickly, and without pulling in plotting or mapping packages.
+
+Each module is imported in a fresh interpreter (after numpy, which every module needs), and the
+time taken is compared against a budget.  The exit status is 1 if any module is over budget, or
+if importing it loaded any of the HEAVY_MODULES.
+
+python benchmarks/importtime.py
+"""
+
+#stdlib
+import os.path
+import sys
+import subprocess
+import argparse
+import json
+
+#seconds each module may take to import, on top of numpy
+DEFAULT_BUDGET = 0.05
+
+MODULES = ['neicio','neicio.geodict','neicio.grid','neicio.binfile','neicio.esri','neicio.gmt','neicio.shake',
+           'neicio.hazprob','neicio.hazcurve','neicio.gridcache','neicio.mapalgebra','neicio.zonal',
+           'neicio.exposure','neicio.sharedgrid','neicio.shapefile','neicio.shapereader','neicio.fixed','neicio.readstation',
+           'neicio.tag','neicio.cmdoutput','neicio.instrument']
+
+#packages that must only be imported by the code paths that use them
+HEAVY_MODULES = ['matplotlib','pylab','mpl_toolkits','scipy.interpolate','scipy.io']
+
+TIMER = '''
+import sys,time,json
+import numpy
+t1 = time.time()
+import %s
+t2 = time.time()
+heavy = [m for m in %r if m in sys.modules]
+sys.stdout.write(json.dumps({'seconds':t2-t1,'heavy':heavy}))
+'''
+
+def timeImport(module,repeat=3):
+    """
+    Time the import of a module in fresh interpreters.
+    @param module: Dotted module name.
+    @keyword repeat: Number of interpreters to start.
+    @return: Tuple of (fastest import time in seconds,list of HEAVY_MODULES that were imported).
+    @raise ImportError: When the module could not be imported.
+    """
+    rootdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([rootdir] + [p for p in [env.get('PYTHONPATH')] if p])
+    times = []
+    heavy = []
+    for i in range(0,repeat):
+        proc = subprocess.Popen([sys.executable,'-c',TIMER % (module,HEAVY_MODULES)],env=env,
+                                stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+        stdout,stderr = proc.communicate()
+        if proc.returncode:
+            raise ImportError('Could not import %s: %s' % (module,stderr.strip().split('\n')[-1]))
+        result = json.loads(stdout)
+        times.append(result['seconds'])
+        heavy = result['heavy']
+    return (min(times),heavy)
+
+def main(args):
+    failures = 0
+    for module in MODULES:
+        try:
+            seconds,heavy = timeImport(module,repeat=args.repeat)
+        except ImportError,msg:
+            print('%-22s %s' % (module,msg))
+            failures += 1
+            continue
+        problems = []
+        if seconds > args.budget:
+            problems.append('over budget')
+        if heavy:
+            problems.append('imported %s' % ','.join(heavy))
+        print('%-22s %8.1f ms %s' % (module,seconds*1000,'; '.join(problems)))
+        if problems:
+            failures += 1
+    if failures:
+        print('%i modules failed the import check' % failures)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    desc = 'Check the import time of each neicio module against a budget.'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('--budget',type=float,default=DEFAULT_BUDGET,
+                        help='Seconds each module may take to import, not counting numpy')
+    parser.add_argument('--repeat',type=int,default=3,help='Number of times to import each module')
+    main(parser.parse_args())
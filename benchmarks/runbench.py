@@ -0,0 +1,619 @@
+#!/usr/bin/env python
+"""
+Reproducible benchmarks for the neicio readers, writers and resamplers.
+
+Synthetic inputs (ShakeMap grid.xml, ESRI BIL+hdr, GMT native and netcdf grids, shapefiles with
+.spx indices, fixed-width catalogs and station lists) are generated at one or more sizes, then each
+benchmark is timed and memory-profiled in its own process.  Results are written as JSON, and can
+be compared against a stored baseline from an earlier run:
+
+python benchmarks/runbench.py --sizes small,medium --output baseline.json
+(upgrade numpy, scipy, neicio...)
+python benchmarks/runbench.py --sizes small,medium --baseline baseline.json --output new.json
+
+The exit status is 1 when any benchmark is slower (or uses more memory) than its baseline by
+more than the tolerance.
+"""
+
+#stdlib
+import os.path
+import sys
+import argparse
+import json
+import time
+import datetime
+import platform
+import shutil
+import tempfile
+import re
+import resource
+import multiprocessing
+import traceback
+
+#third party
+import numpy as np
+
+#make the neicio package in this source tree importable when run as a script
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#local
+import synthetic
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+RESULTS_VERSION = 1
+DEFAULT_TOLERANCE = 0.25
+#timing differences smaller than this (seconds) are noise, not regressions
+MIN_DIFFERENCE = 0.001
+
+#input dimensions for each size: grids are (nrows,ncols)
+SIZES = {'small':{'shakegrid':(121,151),'esri':(600,720),'gmt':(300,360),
+                  'shapes':200,'fixedlines':20000,'stations':200,'points':10000},
+         'medium':{'shakegrid':(361,451),'esri':(2400,2880),'gmt':(1200,1440),
+                   'shapes':1000,'fixedlines':200000,'stations':2000,'points':100000},
+         'large':{'shakegrid':(721,901),'esri':(4800,5760),'gmt':(2400,2880),
+                  'shapes':5000,'fixedlines':1000000,'stations':10000,'points':1000000}}
+
+BENCHMARKS = []
+
+def benchmark(name):
+    """
+    Decorator registering a benchmark.
+
+    The decorated function is called with the inputs dictionary returned by makeInputs(), and does
+    any untimed setup before returning a function of no arguments that does the timed work.  It is
+    called again before every repetition, so the timed function may modify what it is given.
+    """
+    def register(func):
+        BENCHMARKS.append((name,func))
+        return func
+    return register
+
+def makeInputs(workdir,size):
+    """
+    Generate all of the synthetic input files for one size.
+    @param workdir: Directory in which to write the files.
+    @param size: One of the keys of SIZES.
+    @return: Dictionary of input file names, geodicts and dimensions (the SIZES entry, plus file names).
+    """
+    dims = SIZES[size]
+    inputs = dict(dims)
+    inputs['size'] = size
+    sizedir = os.path.join(workdir,size)
+    if not os.path.isdir(sizedir):
+        os.makedirs(sizedir)
+    nrows,ncols = dims['shakegrid']
+    inputs['gridxml'] = os.path.join(sizedir,'grid.xml')
+    inputs['shakedict'] = synthetic.writeShakeGrid(inputs['gridxml'],nrows,ncols)
+    nrows,ncols = dims['esri']
+    inputs['bil'] = os.path.join(sizedir,'population.bil')
+    inputs['esridict'] = synthetic.writeEsriGrid(inputs['bil'],nrows,ncols)
+    inputs['gmtnative'] = os.path.join(sizedir,'native.grd')
+    inputs['gmtnetcdf'] = os.path.join(sizedir,'netcdf.grd')
+    nrows,ncols = dims['gmt']
+    try:
+        inputs['gmtdict'] = synthetic.writeGMTGrids(inputs['gmtnative'],inputs['gmtnetcdf'],nrows,ncols)
+    except ImportError:
+        #the GMT benchmarks will report themselves as skipped
+        pass
+    inputs['shp'] = synthetic.writeShapefile(os.path.join(sizedir,'polygons'),dims['shapes'])
+    try:
+        from neicio.shapefile import PagerShapeFile
+        PagerShapeFile(inputs['shp']).createShapeIndex()
+    except ImportError:
+        pass
+    inputs['fixed'] = os.path.join(sizedir,'catalog.txt')
+    synthetic.writeFixedFile(inputs['fixed'],dims['fixedlines'])
+    inputs['stations'] = os.path.join(sizedir,'stationlist.xml')
+    synthetic.writeStationList(inputs['stations'],dims['stations'])
+    inputs['outdir'] = sizedir
+    return inputs
+
+def getSubGeoDict(geodict,fraction,factor):
+    """
+    Return a geodict covering the central part of another, at a different resolution.
+    @param geodict: geodict dictionary.
+    @param fraction: Fraction (0-1) of the width and height of geodict to cover.
+    @param factor: Ratio of the new cell size to the old one (>1 is coarser).
+    @return: geodict dictionary.
+    """
+    xdim = geodict['xdim']*factor
+    ydim = geodict['ydim']*factor
+    ncols = int((geodict['xmax']-geodict['xmin'])*fraction/xdim)
+    nrows = int((geodict['ymax']-geodict['ymin'])*fraction/ydim)
+    lon = (geodict['xmin']+geodict['xmax'])/2.0
+    lat = (geodict['ymin']+geodict['ymax'])/2.0
+    return synthetic.getGeoDict(nrows,ncols,xdim,ydim,lon=lon,lat=lat)
+
+def getPoints(geodict,npoints):
+    """
+    Return random latitudes and longitudes inside a geodict.
+    @param geodict: geodict dictionary.
+    @param npoints: Number of points.
+    @return: Tuple of (lat,lon) numpy arrays.
+    """
+    rng = np.random.RandomState(synthetic.SEED)
+    lat = rng.uniform(geodict['ymin'],geodict['ymax'],npoints)
+    lon = rng.uniform(geodict['xmin'],geodict['xmax'],npoints)
+    return (lat,lon)
+
+def getMemoryGrid(geodict):
+    """
+    Return an in-memory Grid covering a geodict.
+    @param geodict: geodict dictionary.
+    @return: Grid object with float64 data.
+    """
+    from neicio.grid import Grid
+    grid = Grid()
+    grid.geodict = geodict.copy()
+    grid.griddata = synthetic.getSurface(geodict)
+    return grid
+
+###############################################################################
+#benchmarks
+###############################################################################
+
+@benchmark('shake.ShakeGrid')
+def benchShakeGrid(inputs):
+    from neicio.shake import ShakeGrid
+    return lambda: ShakeGrid(inputs['gridxml'],variable='MMI')
+
+@benchmark('esri.load.full')
+def benchEsriLoad(inputs):
+    from neicio.esri import EsriGrid
+    return lambda: EsriGrid(inputs['bil']).load()
+
+@benchmark('esri.load.bounds')
+def benchEsriLoadBounds(inputs):
+    from neicio.esri import EsriGrid
+    sub = getSubGeoDict(inputs['esridict'],0.5,1.0)
+    bounds = (sub['xmin'],sub['xmax'],sub['ymin'],sub['ymax'])
+    return lambda: EsriGrid(inputs['bil']).load(bounds=bounds)
+
+@benchmark('gmt.load.native')
+def benchGMTNative(inputs):
+    from neicio.gmt import GMTGrid
+    return lambda: GMTGrid(inputs['gmtnative'])
+
+@benchmark('gmt.load.netcdf')
+def benchGMTNetcdf(inputs):
+    from neicio.gmt import GMTGrid
+    return lambda: GMTGrid(inputs['gmtnetcdf'])
+
+@benchmark('gmt.save.native')
+def benchGMTSaveNative(inputs):
+    from neicio.gmt import GMTGrid
+    grid = GMTGrid(inputs['gmtnative'])
+    outfile = os.path.join(inputs['outdir'],'save_native.grd')
+    return lambda: grid.save(outfile,fmt='binary')
+
+@benchmark('gmt.save.netcdf')
+def benchGMTSaveNetcdf(inputs):
+    from neicio.gmt import GMTGrid
+    grid = GMTGrid(inputs['gmtnative'])
+    outfile = os.path.join(inputs['outdir'],'save_netcdf.grd')
+    return lambda: grid.save(outfile,fmt='netcdf')
+
+@benchmark('binfile.window')
+def benchBinFileWindow(inputs):
+    from neicio.binfile import BinFile
+    nrows,ncols = inputs['esri']
+    bfile = BinFile(inputs['bil'],nrows,ncols,np.float32)
+    return lambda: bfile[nrows/4:3*nrows/4,ncols/4:3*ncols/4]
+
+@benchmark('binfile.strided')
+def benchBinFileStrided(inputs):
+    from neicio.binfile import BinFile
+    nrows,ncols = inputs['esri']
+    bfile = BinFile(inputs['bil'],nrows,ncols,np.float32)
+    return lambda: bfile[0:nrows:4,0:ncols:4]
+
+@benchmark('binfile.points')
+def benchBinFilePoints(inputs):
+    from neicio.binfile import BinFile
+    nrows,ncols = inputs['esri']
+    bfile = BinFile(inputs['bil'],nrows,ncols,np.float32)
+    rng = np.random.RandomState(synthetic.SEED)
+    rows = rng.randint(0,nrows,1000).tolist()
+    cols = rng.randint(0,ncols,1000).tolist()
+    def run():
+        for i in range(0,len(rows)):
+            bfile[rows[i],cols[i]]
+    return run
+
+@benchmark('grid.binToGrid')
+def benchBinToGrid(inputs):
+    grid = getMemoryGrid(inputs['esridict'])
+    target = getSubGeoDict(inputs['esridict'],0.8,10.0)
+    return lambda: grid.binToGrid(target)
+
+@benchmark('grid.interpolateToGrid.linear')
+def benchInterpLinear(inputs):
+    grid = getMemoryGrid(inputs['shakedict'])
+    target = getSubGeoDict(inputs['shakedict'],0.8,1.0/3)
+    return lambda: grid.interpolateToGrid(target,method='linear')
+
+@benchmark('grid.interpolateToGrid.nearest')
+def benchInterpNearest(inputs):
+    grid = getMemoryGrid(inputs['shakedict'])
+    target = getSubGeoDict(inputs['shakedict'],0.8,1.0)
+    return lambda: grid.interpolateToGrid(target,method='nearest')
+
+@benchmark('grid.getValue.vector')
+def benchGetValue(inputs):
+    grid = getMemoryGrid(inputs['esridict'])
+    lat,lon = getPoints(inputs['esridict'],inputs['points'])
+    return lambda: grid.getValue(lat,lon)
+
+@benchmark('grid.getValue.scalar')
+def benchGetValueScalar(inputs):
+    grid = getMemoryGrid(inputs['esridict'])
+    lat,lon = getPoints(inputs['esridict'],1000)
+    lat = lat.tolist()
+    lon = lon.tolist()
+    def run():
+        for i in range(0,len(lat)):
+            grid.getValue(lat[i],lon[i])
+    return run
+
+@benchmark('grid.pickle')
+def benchGridPickle(inputs):
+    import cPickle
+    from neicio.shake import ShakeGrid
+    grids = [getMemoryGrid(inputs['esridict']),ShakeGrid(inputs['gridxml'],variable='MMI')]
+    return lambda: cPickle.loads(cPickle.dumps(grids,2))
+
+@benchmark('grid.window')
+def benchGridWindow(inputs):
+    grid = getMemoryGrid(inputs['esridict'])
+    lat,lon = getPoints(inputs['esridict'],100)
+    def run():
+        #regional sums around 100 points of a loaded grid
+        return [np.nansum(grid.window((x-1.0,x+1.0,y-1.0,y+1.0)).griddata) for y,x in zip(lat,lon)]
+    return run
+
+@benchmark('mapalgebra.save')
+def benchMapAlgebraSave(inputs):
+    from neicio.mapalgebra import lazy,where
+    pop = lazy(inputs['bil'])
+    expr = where(pop > 5,pop*0.01,0)*pop + 1
+    outfile = os.path.join(inputs['outdir'],'expression.bil')
+    return lambda: expr.save(outfile)
+
+@benchmark('mapalgebra.sum')
+def benchMapAlgebraSum(inputs):
+    from neicio.mapalgebra import lazy
+    pop = lazy(inputs['bil'])
+    return (pop*pop + pop*2).sum
+
+@benchmark('zonal.zonalStats')
+def benchZonalStats(inputs):
+    from neicio.zonal import zonalStats
+    pop = getMemoryGrid(inputs['esridict'])
+    #stand-ins for a country code grid and an MMI grid
+    codes = getMemoryGrid(inputs['esridict'])
+    codes.griddata = np.floor(codes.griddata*7) % 50
+    levels = getMemoryGrid(inputs['esridict'])
+    edges = np.linspace(np.nanmin(levels.griddata),np.nanmax(levels.griddata),11)
+    return lambda: zonalStats(pop,[codes,levels],bins=[None,edges])
+
+@benchmark('exposure.eager')
+def benchExposureEager(inputs):
+    from neicio.grid import Grid
+    from neicio.shake import ShakeGrid
+    from neicio.esri import EsriGrid
+    from neicio.exposure import MMI_EDGES
+    shakegrid = ShakeGrid(inputs['gridxml'],variable='MMI')
+    gdict = shakegrid.getGeoDict()
+    def run():
+        popgrid = EsriGrid(inputs['bil'])
+        popgrid.load(bounds=(gdict['xmin'],gdict['xmax'],gdict['ymin'],gdict['ymax']))
+        mmigrid = Grid()
+        mmigrid.loadFromGrid(shakegrid)
+        mmigrid.interpolateToGrid(popgrid.getGeoDict())
+        mmi = mmigrid.griddata
+        return [np.nansum(popgrid.griddata[(mmi >= MMI_EDGES[i]) & (mmi < MMI_EDGES[i+1])])
+                for i in range(0,len(MMI_EDGES)-1)]
+    return run
+
+@benchmark('exposure.getExposure')
+def benchExposureFused(inputs):
+    from neicio.shake import ShakeGrid
+    from neicio.exposure import getExposure
+    shakegrid = ShakeGrid(inputs['gridxml'],variable='MMI')
+    return lambda: getExposure(inputs['bil'],shakegrid)
+
+@benchmark('sharedgrid.attach')
+def benchSharedGridAttach(inputs):
+    from neicio.esri import EsriGrid
+    from neicio.sharedgrid import publishGrid,attachGrid
+    popgrid = EsriGrid(inputs['bil'])
+    popgrid.load()
+    name = publishGrid(popgrid,name='sharedgrid',directory=inputs['outdir'])
+    lat,lon = getPoints(inputs['esridict'],1)
+    return lambda: attachGrid(name,directory=inputs['outdir']).getValue(lat[0],lon[0])
+
+@benchmark('shapefile.getBoundingBoxes')
+def benchShapeBoxes(inputs):
+    from neicio.shapefile import PagerShapeFile
+    return lambda: PagerShapeFile(inputs['shp']).getBoundingBoxes()
+
+@benchmark('shapefile.createShapeIndex')
+def benchShapeIndex(inputs):
+    from neicio.shapefile import PagerShapeFile
+    shpfile = PagerShapeFile(inputs['shp'])
+    return shpfile.createShapeIndex
+
+@benchmark('shapefile.getShapesByBoundingBox')
+def benchShapesByBox(inputs):
+    from neicio.shapefile import PagerShapeFile
+    shpfile = PagerShapeFile(inputs['shp'])
+    lon,lat = synthetic.CENTERLON,synthetic.CENTERLAT
+    return lambda: shpfile.getShapesByBoundingBox((lon-2,lon+2,lat-2,lat+2))
+
+@benchmark('shapefile.getShapesByAttr')
+def benchShapesByAttr(inputs):
+    from neicio.shapefile import PagerShapeFile
+    shpfile = PagerShapeFile(inputs['shp'])
+    return lambda: shpfile.getShapesByAttr('CODE',3)
+
+@benchmark('fixed.readFixedFormatString')
+def benchReadFixedString(inputs):
+    from neicio.fixed import readFixedFormatString
+    lines = open(inputs['fixed'],'rt').read().splitlines()
+    def run():
+        for line in lines:
+            readFixedFormatString(synthetic.FIXEDSPEC,line)
+    return run
+
+@benchmark('fixed.FixedFormatCodec.readLines')
+def benchCodecRead(inputs):
+    from neicio.fixed import FixedFormatCodec
+    codec = FixedFormatCodec(synthetic.FIXEDSPEC,names=synthetic.FIXEDNAMES)
+    return lambda: codec.readLines(open(inputs['fixed'],'rt'))
+
+@benchmark('fixed.FixedFormatCodec.writeRows')
+def benchCodecWrite(inputs):
+    from neicio.fixed import FixedFormatCodec
+    codec = FixedFormatCodec(synthetic.FIXEDSPEC,names=synthetic.FIXEDNAMES)
+    rows = codec.readLines(open(inputs['fixed'],'rt'))
+    outfile = os.path.join(inputs['outdir'],'catalog_out.txt')
+    def run():
+        f = open(outfile,'wt')
+        codec.writeRows(f,rows)
+        f.close()
+    return run
+
+@benchmark('readstation.readStation')
+def benchReadStation(inputs):
+    from neicio.readstation import readStation
+    return lambda: readStation(inputs['stations'])
+
+@benchmark('readstation.readStationComponents')
+def benchReadStationComponents(inputs):
+    from neicio.readstation import readStationComponents
+    return lambda: readStationComponents(inputs['stations'])
+
+###############################################################################
+#running and comparing
+###############################################################################
+
+def getMaxRSS():
+    """
+    Return the peak resident set size of this process in kilobytes.
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss = maxrss/1024
+    return maxrss
+
+def runBenchmark(func,inputs,repeat):
+    """
+    Time and memory-profile one benchmark.
+    @param func: Registered benchmark function (see benchmark()).
+    @param inputs: Inputs dictionary (see makeInputs()).
+    @param repeat: Number of timed repetitions.
+    @return: Result dictionary with keys:
+             - status 'ok', 'skipped' (a module could not be imported), or 'error'.
+             - times List of wall clock times (seconds) for each repetition.
+             - min,median,mean Summary of times.
+             - peak_rss_kb Growth of the process peak resident set size during the first repetition.
+             - peak_alloc_bytes Peak traced allocation during the first repetition (None where
+               tracemalloc is not available).
+             - message Error message, for errors and skips.
+    """
+    result = {'status':'ok','times':[],'peak_rss_kb':None,'peak_alloc_bytes':None}
+    try:
+        for i in range(0,repeat):
+            run = func(inputs)
+            if i == 0:
+                rss = getMaxRSS()
+                if tracemalloc is not None:
+                    tracemalloc.start()
+            t1 = time.time()
+            run()
+            t2 = time.time()
+            if i == 0:
+                if tracemalloc is not None:
+                    result['peak_alloc_bytes'] = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                result['peak_rss_kb'] = getMaxRSS()-rss
+            result['times'].append(t2-t1)
+            del run
+    except ImportError,msg:
+        result['status'] = 'skipped'
+        result['message'] = str(msg)
+    except Exception,msg:
+        result['status'] = 'error'
+        result['message'] = traceback.format_exc()
+    times = sorted(result['times'])
+    if times:
+        result['min'] = times[0]
+        result['median'] = times[len(times)/2]
+        result['mean'] = sum(times)/len(times)
+    return result
+
+def runIsolated(func,inputs,repeat):
+    """
+    Run one benchmark in a child process, so that its peak memory use is not hidden by earlier ones.
+    @param func: Registered benchmark function (see benchmark()).
+    @param inputs: Inputs dictionary (see makeInputs()).
+    @param repeat: Number of timed repetitions.
+    @return: Result dictionary (see runBenchmark()).
+    """
+    reader,writer = multiprocessing.Pipe(False)
+    def child():
+        writer.send(runBenchmark(func,inputs,repeat))
+    proc = multiprocessing.Process(target=child)
+    proc.start()
+    writer.close()
+    try:
+        result = reader.recv()
+    except EOFError:
+        result = {'status':'error','times':[],'peak_rss_kb':None,'peak_alloc_bytes':None,
+                  'message':'Benchmark process exited with code %s' % proc.exitcode}
+    proc.join()
+    return result
+
+def getEnvironment():
+    """
+    Return a dictionary describing the machine and the versions of the libraries being measured.
+    """
+    env = {'python':platform.python_version(),
+           'platform':platform.platform(),
+           'machine':platform.machine(),
+           'processor':platform.processor(),
+           'cpus':multiprocessing.cpu_count(),
+           'numpy':np.__version__}
+    try:
+        import scipy
+        env['scipy'] = scipy.__version__
+    except ImportError:
+        env['scipy'] = None
+    return env
+
+def compareResults(results,baseline,tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare results against a baseline.
+    @param results: Results dictionary (as written to JSON by main()).
+    @param baseline: Results dictionary from an earlier run.
+    @keyword tolerance: Fractional increase in minimum time or peak memory above which a benchmark
+                        counts as a regression.
+    @return: List of dictionaries with keys 'key','time_ratio','memory_ratio','regression'.
+             Benchmarks missing from either run, or that did not succeed in both, are left out.
+             Slowdowns smaller than MIN_DIFFERENCE seconds are never counted as regressions.
+    """
+    comparisons = []
+    for key in sorted(results['benchmarks'].keys()):
+        new = results['benchmarks'][key]
+        old = baseline['benchmarks'].get(key)
+        if old is None or new['status'] != 'ok' or old['status'] != 'ok':
+            continue
+        time_ratio = None
+        if old['min'] > 0:
+            time_ratio = new['min']/old['min']
+        memory_ratio = None
+        if old['peak_rss_kb'] and new['peak_rss_kb'] is not None:
+            memory_ratio = float(new['peak_rss_kb'])/old['peak_rss_kb']
+        slower = new['min']-old['min'] > MIN_DIFFERENCE
+        regression = ((time_ratio is not None and time_ratio > 1+tolerance and slower) or
+                      (memory_ratio is not None and memory_ratio > 1+tolerance))
+        comparisons.append({'key':key,'time_ratio':time_ratio,'memory_ratio':memory_ratio,
+                            'regression':regression})
+    return comparisons
+
+def formatRatio(ratio):
+    if ratio is None:
+        return '-'
+    return '%.2fx' % ratio
+
+def main(args):
+    sizes = args.sizes.split(',')
+    for size in sizes:
+        if size not in SIZES:
+            print('Unknown size "%s", choose from %s' % (size,','.join(sorted(SIZES.keys()))))
+            sys.exit(2)
+    benchmarks = BENCHMARKS
+    if args.filter:
+        benchmarks = [b for b in BENCHMARKS if re.search(args.filter,b[0])]
+    if args.list:
+        for name,func in benchmarks:
+            print(name)
+        sys.exit(0)
+
+    workdir = args.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix='neiciobench')
+    results = {'version':RESULTS_VERSION,
+               'timestamp':datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+               'environment':getEnvironment(),
+               'repeat':args.repeat,
+               'benchmarks':{}}
+    try:
+        for size in sizes:
+            sys.stderr.write('Generating %s inputs in %s\n' % (size,workdir))
+            inputs = makeInputs(workdir,size)
+            for name,func in benchmarks:
+                if args.inprocess:
+                    result = runBenchmark(func,inputs,args.repeat)
+                else:
+                    result = runIsolated(func,inputs,args.repeat)
+                result['name'] = name
+                result['size'] = size
+                key = '%s/%s' % (name,size)
+                results['benchmarks'][key] = result
+                if result['status'] == 'ok':
+                    print('%-45s %10.4f s %10s KB' % (key,result['min'],result['peak_rss_kb']))
+                else:
+                    print('%-45s %s' % (key,result['status']))
+                    if args.verbose:
+                        print(result['message'])
+    finally:
+        if args.workdir is None and not args.keep:
+            shutil.rmtree(workdir)
+
+    if args.output:
+        f = open(args.output,'wt')
+        json.dump(results,f,indent=2,sort_keys=True)
+        f.close()
+
+    if args.baseline:
+        baseline = json.load(open(args.baseline,'rt'))
+        comparisons = compareResults(results,baseline,tolerance=args.tolerance)
+        print('')
+        print('%-45s %10s %10s' % ('Compared to %s' % os.path.basename(args.baseline),'time','memory'))
+        nregressions = 0
+        for comp in comparisons:
+            flag = ''
+            if comp['regression']:
+                flag = 'REGRESSION'
+                nregressions += 1
+            print('%-45s %10s %10s %s' % (comp['key'],formatRatio(comp['time_ratio']),
+                                          formatRatio(comp['memory_ratio']),flag))
+        if nregressions:
+            print('%i benchmarks regressed by more than %i%%' % (nregressions,args.tolerance*100))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    desc = 'Time and memory-profile neicio readers, writers and resamplers on synthetic data.'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('--sizes',default='small',
+                        help='Comma separated list of input sizes (%s)' % ','.join(sorted(SIZES.keys())))
+    parser.add_argument('--repeat',type=int,default=3,help='Number of timed repetitions of each benchmark')
+    parser.add_argument('--filter',help='Only run benchmarks whose names match this regular expression')
+    parser.add_argument('--output',help='Write JSON results to this file')
+    parser.add_argument('--baseline',help='Compare results against this JSON results file')
+    parser.add_argument('--tolerance',type=float,default=DEFAULT_TOLERANCE,
+                        help='Fractional slowdown/memory growth counted as a regression')
+    parser.add_argument('--workdir',help='Directory for generated inputs (kept after the run)')
+    parser.add_argument('--keep',action='store_true',default=False,
+                        help='Keep the temporary directory of generated inputs')
+    parser.add_argument('--inprocess',action='store_true',default=False,
+                        help='Run every benchmark in this process (memory numbers are then cumulative)')
+    parser.add_argument('--list',action='store_true',default=False,help='List benchmark names and exit')
+    parser.add_argument('-v','--verbose',action='store_true',default=False,
+                        help='Print error messages from failed benchmarks')
+    main(parser.parse_args())
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+
+#stdlib
+import os.path
+import struct
+
+#third party
+import numpy as np
+
+#all of the synthetic data is centered on this point
+CENTERLON = 138.0
+CENTERLAT = 36.0
+SEED = 1234
+
+GRIDXML_HEADER = '''<?xml version="1.0" encoding="US-ASCII" standalone="yes"?>
+<shakemap_grid xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns="http://earthquake.usgs.gov/eqcenter/shakemap" event_id="bench" shakemap_id="bench" shakemap_version="1" code_version="3.5" process_timestamp="2014-01-01T00:00:00Z" shakemap_originator="us" map_status="RELEASED" shakemap_event_type="ACTUAL">
+<event event_id="bench" magnitude="7.5" depth="10.0" lat="%(lat).4f" lon="%(lon).4f" event_timestamp="2014-01-01T00:00:00UTC" event_network="us" event_description="Synthetic benchmark event" />
+<grid_specification lon_min="%(lon_min).4f" lat_min="%(lat_min).4f" lon_max="%(lon_max).4f" lat_max="%(lat_max).4f" nominal_lon_spacing="%(xdim).6f" nominal_lat_spacing="%(ydim).6f" nlon="%(nlon)i" nlat="%(nlat)i" />
+<grid_field index="1" name="LON" units="dd" />
+<grid_field index="2" name="LAT" units="dd" />
+<grid_field index="3" name="PGA" units="pctg" />
+<grid_field index="4" name="PGV" units="cms" />
+<grid_field index="5" name="MMI" units="intensity" />
+<grid_field index="6" name="PSA03" units="pctg" />
+<grid_field index="7" name="PSA10" units="pctg" />
+<grid_field index="8" name="PSA30" units="pctg" />
+<grid_data>
+'''
+GRIDXML_FOOTER = '''</grid_data>
+</shakemap_grid>
+'''
+
+#fixed-width catalog layout used by the fixed-width benchmarks
+FIXEDSPEC = [((1,10),'f10.4'),((12,21),'f10.4'),((23,28),'f6.2'),((30,33),'f4.1'),
+             ((35,42),'a8'),((44,49),'i6')]
+FIXEDNAMES = ['lat','lon','depth','mag','network','nstations']
+
+def getGeoDict(nrows,ncols,xdim,ydim,lon=CENTERLON,lat=CENTERLAT):
+    """
+    Return a geodict centered on a point.
+    @param nrows: Number of rows.
+    @param ncols: Number of columns.
+    @param xdim: Cell width in decimal degrees.
+    @param ydim: Cell height in decimal degrees.
+    @keyword lon: Longitude of the center of the grid.
+    @keyword lat: Latitude of the center of the grid.
+    @return: geodict dictionary (see Grid.getGeoDict()).
+    """
+    xmin = lon - (ncols-1)*xdim/2.0
+    ymax = lat + (nrows-1)*ydim/2.0
+    geodict = {'nrows':nrows,'ncols':ncols,'nbands':1,'bandnames':['Synthetic'],
+               'xmin':xmin,'xmax':xmin+(ncols-1)*xdim,
+               'ymin':ymax-(nrows-1)*ydim,'ymax':ymax,
+               'xdim':xdim,'ydim':ydim,'time':None}
+    return geodict
+
+def getSurface(geodict,dtype=np.float64):
+    """
+    Return a smooth, decaying surface (something like a ground motion field) covering a geodict.
+    @param geodict: geodict dictionary.
+    @keyword dtype: numpy data type of the output array.
+    @return: 2D numpy array of shape (nrows,ncols).
+    """
+    lons = geodict['xmin'] + np.arange(geodict['ncols'])*geodict['xdim']
+    lats = geodict['ymax'] - np.arange(geodict['nrows'])*geodict['ydim']
+    dx = (lons - CENTERLON)*np.cos(np.radians(CENTERLAT))
+    dy = lats - CENTERLAT
+    dist = np.sqrt(dx[np.newaxis,:]**2 + dy[:,np.newaxis]**2)
+    return (9.0*np.exp(-dist/2.0) + 1.0).astype(dtype)
+
+def writeShakeGrid(filename,nrows,ncols,xdim=0.0166667):
+    """
+    Write a ShakeMap grid.xml file with eight columns of smooth synthetic ground motions.
+    @param filename: Output file name.
+    @param nrows: Number of grid rows (latitudes).
+    @param ncols: Number of grid columns (longitudes).
+    @keyword xdim: Grid spacing in decimal degrees (the same in both directions).
+    @return: geodict dictionary describing the grid.
+    """
+    geodict = getGeoDict(nrows,ncols,xdim,xdim)
+    mmi = getSurface(geodict)
+    lons = geodict['xmin'] + np.arange(ncols)*xdim
+    lats = geodict['ymax'] - np.arange(nrows)*xdim
+    lon,lat = np.meshgrid(lons,lats)
+    pga = np.exp(mmi/2.0)
+    data = np.column_stack((lon.ravel(),lat.ravel(),pga.ravel(),(pga*1.2).ravel(),mmi.ravel(),
+                            (pga*2.0).ravel(),(pga*0.8).ravel(),(pga*0.2).ravel()))
+    hdict = {'lat':CENTERLAT,'lon':CENTERLON,
+             'lon_min':geodict['xmin'],'lon_max':geodict['xmax'],
+             'lat_min':geodict['ymin'],'lat_max':geodict['ymax'],
+             'xdim':xdim,'ydim':xdim,'nlon':ncols,'nlat':nrows}
+    f = open(filename,'wt')
+    f.write(GRIDXML_HEADER % hdict)
+    np.savetxt(f,data,fmt='%.4f')
+    f.write(GRIDXML_FOOTER)
+    f.close()
+    return geodict
+
+def writeEsriGrid(filename,nrows,ncols,xdim=0.0083333):
+    """
+    Write a float32 ESRI BIL file and its .hdr header.
+    @param filename: Output file name (should end with .bil).
+    @param nrows: Number of rows.
+    @param ncols: Number of columns.
+    @keyword xdim: Grid spacing in decimal degrees (the same in both directions).
+    @return: geodict dictionary describing the grid.
+    """
+    geodict = getGeoDict(nrows,ncols,xdim,xdim)
+    getSurface(geodict,dtype='<f4').tofile(filename)
+    hdrfile = os.path.splitext(filename)[0]+'.hdr'
+    f = open(hdrfile,'wt')
+    f.write('byteorder I\n')
+    f.write('layout bil\n')
+    f.write('nrows %i\n' % nrows)
+    f.write('ncols %i\n' % ncols)
+    f.write('nbands 1\n')
+    f.write('nbits 32\n')
+    f.write('pixeltype float\n')
+    f.write('ulxmap %.8f\n' % geodict['xmin'])
+    f.write('ulymap %.8f\n' % geodict['ymax'])
+    f.write('xdim %.8f\n' % xdim)
+    f.write('ydim %.8f\n' % xdim)
+    f.close()
+    return geodict
+
+def writeGMTGrids(nativefile,netcdffile,nrows,ncols,xdim=0.0083333):
+    """
+    Write the same float32 surface as a native GMT grid and a COARDS netcdf GMT grid.
+    @param nativefile: Output native (binary) file name.
+    @param netcdffile: Output netcdf file name.
+    @param nrows: Number of rows.
+    @param ncols: Number of columns.
+    @keyword xdim: Grid spacing in decimal degrees (the same in both directions).
+    @return: geodict dictionary describing the grids.
+    """
+    from neicio.gmt import GMTGrid
+    geodict = getGeoDict(nrows,ncols,xdim,xdim)
+    grid = GMTGrid()
+    grid.geodict = geodict.copy()
+    grid.griddata = getSurface(geodict,dtype=np.float32)
+    grid.save(nativefile,fmt='binary')
+    grid.save(netcdffile,fmt='netcdf')
+    return geodict
+
+def writeShapefile(basename,nshapes,bounds=(CENTERLON-10,CENTERLON+10,CENTERLAT-10,CENTERLAT+10)):
+    """
+    Write a polygon shapefile (.shp,.shx,.dbf) of randomly placed hexagons.
+    @param basename: Output file name, without extension.
+    @param nshapes: Number of polygons.
+    @keyword bounds: Tuple of (xmin,xmax,ymin,ymax) within which polygons are centered.
+    @return: Name of the .shp file.
+
+    Attributes are NAME (string), CODE (integer, cycling from 0 to 9) and VALUE (float).
+    """
+    xmin,xmax,ymin,ymax = bounds
+    rng = np.random.RandomState(SEED)
+    cx = rng.uniform(xmin,xmax,nshapes)
+    cy = rng.uniform(ymin,ymax,nshapes)
+    radius = rng.uniform(0.05,0.5,nshapes)
+    angles = np.linspace(0,2*np.pi,7)
+    records = []
+    for i in range(0,nshapes):
+        px = cx[i] + radius[i]*np.cos(angles)
+        py = cy[i] + radius[i]*np.sin(angles)
+        px[-1] = px[0]
+        py[-1] = py[0]
+        bbox = (px.min(),py.min(),px.max(),py.max())
+        #shape type, bounding box, one part, npoints, part offsets, points
+        content = struct.pack('<i4d2i',5,bbox[0],bbox[1],bbox[2],bbox[3],1,len(px))
+        content += struct.pack('<i',0)
+        content += np.column_stack((px,py)).astype('<f8').tostring()
+        records.append(content)
+    allbox = (xmin-0.5,ymin-0.5,xmax+0.5,ymax+0.5)
+    shp = open(basename+'.shp','wb')
+    shx = open(basename+'.shx','wb')
+    shplength = 100 + sum([8+len(r) for r in records])
+    shp.write(getShapeHeader(shplength,allbox))
+    shx.write(getShapeHeader(100+8*nshapes,allbox))
+    offset = 100
+    for i in range(0,nshapes):
+        content = records[i]
+        shp.write(struct.pack('>2i',i+1,len(content)/2))
+        shp.write(content)
+        shx.write(struct.pack('>2i',offset/2,len(content)/2))
+        offset += 8+len(content)
+    shp.close()
+    shx.close()
+
+    fields = [('NAME','C',16,0),('CODE','N',6,0),('VALUE','F',12,4)]
+    reclength = 1 + sum([f[2] for f in fields])
+    dbf = open(basename+'.dbf','wb')
+    dbf.write(struct.pack('<4BIHH20x',3,114,1,1,nshapes,32+32*len(fields)+1,reclength))
+    for name,ftype,size,decimal in fields:
+        dbf.write(struct.pack('<11sc4xBB14x',name,ftype,size,decimal))
+    dbf.write('\r')
+    for i in range(0,nshapes):
+        dbf.write(' ')
+        dbf.write(('shape%i' % i).ljust(16))
+        dbf.write(('%i' % (i % 10)).rjust(6))
+        dbf.write(('%.4f' % radius[i]).rjust(12))
+    dbf.write('\x1a')
+    dbf.close()
+    return basename+'.shp'
+
+def getShapeHeader(nbytes,bbox):
+    """
+    Return the 100 byte header shared by .shp and .shx files, for a polygon shapefile.
+    @param nbytes: Length of the file in bytes.
+    @param bbox: Tuple of (xmin,ymin,xmax,ymax) for the whole file.
+    @return: Header string.
+    """
+    header = struct.pack('>i5ii',9994,0,0,0,0,0,nbytes/2)
+    header += struct.pack('<2i',1000,5)
+    header += struct.pack('<8d',bbox[0],bbox[1],bbox[2],bbox[3],0,0,0,0)
+    return header
+
+def writeFixedFile(filename,nlines):
+    """
+    Write a fixed-width earthquake catalog laid out according to FIXEDSPEC.
+    @param filename: Output file name.
+    @param nlines: Number of lines.
+    @return: Number of lines written.
+    """
+    rng = np.random.RandomState(SEED)
+    lat = rng.uniform(-60,60,nlines)
+    lon = rng.uniform(-180,180,nlines)
+    depth = rng.uniform(0,700,nlines)
+    mag = rng.uniform(2,9,nlines)
+    nsta = rng.randint(0,999999,nlines)
+    networks = ['us','ci','nc','ak','hv']
+    f = open(filename,'wt')
+    for i in range(0,nlines):
+        f.write('%10.4f %10.4f %6.2f %4.1f %-8s %6i\n' % (lat[i],lon[i],depth[i],mag[i],
+                                                         networks[i % len(networks)],nsta[i]))
+    f.close()
+    return nlines
+
+def writeStationList(filename,nstations,ncomps=3):
+    """
+    Write a ShakeMap stationlist.xml file.
+    @param filename: Output file name.
+    @param nstations: Number of stations.
+    @keyword ncomps: Number of components per station.
+    @return: Number of stations written.
+    """
+    rng = np.random.RandomState(SEED)
+    lat = CENTERLAT + rng.uniform(-5,5,nstations)
+    lon = CENTERLON + rng.uniform(-5,5,nstations)
+    amps = rng.uniform(0.01,100,(nstations,5))
+    compnames = ['HNE','HNN','HNZ','BHE','BHN','BHZ']
+    f = open(filename,'wt')
+    f.write('<?xml version="1.0" encoding="US-ASCII" standalone="yes"?>\n')
+    f.write('<shakemap-data code_version="3.5" map_version="1">\n')
+    f.write('<earthquake id="bench" lat="%.4f" lon="%.4f" mag="7.5" year="2014" month="1" day="1" '
+            'hour="0" minute="0" second="0" timezone="GMT" depth="10.0" locstring="Synthetic" '
+            'created="1388534400" />\n' % (CENTERLAT,CENTERLON))
+    f.write('<stationlist created="1388534400">\n')
+    for i in range(0,nstations):
+        f.write('<station code="ST%05i" name="Station %i" insttype="synthetic" lat="%.4f" lon="%.4f" '
+                'source="bench" netid="XX" commtype="DIG" intensity="%.1f">\n' % (i,i,lat[i],lon[i],
+                                                                                    amps[i,0]/10.0))
+        for j in range(0,ncomps):
+            f.write('<comp name="%s">\n' % compnames[j % len(compnames)])
+            f.write('<pga value="%.4f" flag="0" />\n' % amps[i,0])
+            f.write('<pgv value="%.4f" flag="0" />\n' % amps[i,1])
+            f.write('<psa03 value="%.4f" flag="0" />\n' % amps[i,2])
+            f.write('<psa10 value="%.4f" flag="0" />\n' % amps[i,3])
+            f.write('<psa30 value="%.4f" flag="0" />\n' % amps[i,4])
+            f.write('</comp>\n')
+        f.write('</station>\n')
+    f.write('</stationlist>\n')
+    f.write('</shakemap-data>\n')
+    f.close()
+    return nstations
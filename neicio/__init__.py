@@ -0,0 +1 @@
+from neicio.instrument import profile
@@ -7,12 +7,16 @@ import sys
 #third party
 import numpy
 
+#local
+import instrument
+
 class BinFileError(Exception):
     "used to indicate an error in BinFile"
     def __str__(self):
         return repr(self.args[0])
 
 
+@instrument.instrumentClass
 class BinFile:
     """
     Read-only representation of any rectangular binary grid file.  [] indexing into file in the same way
@@ -40,6 +44,7 @@ class BinFile:
           - numpy.uint32
           - numpy.float32
           - numpy.float64
+          or a numpy dtype with a byte order (numpy.dtype('>i2'), etc.) for data of that byte order.
         @keyword skip: Number of header bytes to skip.
         @keyword mode: Mode to use to open the file.  Defaults to read-only.  Use "r+b" for read/write
         @raise BinFileError: If filename is not found.
@@ -51,14 +56,8 @@ class BinFile:
             raise BinFileError, "mode keyword must be one of %s" % (str(self.Modes.keys()))
         fmode = self.Modes[mode]
         self.fobj = open(filename,fmode) #this gets closed in the destructor...
-        if dtype == numpy.uint8 or dtype == numpy.int8:
-            self.dwidth = 1
-        if dtype == numpy.uint16 or dtype == numpy.int16:
-            self.dwidth = 2
-        if dtype == numpy.uint32 or dtype == numpy.int32 or dtype == numpy.float32:
-            self.dwidth = 4
-        if dtype == numpy.float64:
-            self.dwidth = 8
+        #dtypes with a byte order ('>i2', etc.) read data of that byte order
+        self.dwidth = numpy.dtype(dtype).itemsize
         self.skip = skip
         self.dtype = dtype
         self.shape = (nrows,ncols)
@@ -67,6 +66,7 @@ class BinFile:
         """Destructor - closes binary file."""
         self.fobj.close()
 
+    @instrument.instrumented('binfile.write')
     def __setitem__(self,*args):
         """Allows modification of grid file in the same way as a numpy array.
         
@@ -109,9 +109,12 @@ class BinFile:
             offset = self.skip + self.dwidth*idx
             self.fobj.seek(offset,0)
             data.tofile(self.fobj)
+            if instrument.ENABLED:
+                instrument.count(seeks=1,writes=1,bytes_written=self.dwidth)
         else:
             raise BinFileError,"Only scalar inserts are supported"
         
+    @instrument.instrumented('binfile.read')
     def __getitem__(self,*args):
         """Allows slicing of grid file in the same way as a numpy array.
         
@@ -141,6 +144,8 @@ class BinFile:
             idx = ncols * row + col
             offset = self.skip + self.dwidth*idx
             self.fobj.seek(offset,0)
+            if instrument.ENABLED:
+                instrument.count(seeks=1,reads=1,bytes_read=self.dwidth)
             return(numpy.fromfile(self.fobj,dtype=self.dtype,count=1))
         if len(args) == 1 and isinstance(args[0][0],slice):
             nrows = self.shape[0]
@@ -185,6 +190,8 @@ class BinFile:
                 line = numpy.fromfile(self.fobj,dtype=self.dtype,count=ncols)
                 data[outrow,:] = line[int(colstart):int(colend):int(colstep)]
                 outrow = outrow+1
+            if instrument.ENABLED:
+                instrument.count(seeks=outrow+1,reads=outrow,bytes_read=outrow*ncols*self.dwidth)
         else:
             raise BinFileError, "Unsupported __getitem__ input %s" % (str(key))
         return(data)
@@ -3,6 +3,20 @@
 from __future__ import print_function
 
 import subprocess
+import threading
+import time
+import os
+import signal
+from multiprocessing.pool import ThreadPool
+
+#how often running commands are checked for timeouts and cancellation
+POLL_INTERVAL = 0.05
+READ_SIZE = 65536
+#seconds to wait for output after a command is killed, in case something it started left its process group
+KILL_WAIT = 1.0
+#commands run at the same time (from threads) must not inherit each other's pipes, or they don't see the end of
+#their output until their siblings exit.  (Windows can't close inherited handles while redirecting output.)
+CLOSE_FDS = os.name == 'posix'
 
 def getCommandOutput(cmd):
     """
@@ -14,7 +28,8 @@ def getCommandOutput(cmd):
     proc = subprocess.Popen(cmd,
                             shell=True,
                             stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE
+                            stderr=subprocess.PIPE,
+                            close_fds=CLOSE_FDS
                             )
     stdout,stderr = proc.communicate()
     retcode = proc.returncode
@@ -24,7 +39,147 @@ def getCommandOutput(cmd):
         retcode = False
     return (retcode,stdout,stderr)
 
+def runCommand(cmd,timeout=None,maxoutput=None,cancel=None,callback=None):
+    """
+    Call an external command, reading its output as it is produced.
+    @param cmd: String command ('ls -l', etc.)
+    @keyword timeout: Number of seconds after which the command is killed.
+    @keyword maxoutput: Maximum number of bytes of stdout (and of stderr) to keep.  Output past this
+                        is read and discarded, so the command never blocks on a full pipe.
+    @keyword cancel: threading.Event which, when set, kills the command.
+    @keyword callback: Function called as callback(name,chunk) with each piece of output as it
+                       is read, where name is 'stdout' or 'stderr'.
+    @return: Three-element tuple containing a boolean indicating success or failure, 
+    the stdout from running the command, and stderr.  Commands that time out or are cancelled fail,
+    with the reason appended to stderr.
+    """
+    #run the command in its own process group, so that killing it also kills anything the shell started
+    preexec_fn = None
+    if hasattr(os,'setsid'):
+        preexec_fn = os.setsid
+    proc = subprocess.Popen(cmd,
+                            shell=True,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            preexec_fn=preexec_fn,
+                            close_fds=CLOSE_FDS
+                            )
+    outputs = {'stdout':[],'stderr':[]}
+    def reader(name,pipe):
+        nbytes = 0
+        fd = pipe.fileno()
+        while True:
+            chunk = os.read(fd,READ_SIZE)
+            if not len(chunk):
+                break
+            if callback is not None:
+                callback(name,chunk)
+            if maxoutput is not None:
+                chunk = chunk[0:max(0,maxoutput-nbytes)]
+            nbytes += len(chunk)
+            if len(chunk):
+                outputs[name].append(chunk)
+        pipe.close()
+    readers = [threading.Thread(target=reader,args=('stdout',proc.stdout)),
+               threading.Thread(target=reader,args=('stderr',proc.stderr))]
+    for thread in readers:
+        thread.daemon = True
+        thread.start()
+    reason = None
+    starttime = time.time()
+    #the command isn't done until its output is, as anything it started in the background may still be
+    #writing to (or just holding open) the pipes after the shell exits
+    while True:
+        running = proc.poll() is None
+        reading = [thread for thread in readers if thread.is_alive()]
+        if not running and not len(reading):
+            break
+        if timeout is not None and time.time() - starttime > timeout:
+            reason = 'Command timed out after %.1f seconds' % timeout
+        if cancel is not None and cancel.is_set():
+            reason = 'Command was cancelled'
+        if reason is not None:
+            killProcess(proc)
+            proc.wait()
+            for thread in readers:
+                thread.join(KILL_WAIT)
+            break
+        if running:
+            time.sleep(POLL_INTERVAL)
+        else:
+            reading[0].join(POLL_INTERVAL)
+    stdout = type(b'')().join(outputs['stdout'])
+    stderr = type(b'')().join(outputs['stderr'])
+    if reason is not None:
+        stderr += reason.encode('ascii')
+    return (proc.returncode == 0 and reason is None,stdout,stderr)
+
+def killProcess(proc):
+    """
+    Kill a process started by runCommand(), along with its process group.
+    @param proc: subprocess.Popen object.
+    """
+    try:
+        if hasattr(os,'killpg'):
+            os.killpg(proc.pid,signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError: #already gone
+        pass
+
+def runCommands(cmds,nparallel=4,timeout=None,maxoutput=None,cancel=None,callback=None):
+    """
+    Call many external commands concurrently, with at most nparallel running at once.
+    @param cmds: List of string commands.
+    @keyword nparallel: Maximum number of commands to run at once.
+    @keyword timeout: Number of seconds after which each command is killed (see runCommand()).
+    @keyword maxoutput: Maximum number of bytes of stdout/stderr to keep for each command (see runCommand()).
+    @keyword cancel: threading.Event which, when set, kills the running commands and skips the rest.
+    @keyword callback: Function called as callback(index,name,chunk) with each piece of output as it is
+                       read, where index is the position of the command in cmds.
+    @return: List of (success,stdout,stderr) tuples (see getCommandOutput()), in the same order as cmds.
+    """
+    def run(index):
+        if cancel is not None and cancel.is_set():
+            return (False,b'',b'Command was cancelled')
+        cmdcallback = None
+        if callback is not None:
+            cmdcallback = lambda name,chunk: callback(index,name,chunk)
+        return runCommand(cmds[index],timeout=timeout,maxoutput=maxoutput,cancel=cancel,callback=cmdcallback)
+    if not len(cmds):
+        return []
+    pool = ThreadPool(max(1,min(nparallel,len(cmds))))
+    try:
+        results = pool.map(run,range(0,len(cmds)))
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+def testRunCommands():
+    #short commands must finish (and succeed) while long ones started alongside them are timed out
+    cmds = ['sleep 4' if i % 2 else 'echo hi' for i in range(0,64)]
+    results = runCommands(cmds,nparallel=16,timeout=1.5)
+    for i in range(0,len(cmds)):
+        success,stdout,stderr = results[i]
+        if i % 2:
+            assert(not success and stderr.endswith(b'timed out after 1.5 seconds'))
+        else:
+            assert(success and stdout == b'hi\n' and stderr == b'')
+    #whether the above catches a leak depends on timing, so also check directly that commands don't
+    #inherit the pipes of whatever else is running
+    if CLOSE_FDS and os.path.isdir('/proc/self/fd'):
+        readfd,writefd = os.pipe()
+        try:
+            for run in [getCommandOutput,runCommand]:
+                success,stdout,stderr = run('ls /proc/self/fd')
+                assert(success and str(writefd).encode('ascii') not in stdout.split())
+        finally:
+            os.close(readfd)
+            os.close(writefd)
+
 if __name__ == '__main__':
+    testRunCommands()
     retcode,stdout,stderr = getCommandOutput('ls blah')
     print('Return: %s' % retcode)
     print('stdout: %s' % stdout)
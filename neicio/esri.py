@@ -5,15 +5,17 @@ import re
 import sys
 import os.path
 from grid import Grid,GridError
+from geodict import GeoDict
 import numpy as np
 from binfile import BinFile
-from pylab import isnan
+import instrument
 
 class EsriGridError(Exception):
     "used to indicate an error in EsriGrid"
     def __str__(self):
         return repr(self.args[0])
 
+@instrument.instrumentClass
 class EsriGrid(Grid):
     """
     Create Grid object from any kind of ESRI grid file - simple header, or header + world file.
@@ -55,6 +57,7 @@ class EsriGrid(Grid):
         """
         return self.__loadHeader(self.gridfilename)
 
+    @instrument.instrumented('esri.load')
     def load(self,bounds=None):
         """
         Load data from grid file using specified bounds.
@@ -74,178 +77,31 @@ class EsriGrid(Grid):
         
         self.__populateGeoDict(hdrstruct)
 
-        LARGEST_DEG_RANGE = 15
-        if hdrstruct['precision'] == numpy.int8:
-            DATA_WIDTH = 1
-        if hdrstruct['precision'] == numpy.int16:
-            DATA_WIDTH = 2
-        if hdrstruct['precision'] == numpy.int32:
-            DATA_WIDTH = 4
-        if hdrstruct['precision'] == numpy.float32:
-            DATA_WIDTH = 4
-        if hdrstruct['precision'] == numpy.int64:
-            DATA_WIDTH = 8
-        
         gdict = self.geodict
-        
-        #load the data
         if bounds:
             (bxmin,bxmax,bymin,bymax) = bounds
-        else:
-            (bxmin,bxmax,bymin,bymax) = (gdict['xmin'],gdict['xmax'],gdict['ymin'],gdict['ymax'])
-
-        urx = gdict['xmax']
-        ury = gdict['ymax']
-        lrx = urx
-        lry = gdict['ymin']
-        ulx = gdict['xmin']
-        uly = ury
-        llx = ulx
-        lly = lry
-
-        ncols = gdict['ncols']
-        nrows = gdict['nrows']
-        xdim = gdict['xdim']
-        ydim = gdict['ydim']
-
-        if bymin < lly:
-            bymin = lly
-
-        if bymax > uly:
-            bymax = uly
-							
-        if bymin >= bymax:
-            raise GridError, "Latitude minimum (%f) is greater than latitude maximum (%f)" % (bymin,bymax)
-        
-        #check to see if the longitude bounds from shakemap went past -180
-        xminLeftOfMeridian = False
-        xmaxLeftOfMeridian = False
-        if bxmin < -180:
-            xminLeftOfMeridian = True
-            bxmin = bxmin+360
-            
-        if bxmax < -180:
-            xmaxLeftOfMeridian = True
-            bxmax = bxmax+360
-
-        
-        #open the binary file for reading
-        nrows = hdrstruct['nrows']
-        ncols = hdrstruct['ncols']
-        dtype = hdrstruct['precision']
-        skip = hdrstruct['skip']
-        popfile = BinFile(self.gridfilename,int(nrows),int(ncols),dtype,skip)
-        
-        #handle meridian crossing bounds
-        if bxmin > bxmax:
-            if bxmax - (bxmin-360) > self.LARGEST_DEG_RANGE:
+            if max(bymin,gdict['ymin']) >= min(bymax,gdict['ymax']):
+                raise GridError, "Latitude minimum (%f) is greater than latitude maximum (%f)" % (bymin,bymax)
+            #bounds crossing the meridian are limited to a few degrees
+            if bxmin > bxmax and (bxmax - bxmin) % 360 > self.LARGEST_DEG_RANGE:
                 raise GridError, "Longitude range exceeds %f." % (self.LARGEST_DEG_RANGE)
-            
-            #cut user's request into two regions - one from the minimum to the
-            #meridian, then another from the meridian to the maximum.
-            (region1,region2) = self.__createSections((bxmin,bxmax,bymin,bymax))
-            (iulx1,iuly1,ilrx1,ilry1) = region1
-            (iulx2,iuly2,ilrx2,ilry2) = region2
-            outcols1 = long(ilrx1-iulx1+1)
-            outcols2 = long(ilrx2-iulx2+1)
-            outcols = long(outcols1+outcols2)
-            outrows = long(ilry1-iuly1+1)
-            
-            section1 = popfile[iuly1:ilry1+1,iulx1:ilrx1+1]
-            section2 = popfile[iuly2:ilry2+1,iulx2:ilrx2+1]
-            self.griddata = numpy.concatenate((section1,section2),axis=1)
-            bxmin = (ulx + iulx1*xdim)
-            bymax = uly - iuly1*ydim
-            bxmax = ulx + ilrx2*xdim
-            bymin = bymax - outrows*ydim
-        else:
-            #figure out the pixel space locations of the user's desired
-            #ul and lr corners
-            if bxmin < llx:
-                bxmin = llx
-                 
-            if bxmax > llx+(ncols*xdim):
-                bxmax = llx+(ncols*xdim)
-                 
-            if bymax > lly+(nrows*ydim):
-                bymax = lly+(nrows*ydim)
-                 
-            if bymin < lly:
-                bymin = lly
-            
-            iulx = numpy.ceil((bxmin - ulx)/xdim)
-            iuly = numpy.ceil((uly - bymax)/ydim)
-            ilrx = numpy.floor((bxmax - ulx)/xdim)
-            ilry = numpy.floor((uly - bymin)/ydim)
-
-            if ilry >= nrows-1:
-                ilry = ilry - 1
-            if ilrx >= ncols-1:
-                ilrx = ilrx-1
-                
-            # print iulx,iuly,ilrx,ilry
-            #             print nrows,ncols
-
-            outcols = long(ilrx-iulx+1)
-            outrows = long(ilry-iuly+1)
-            
-            self.griddata = popfile[iuly:ilry+1,iulx:ilrx+1]
-            outrows,outcols = self.griddata.shape
-            #calculate the actual new corner pixel positions
-            bxmin = ulx + iulx*xdim
-            bymax = uly - iuly*ydim
-            bymin = bymax - (outrows-1)*ydim
-            bxmax = bxmin + (outcols-1)*xdim
-
-        #if the data read in has a different endian-ness, swap it...
-        if hdrstruct['byteorder'] != self.__getLocalEndian():
-            self.griddata = self.griddata.byteswap()
+        window = self._planWindow(gdict,bounds or None)
 
-        #now that we've byte-swapped, let's upcast this data to double
-        self.griddata = np.double(self.griddata)
+        #read each section of the window (two for windows wrapping around a global grid) straight into
+        #the output array, swapping bytes and converting to double as it goes
+        dtype = numpy.dtype(hdrstruct['precision'])
+        if hdrstruct['byteorder'] == 'b':
+            dtype = dtype.newbyteorder('>')
+        else:
+            dtype = dtype.newbyteorder('<')
+        popfile = BinFile(self.gridfilename,int(hdrstruct['nrows']),int(hdrstruct['ncols']),dtype,
+                          hdrstruct['skip'])
+        self.griddata = window.read(popfile,dtype=numpy.float64)
             
         if hdrstruct['nodata'] is not None:
-            inan,jnan = (self.griddata == hdrstruct['nodata']).nonzero()
-            self.griddata[inan,jnan] = numpy.NaN
+            self.griddata[self.griddata == hdrstruct['nodata']] = numpy.NaN
 
-        #repopulate the geodict with correct values
-        self.geodict['ncols'] = outcols
-        self.geodict['nrows'] = outrows
-        if xminLeftOfMeridian:
-            bxmin = bxmin - 360
-        if xmaxLeftOfMeridian:
-            bxmax = bxmax - 360
-        self.geodict['xmin'] = bxmin
-        self.geodict['xmax'] = bxmax
-        self.geodict['ymin'] = bymin
-        self.geodict['ymax'] = bymax
-        self.geodict['xdim'] = xdim
-        self.geodict['ydim'] = ydim
-        self.geodict['bandnames'] = ['Population Count']
-        
-
-    def __createSections(self,bounds):
-        (bxmin,bxmax,bymin,bymax) = bounds
-        ulx = self.geodict['xmin']
-        uly = self.geodict['ymax']
-        xdim = self.geodict['xdim']
-        ydim = self.geodict['ydim']
-        ncols = self.geodict['ncols']
-        nrows = self.geodict['nrows']
-        #section 1
-        iulx1 = int(numpy.floor((bxmin - ulx)/xdim))
-        iuly1 = int(numpy.ceil((uly - bymax)/ydim))
-        ilrx1 = int(ncols-1)
-        ilry1 = int(numpy.floor((uly - bymin)/ydim))
-        #section 2
-        iulx2 = 0
-        iuly2 = int(numpy.ceil((uly - bymax)/ydim))
-        ilrx2 = int(numpy.ceil((bxmax - ulx)/xdim))
-        ilry2 = int(numpy.floor((uly - bymin)/ydim))
-        
-        region1 = (iulx1,iuly1,ilrx1,ilry1)
-        region2 = (iulx2,iuly2,ilrx2,ilry2)
-        return(region1,region2)
+        self.geodict = window.geodict.replace(bandnames=['Population Count'])
 
     def __replaceNaN(self,array,nodata):
         i = numpy.where(array == nodata)
@@ -261,7 +117,10 @@ class EsriGrid(Grid):
         if (not os.path.isfile(hdrfilename)):
             raise EsriGridError, 'Could not find header file '+hdrfilename
         hdrfile = open(hdrfilename)
-        for line in hdrfile.readlines():
+        lines = hdrfile.readlines()
+        if instrument.ENABLED:
+            instrument.count(reads=1,bytes_read=hdrfile.tell())
+        for line in lines:
             (key,value) = line.split()
             key = key.lower()
             try:
@@ -387,17 +246,19 @@ class EsriGrid(Grid):
         return endian
 
     def __populateGeoDict(self,hdrstruct):
-        self.geodict['xmin'] = hdrstruct['ulxmap']
-        self.geodict['ymax'] = hdrstruct['ulymap']
-        self.geodict['xdim'] = hdrstruct['xdim']
-        self.geodict['ydim'] = hdrstruct['ydim']
-        self.geodict['xmax'] = hdrstruct['ulxmap'] + (hdrstruct['ncols']-1)*hdrstruct['xdim']
-        self.geodict['ymin'] = hdrstruct['ulymap'] - (hdrstruct['nrows']-1)*hdrstruct['ydim']
-        self.geodict['ncols'] = hdrstruct['ncols']
-        self.geodict['nrows'] = hdrstruct['nrows']
-        self.geodict['nbands'] = 1 #ESRI formats do not support multi-band data (I think!)
-        self.geodict['time'] = None
-        self.geodict['bandnames'] = ['Unknown']
+        geodict = {}
+        geodict['xmin'] = hdrstruct['ulxmap']
+        geodict['ymax'] = hdrstruct['ulymap']
+        geodict['xdim'] = hdrstruct['xdim']
+        geodict['ydim'] = hdrstruct['ydim']
+        geodict['xmax'] = hdrstruct['ulxmap'] + (hdrstruct['ncols']-1)*hdrstruct['xdim']
+        geodict['ymin'] = hdrstruct['ulymap'] - (hdrstruct['nrows']-1)*hdrstruct['ydim']
+        geodict['ncols'] = hdrstruct['ncols']
+        geodict['nrows'] = hdrstruct['nrows']
+        geodict['nbands'] = 1 #ESRI formats do not support multi-band data (I think!)
+        geodict['time'] = None
+        geodict['bandnames'] = ['Unknown']
+        self.geodict = GeoDict(geodict)
         return
 
         
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+#third party imports
+import numpy as np
+
+#local imports
+from mapalgebra import EsriSource,Resampled,STRIP_BYTES
+from zonal import zonalStats
+
+#exposure at MMI level k is the population where MMI rounds to k - MMI I to X.
+MMI_LEVELS = range(1,11)
+MMI_EDGES = np.concatenate((np.arange(0.5,10.0,1.0),[np.inf]))
+
+def getExposure(popfile,shakegrid,zonefile=None,bounds=None,method='linear',stripbytes=STRIP_BYTES):
+    """
+    Calculate the population exposed to each MMI level, reading the population grid a strip at a time
+    and sampling MMI for each strip as it goes.
+
+    This gives the same results as loading the population window with EsriGrid.load(), resampling the
+    ShakeMap to it with interpolateToGrid() and summing population by MMI, without ever holding the
+    population window, or MMI at population resolution, in memory.
+    example:
+    shakegrid = ShakeGrid('grid.xml',variable='MMI')
+    exposure = getExposure('landscan.bil',shakegrid,zonefile='isogrid.bil')
+    print exposure[392][6] #population exposed to MMI VII in Japan
+    @param popfile: ESRI population grid file name.
+    @param shakegrid: ShakeGrid (or other Grid) object with MMI values.
+    @keyword zonefile: Optional ESRI grid file of zone codes (country codes, etc.), with the same cells
+                       as popfile.
+    @keyword bounds: Tuple of (xmin,xmax,ymin,ymax) of the population window.  Defaults to the extent
+                     of the ShakeGrid.
+    @keyword method: MMI sampling method - 'linear' or 'nearest'.
+    @keyword stripbytes: Approximate size of each strip of each grid, in bytes.
+    @return: Array of populations exposed to MMI I to X (index 0 is MMI I), or, with a zonefile, a
+             dictionary of those arrays keyed by zone code.
+    """
+    if bounds is None:
+        gdict = shakegrid.geodict
+        bounds = (gdict['xmin'],gdict['xmax'],gdict['ymin'],gdict['ymax'])
+    pop = EsriSource(popfile,bounds=bounds)
+    mmi = Resampled(shakegrid,pop.getGeoDict(),method=method)
+    if zonefile is None:
+        stats = zonalStats(pop,mmi,bins=MMI_EDGES,stats=['sum'],stripbytes=stripbytes)
+        return _toExposure(stats,lambda key: key)
+    zones = EsriSource(zonefile,bounds=bounds)
+    stats = zonalStats(pop,[zones,mmi],bins=[None,MMI_EDGES],stats=['sum'],stripbytes=stripbytes)
+    exposure = {}
+    for zone in set([key[0] for key in stats.keys()]):
+        exposure[zone] = _toExposure(stats,lambda key: (zone,key))
+    return exposure
+
+def _toExposure(stats,getKey):
+    exposure = np.zeros(len(MMI_LEVELS))
+    for i in range(0,len(MMI_LEVELS)):
+        key = getKey(i)
+        if key in stats:
+            exposure[i] = stats[key]['sum']
+    return exposure
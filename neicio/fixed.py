@@ -3,6 +3,18 @@
 #stdlib imports
 import re
 import math
+import itertools
+import collections
+import multiprocessing
+
+#third party imports
+import numpy as np
+
+#character codes used by FixedFormatCodec's fast reader
+SPACE,ZERO,DOT,PLUS,MINUS,TAB,CARRIAGE_RETURN = [ord(c) for c in ' 0.+-\t\r']
+
+#lines FixedFormatCodec.writeRows() formats at once
+WRITE_BATCH = 10000
 
 class FixedFormatError(Exception):
     """used for noting errors with FixedFormatWriter and Reader"""
@@ -138,8 +150,476 @@ def getFixedFormatString(speclist,vlist):
     except:
         raise FixedFormatError,'Could not make a string from "%s" and "%s"' % (formatstr,','.join(vlist))
 
+
+class FixedFormatCodec(object):
+    """
+    Compiled reader/writer for fixed-width records.
+
+    readFixedFormatString() and getFixedFormatString() re-interpret the speclist for every line
+    they are given.  This class does that work once, so that large files can be read and written
+    in bulk.
+    example:
+    codec = FixedFormatCodec(speclist,names=['lat','lon','depth'])
+    data = codec.readLines(open('catalog.txt','rt'))
+    codec.writeRows(open('catalog2.txt','wt'),data)
+    """
+    def __init__(self,speclist,names=None):
+        """
+        Compile a fixed-width line specification.
+        @parameter speclist: List of tuples, where each tuple contains:
+                             - a sub-tuple containing the start/stop positions of the value in the line (1 offset). 
+                             - A FORTRAN format string ('a6','i3','f5.3', etc.)
+                             - (optional) boolean value indicating whether there should be leading zeros.
+                             - (optional) boolean value indicating whether value should be left justified.
+                             As in getFixedFormatString(), fields with the first of these optional items
+                             are zero-filled, and fields with both are left-justified, whatever their values.
+        @keyword names: Optional list of field names for the structured arrays returned by readLines().
+                        Defaults to 'f0','f1',...
+        @raise FixedFormatError: When a format string cannot be parsed, or does not match the width
+                                 of its range.
+        """
+        if names is None:
+            names = ['f%i' % i for i in range(0,len(speclist))]
+        if len(names) != len(speclist):
+            raise FixedFormatError('names length != speclist length')
+        self.names = list(names)
+        self.starts = []
+        self.stops = []
+        self.widths = []
+        self.kinds = []
+        self.formats = []
+        self.fieldformats = []
+        self.blanks = []
+        numberpattern = r'[-+]?[0-9]*\.?[0-9]+'
+        ftrans = {'a':'s','i':'i','f':'f'}
+        linefmt = ''
+        offset = 1
+        for spec in speclist:
+            smin,smax = spec[0]
+            fmt = spec[1]
+            nmatch = re.search(numberpattern,fmt)
+            kmatch = re.search('[aif]',fmt)
+            if nmatch is None or kmatch is None:
+                raise FixedFormatError('Could not parse format string "%s"' % fmt)
+            numstr = nmatch.group()
+            kind = kmatch.group()
+            width = int(numstr.split('.')[0])
+            if width != (smax-smin)+1:
+                fmtstring = 'Cannot reconcile format string "%s" with range (%i,%i)'
+                raise FixedFormatError(fmtstring % (fmt,smin,smax))
+            if smin < offset:
+                raise FixedFormatError('Range (%i,%i) overlaps previous field' % (smin,smax))
+            #as in getFixedFormatString(), it is having the optional items that counts, not their values
+            zerolead = len(spec) >= 3
+            leftjust = len(spec) >= 4
+            flags = ''
+            if leftjust:
+                flags += '-'
+            if zerolead:
+                flags += '0'
+            gap = ' '*(smin-offset)
+            fieldformat = gap + '%' + flags + numstr + ftrans[kind]
+            linefmt += fieldformat
+            offset = smax+1
+            self.starts.append(smin-1)
+            self.stops.append(smax)
+            self.widths.append(width)
+            self.kinds.append(kind)
+            self.formats.append(fmt)
+            self.fieldformats.append(fieldformat)
+            self.blanks.append(gap + ' '*width)
+        self.linefmt = linefmt
+        self.linelength = offset-1
+        self.numeric = [i for i in range(0,len(self.kinds)) if self.kinds[i] != 'a']
+        self.strings = [i for i in range(0,len(self.kinds)) if self.kinds[i] == 'a']
+        #blank integer fields are NaN (as in readFixedFormatString), so integers are stored as floats
+        dtypes = {'i':np.float64,'f':np.float64}
+        self.dtype = np.dtype([(self.names[i],dtypes.get(self.kinds[i],(str,self.widths[i])))
+                               for i in range(0,len(self.kinds))])
+
+    def readLine(self,line):
+        """
+        Read one fixed-width line.
+        @parameter line: A fixed-width formatted string.
+        @return: List of values, with the same semantics as readFixedFormatString().
+        @raise FixedFormatError: When input string doesn't match the compiled speclist.
+        """
+        if self.linelength > len(line):
+            raise FixedFormatError('Spec exceeds length of input string')
+        vlist = []
+        for smin,smax,kind,fmt in zip(self.starts,self.stops,self.kinds,self.formats):
+            valuestr = line[smin:smax]
+            if kind == 'a':
+                vlist.append(valuestr.strip())
+                continue
+            if valuestr.strip() == '':
+                vlist.append(float('nan'))
+                continue
+            try:
+                if kind == 'f':
+                    vlist.append(float(valuestr))
+                else:
+                    vlist.append(int(valuestr))
+            except ValueError:
+                raise FixedFormatError('String segment "%s" does not match format "%s"' % (valuestr,fmt))
+        return vlist
+
+    def writeLine(self,vlist):
+        """
+        Create one fixed-width line.
+        @parameter vlist: A list of values matching the compiled speclist.  NaN values are allowed
+                          for float and int fields, and are written out as spaces.
+        @return: Formatted string (no newline at the end).
+        @raise FixedFormatError: When values cannot be reconciled with the compiled speclist.
+        """
+        if len(vlist) != len(self.kinds):
+            raise FixedFormatError('speclist length != vlist length')
+        for i in self.strings:
+            if len(vlist[i]) > self.widths[i]:
+                raise FixedFormatError('Cannot reconcile string "%s" with width of %i' % (vlist[i],self.widths[i]))
+        hasnan = False
+        for i in self.numeric:
+            if vlist[i] != vlist[i]:
+                hasnan = True
+                break
+        try:
+            if not hasnan:
+                return self.linefmt % tuple(vlist)
+            #slow path - NaN fields are written as spaces instead of being formatted
+            fmt = ''
+            values = []
+            for i in range(0,len(vlist)):
+                if self.kinds[i] != 'a' and vlist[i] != vlist[i]:
+                    fmt += self.blanks[i]
+                else:
+                    fmt += self.fieldformats[i]
+                    values.append(vlist[i])
+            return fmt % tuple(values)
+        except (TypeError,ValueError):
+            raise FixedFormatError('Could not make a string from "%s" and "%s"' % (self.linefmt,str(vlist)))
+
+    def readLines(self,lines):
+        """
+        Read many fixed-width lines at once into a numpy structured array.
+        @parameter lines: Open file object, sequence of strings, or numpy array of strings.
+        @return: numpy structured array with one record per line, and fields named after the names
+                 passed to the constructor.  Blank float and int fields are NaN.
+        @raise FixedFormatError: When any line is shorter than the compiled speclist, or when any field
+                                 doesn't match its format.
+        """
+        chars = self.__getChars(lines)
+        nlines = chars.shape[0]
+        data = np.empty(nlines,dtype=self.dtype)
+        if not nlines:
+            return data
+        kind = chars.dtype.kind
+        #one row per character position, as numpy is much quicker along long rows than short ones
+        codes = np.ascontiguousarray(chars.view(np.uint8 if kind == 'S' else np.uint32).T)
+        for i in self.strings:
+            fieldtype = '%s%i' % (kind,self.widths[i])
+            stripped = _stripTrailing(codes[self.starts[i]:self.stops[i]])
+            if stripped is not None:
+                data[self.names[i]] = stripped.view(chars.dtype).view(fieldtype).ravel()
+                continue
+            columns = chars[:,self.starts[i]:self.stops[i]]
+            field = np.ascontiguousarray(columns).view(fieldtype).ravel()
+            data[self.names[i]] = np.char.strip(field)
+        for i in self.numeric:
+            values = _readDecimals(codes[self.starts[i]:self.stops[i]],self.kinds[i] == 'i')
+            if values is None:
+                #the field has something the fast reader can't vouch for, so read it the slow way
+                self.__readField(chars,data,i)
+            else:
+                data[self.names[i]] = values
+        return data
+
+    def __getChars(self,lines):
+        #view the lines as a 2D array of single characters, so every field is a column slice
+        if hasattr(lines,'read'):
+            text = lines.read()
+            chars = self.__viewText(text)
+            if chars is not None:
+                return chars
+            lines = text.splitlines()
+        elif isinstance(lines,np.ndarray):
+            lines = lines.tolist()
+        lines = [line.rstrip('\r\n') for line in lines]
+        nlines = len(lines)
+        if not nlines:
+            return np.empty((0,self.linelength),dtype='S1')
+        linearray = np.array(lines)
+        kind = linearray.dtype.kind
+        if kind not in 'SU':
+            raise FixedFormatError('Input lines must be strings')
+        linelength = linearray.dtype.itemsize // np.dtype(kind+'1').itemsize
+        if linelength < self.linelength:
+            raise FixedFormatError('Spec exceeds length of input string')
+        chars = linearray.view(kind+'1').reshape(nlines,linelength)
+        #numpy pads short strings with empty characters
+        if (chars[:,self.linelength-1] == '').any():
+            raise FixedFormatError('Spec exceeds length of input string')
+        return chars
+
+    def __viewText(self,text):
+        #when every line of a file is the same length, its text already is a 2D array of characters
+        if not isinstance(text,bytes):
+            return None
+        end = text.find(b'\n')
+        if end < 0:
+            return None
+        rowlength = end+1
+        if len(text) % rowlength:
+            return None
+        linelength = end
+        if end and text[end-1:end] == b'\r':
+            linelength -= 1
+        if linelength < self.linelength:
+            return None
+        chars = np.frombuffer(text,dtype='S1').reshape((-1,rowlength))
+        if (chars[:,end] != b'\n').any():
+            return None
+        return chars[:,0:linelength]
+
+    def __readField(self,chars,data,i):
+        name,fmt,width = self.names[i],self.formats[i],self.widths[i]
+        nlines = chars.shape[0]
+        columns = chars[:,self.starts[i]:self.stops[i]]
+        field = np.ascontiguousarray(columns).view('%s%i' % (chars.dtype.kind,width)).ravel()
+        #fields of nothing but whitespace are blank, as in readLine()
+        blank = np.char.str_len(np.char.strip(field)) == 0
+        if blank.any():
+            values = np.empty(nlines,dtype=np.float64)
+            values[blank] = np.nan
+            field = field[~blank]
+        #integer fields are read the way int() reads them (so ' 2.' is not an integer), then stored as floats
+        ftype = np.float64
+        if self.kinds[i] == 'i':
+            ftype = np.int64
+        try:
+            parsed = field.astype(ftype).astype(np.float64)
+        except (ValueError,OverflowError) as msg:
+            raise FixedFormatError('Field "%s" does not match format "%s": %s' % (name,fmt,str(msg)))
+        if blank.any():
+            values[~blank] = parsed
+            data[name] = values
+        else:
+            data[name] = parsed
+
+    def writeRows(self,fileobj,rows):
+        """
+        Write many rows of values as fixed-width lines.
+        @parameter fileobj: Open file object to write lines (with newlines) into.
+        @parameter rows: Sequence of value lists (see writeLine()), or a numpy structured array such as
+                         the ones returned by readLines().
+        @return: Number of lines written.
+        @raise FixedFormatError: When values cannot be reconciled with the compiled speclist.
+        """
+        if isinstance(rows,np.ndarray) and rows.dtype.names is not None:
+            lines = self.__formatArray(rows)
+            nlines = len(rows)
+        else:
+            if isinstance(rows,np.ndarray):
+                rows = rows.tolist()
+            lines = [self.__formatRow(row) for row in rows]
+            nlines = len(lines)
+        if nlines:
+            fileobj.write('\n'.join(lines)+'\n')
+        return nlines
+
+    def __formatRow(self,row):
+        #integer fields may have been stored as floats (see readLines())
+        row = list(row)
+        for i in self.numeric:
+            if self.kinds[i] == 'i' and row[i] == row[i]:
+                row[i] = int(row[i])
+        return self.writeLine(row)
+
+    def __formatArray(self,rows):
+        #format the lines of a structured array a batch at a time, with the line format repeated for every
+        #line of the batch.  Lines with NaNs (and batches with bad values, to find them) are done one at a time.
+        #Returns a list of lines and blocks of lines, to be joined by newlines.
+        if len(rows.dtype.names) != len(self.kinds):
+            raise FixedFormatError('speclist length != vlist length')
+        nrows = len(rows)
+        nan = np.zeros(nrows,dtype=bool)
+        columns = []
+        for i in range(0,len(self.kinds)):
+            column = rows[rows.dtype.names[i]]
+            if self.kinds[i] == 'a':
+                if column.dtype.kind not in 'SU':
+                    return [self.__formatRow(row) for row in rows.tolist()]
+                toolong = np.char.str_len(column) > self.widths[i]
+                if toolong.any():
+                    string = column[toolong.argmax()]
+                    raise FixedFormatError('Cannot reconcile string "%s" with width of %i' % (string,self.widths[i]))
+            else:
+                if column.dtype.kind not in 'iuf':
+                    return [self.__formatRow(row) for row in rows.tolist()]
+                isnan = column != column
+                nan |= isnan
+                if self.kinds[i] == 'i':
+                    column = np.where(isnan,0,column).astype(np.int64)
+            columns.append(column.tolist())
+        values = zip(*columns)
+        lines = []
+        for start in range(0,nrows,WRITE_BATCH):
+            batch = values[start:start+WRITE_BATCH]
+            if not nan[start:start+WRITE_BATCH].any():
+                try:
+                    text = (self.linefmt+'\n')*len(batch) % tuple(itertools.chain.from_iterable(batch))
+                    lines.append(text[0:-1])
+                    continue
+                except (TypeError,ValueError):
+                    pass
+            lines += [self.__formatRow(row) for row in rows[start:start+WRITE_BATCH].tolist()]
+        return lines
+
+
+def _stripTrailing(codes):
+    #blank out the trailing spaces of a field of left-justified text from its (width,nlines) character
+    #codes (numpy drops the trailing NULs of strings), or return None if any of it isn't left-justified,
+    #or has whitespace other than spaces
+    if ((codes >= TAB) & (codes <= CARRIAGE_RETURN)).any():
+        return None
+    codes = codes.copy()
+    space = codes == SPACE
+    trailing = np.ones(codes.shape[1],dtype=bool)
+    for j in range(codes.shape[0]-1,-1,-1):
+        trailing &= space[j]
+        codes[j] *= ~trailing
+    #trailing is now only true for blank lines
+    if (space[0] & ~trailing).any():
+        return None
+    return np.ascontiguousarray(codes.T)
+
+def _readDecimals(codes,integer):
+    #read a field of plain decimal numbers from its (width,nlines) character codes with array arithmetic,
+    #or return None if any of it is not plain.  Numbers of 15 digits or fewer are exactly represented by
+    #the integer of their digits, so dividing that by a power of ten (also exact) gives the same
+    #correctly rounded result as float().
+    space = codes == SPACE
+    digit = (codes - ZERO) < 10
+    dot = codes == DOT
+    minus = codes == MINUS
+    sign = minus | (codes == PLUS)
+    if not (space | digit | dot | sign).all() or (integer and dot.any()):
+        return None
+    filled = ~space
+    digits = (codes - ZERO)*digit
+    nlines = codes.shape[1]
+    bad = np.zeros(nlines,dtype=bool)
+    seen = np.zeros(nlines,dtype=bool)
+    gap = np.zeros(nlines,dtype=bool)
+    signs = np.zeros(nlines,dtype=bool)
+    dots = np.zeros(nlines,dtype=bool)
+    mantissa = np.zeros(nlines)
+    power = np.ones(nlines)
+    scale = np.ones(nlines)
+    #add up the digits from right to left, keeping the power of ten at the dot.  One number per field
+    #means nothing to the left of a gap or a sign, and no more than one dot.
+    for j in range(codes.shape[0]-1,-1,-1):
+        bad |= filled[j] & (gap | signs)
+        bad |= dot[j] & dots
+        gap |= space[j] & seen
+        seen |= filled[j]
+        signs |= sign[j]
+        dots |= dot[j]
+        mantissa += digits[j]*power
+        np.copyto(scale,power,where=dot[j])
+        np.multiply(power,10.0,out=power,where=digit[j])
+    #power is now ten to the number of digits, which must be 1 to 15
+    bad |= seen & ((power == 1) | (power > 1e15))
+    if bad.any():
+        return None
+    negative = minus.any(axis=0)
+    if integer:
+        #int('-0') is 0, not -0.0
+        values = np.where(negative,0.0-mantissa,mantissa)
+    else:
+        values = mantissa/scale
+        values[negative] = -values[negative]
+    values[~seen] = np.nan
+    return values
+
+def readFixedFormatBatches(speclist,fixedfile,batchsize=100000,names=None,nworkers=0):
+    """
+    Read a fixed-width file in batches of lines, without loading the whole file.
+    @parameter speclist: Line specification (see FixedFormatCodec).
+    @parameter fixedfile: Path to fixed-width file OR file-like object.
+    @keyword batchsize: Maximum number of lines in each batch.
+    @keyword names: Optional list of field names (see FixedFormatCodec).
+    @keyword nworkers: Number of worker processes to parse batches with.  Zero (the default)
+                       parses batches in the calling process.
+    @return: Generator of numpy structured arrays (see FixedFormatCodec.readLines()), in file order.
+    @raise FixedFormatError: When any line doesn't match speclist.
+
+    At most 2*nworkers batches are read ahead of the consumer, so memory use stays bounded
+    by the batch size rather than the file size.
+    """
+    codec = FixedFormatCodec(speclist,names=names)
+    if not hasattr(fixedfile,'read'):
+        fobj = open(fixedfile,'rt')
+    else:
+        fobj = fixedfile
+    pool = None
+    try:
+        batches = iter(lambda: list(itertools.islice(fobj,batchsize)),[])
+        if not nworkers:
+            for lines in batches:
+                yield codec.readLines(lines)
+            return
+        pool = multiprocessing.Pool(nworkers)
+        pending = collections.deque()
+        for lines in batches:
+            pending.append(pool.apply_async(_readBatch,(codec,lines)))
+            if len(pending) >= 2*nworkers:
+                yield pending.popleft().get()
+        while len(pending):
+            yield pending.popleft().get()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if fobj is not fixedfile:
+            fobj.close()
+
+def _readBatch(codec,lines):
+    return codec.readLines(lines)
+
+def testCodec():
+    import StringIO
+    speclist = [((1,6),'a6',False,False),
+                ((7,11),'f5.3'),
+                ((12,14),'i3',True),
+                ((16,23),'f8.2')]
+    rows = [['fred',1.5,5,-12.25],
+            ['x',float('nan'),-7,0.0],
+            ['',9.999,float('nan'),float('nan')],
+            ['abcdef',0.001,123,99999.99]]
+    codec = FixedFormatCodec(speclist)
+    #lines and values must be the same as those of the old functions
+    lines = [getFixedFormatString(speclist,list(row)) for row in rows]
+    assert([codec.writeLine(row) for row in rows] == lines)
+    for line in lines:
+        assert(str(codec.readLine(line)) == str(readFixedFormatString(speclist,line)))
+    data = codec.readLines(lines)
+    for i in range(0,len(lines)):
+        values = readFixedFormatString(speclist,lines[i])
+        assert(data[i]['f0'] == values[0])
+        for j in range(1,4):
+            assert(str(float(data[i]['f%i' % j])) == str(float(values[j])))
+    outfile = StringIO.StringIO()
+    assert(codec.writeRows(outfile,data) == len(rows))
+    assert(outfile.getvalue() == '\n'.join(lines)+'\n')
+    #int() doesn't read ' 2.', so neither does the codec
+    try:
+        codec.readLines(['fred  1.500 2.   -12.25'])
+        assert(False)
+    except FixedFormatError:
+        pass
+
     
 if __name__ == '__main__':
+    testCodec()
     speclist = [((2,2),'a1'),
                 ((3,3),'a1'),
                 ((17,19),'a3'),
@@ -2,7 +2,15 @@
 
 #stdlib imports
 from ftplib import FTP
+import ftplib
 import os.path
+import posixpath
+import threading
+import time
+try:
+    import Queue as queue
+except ImportError:
+    import queue
 
 #local
 from sender import Sender,SenderError
@@ -11,8 +19,22 @@ from sender import Sender,SenderError
 # - Add delete method
 # - Add CopySender,SecureCopySender subclasses 
 # - Write documentation, clean tests
+
+DEFAULT_BLOCKSIZE = 65536
     
 class FTPSender(Sender):
+    '''Send files and directories to an FTP server.
+
+    Properties:
+     - host      FTP host name (required).
+     - directory Remote directory to send files into (required).
+     - user      User name (defaults to anonymous login).
+     - password  Password.
+     - blocksize Number of bytes sent per block (defaults to 64 KB).
+     - connections Number of concurrent logged-in connections used to upload files (defaults to 1).
+
+    After send(), the timings attribute holds a list of (remote file,number of bytes,seconds) tuples.
+    '''
     def setup(self):
         if 'host' not in self.properties.keys():
             raise NameError('"host" keyword must be supplied to send via FTP')
@@ -46,11 +68,27 @@ class FTPSender(Sender):
             raise SenderError('Could not send to %s.  Error "%s"' % (host,str(obj)))
         return ftp
 
-    def delete(self):
+    def delete(self,files=None):
+        """
+        Delete files from the FTP server.
+        @keyword files: Optional list of relative paths (see getLocalFiles()) to delete.  By default, the
+                        files and directories that send() would have sent are deleted.
+        @return: Number of files deleted.
+        """
         ftp = self.setup()
         nfiles = 0
         host = self.properties['host']
         folder = self.properties['directory']
+        if files is not None:
+            root = ftp.pwd()
+            for relpath in files:
+                try:
+                    ftp.delete(posixpath.join(root,relpath))
+                    nfiles += 1
+                except ftplib.error_perm: #already gone
+                    pass
+            ftp.quit()
+            return nfiles
         if self.filesToSend is not None:
             for f in self.filesToSend:
                 fbase,fpath = os.path.split(f)
@@ -76,44 +114,162 @@ class FTPSender(Sender):
         return nfiles
     
     def send(self):
+        return self.sendFiles(None)
+
+    def sendFiles(self,relpaths):
+        """
+        Send all of the local files, or a subset of them.
+        @param relpaths: List of relative paths (see getLocalFiles()) to send, or None to send everything.
+        @return: Number of files sent.
+        @raise SenderError: When anything goes wrong.
+        """
         if 'host' not in self.properties.keys():
             raise NameError('"host" keyword must be supplied to send via FTP')
         if 'directory' not in self.properties.keys():
             raise NameError('"directory" keyword must be supplied to send via FTP')
+        host = self.properties['host']
+        nconnections = int(self.properties.get('connections',1))
+        self.timings = []
         try:
-            host = self.properties['host']
-            folder = self.properties['directory']
             ftp = self.setup()
-            #ftp.cwd(self.properties['directory'])
-            nfiles = 0
-            if self.filesToSend is not None:
-                for f in self.filesToSend:
-                    self.__sendfile(f,ftp)
-                    nfiles += 1
-            if self.directoryToSend is not None:
-                root,thisfolder = os.path.split(self.directoryToSend) #root is the top level local directory
-                for path, subdirs, files in os.walk(self.directoryToSend):
-                    mpath = path.replace(root,'').lstrip(os.sep) #mpath is the relative path on the ftp server
-                    allfiles = ftp.nlst()
-                    if mpath not in allfiles:
-                        ftp.mkd(mpath)
-                    ftpfolder = os.path.join(folder,mpath) #full path to the folder on ftp server
-                    ftp.cwd(ftpfolder)
-                    for f in files:
-                        #f is the file name within the current folder
-                        fpath = os.path.join(path,f) #the full path to the local file
-                        self.__sendfile(fpath,ftp)
-                        nfiles += 1
-                    ftp.cwd(folder) #go back to the root 
-            ftp.quit()
-            return nfiles
-                    
+            uploads = self.__getUploads(ftp,include=relpaths)
+            if nconnections <= 1:
+                self.__sendfiles(uploads,ftp)
+                ftp.quit()
+            else:
+                ftp.quit()
+                self.__sendConcurrent(uploads,nconnections)
+            return len(uploads)
         except Exception,obj:
             raise SenderError('Could not send to %s.  Error "%s"' % (host,str(obj)))
 
-    def __sendfile(self,filename,ftp):
+    def getDestination(self):
+        return 'ftp://%s/%s' % (self.properties['host'],self.properties['directory'].strip('/'))
+
+    def getRemoteSizes(self,relpaths):
+        """
+        Return the sizes of files on the FTP server.
+        @param relpaths: List of relative paths (see getLocalFiles()).
+        @return: Dictionary of relative paths and sizes in bytes, for the files the server reports sizes for.
+        """
+        ftp = self.setup()
+        folder = ftp.pwd()
+        sizes = {}
+        try:
+            ftp.voidcmd('TYPE I') #some servers only support SIZE in binary mode
+            for relpath in relpaths:
+                try:
+                    sizes[relpath] = ftp.size(posixpath.join(folder,relpath))
+                except ftplib.error_perm:
+                    pass
+        finally:
+            ftp.quit()
+        return sizes
+
+    def __getUploads(self,ftp,include=None):
+        """
+        Make any remote directories needed, and return the list of files to upload.
+        Each remote directory is listed at most once.
+        @param ftp: FTP connection in the remote root directory.
+        @keyword include: Optional list of relative paths (see getLocalFiles()) to limit the upload to.
+        @return: List of (remote directory,local file) tuples.
+        """
+        folder = ftp.pwd()
+        localfiles = self.getLocalFiles()
+        if include is not None:
+            include = set(include)
+            localfiles = [(relpath,localfile) for relpath,localfile in localfiles if relpath in include]
+        dirnames = set([posixpath.dirname(relpath) for relpath,localfile in localfiles])
+        if include is None and self.directoryToSend is not None:
+            #send empty directories too
+            root = os.path.dirname(os.path.abspath(self.directoryToSend))
+            for path, subdirs, files in os.walk(self.directoryToSend):
+                dirnames.add('/'.join(os.path.relpath(os.path.abspath(path),root).split(os.sep)))
+        for dirname in list(dirnames):
+            while dirname != '':
+                dirnames.add(dirname)
+                dirname = posixpath.dirname(dirname)
+        dirnames.discard('')
+        listings = {} #remote directory listings, cached for this send
+        for dirname in sorted(dirnames,key=lambda d: d.count('/')): #parents first
+            ftpfolder = posixpath.join(folder,dirname) #full path to the folder on ftp server
+            parent,basename = posixpath.split(ftpfolder)
+            if parent not in listings:
+                try:
+                    listings[parent] = set([posixpath.basename(name) for name in ftp.nlst(parent)])
+                except ftplib.error_perm: #some servers report empty directories as errors
+                    listings[parent] = set()
+            if basename not in listings[parent]:
+                ftp.mkd(ftpfolder)
+                listings[parent].add(basename)
+                listings[ftpfolder] = set()
+        uploads = []
+        for relpath,localfile in localfiles:
+            dirname = posixpath.dirname(relpath)
+            if dirname == '':
+                uploads.append((folder,localfile))
+            else:
+                uploads.append((posixpath.join(folder,dirname),localfile))
+        return uploads
+
+    def __sendfiles(self,uploads,ftp):
+        """Upload a list of (remote directory,local file) tuples over one connection."""
+        folder = None
+        for ftpfolder,filename in uploads:
+            if ftpfolder != folder:
+                ftp.cwd(ftpfolder)
+                folder = ftpfolder
+            self.__sendfile(filename,ftp,ftpfolder)
+
+    def __sendConcurrent(self,uploads,nconnections):
+        """Upload a list of (remote directory,local file) tuples over a pool of connections."""
+        tasks = queue.Queue()
+        for upload in uploads:
+            tasks.put(upload)
+        errors = []
+        def worker():
+            try:
+                ftp = self.setup()
+            except Exception,obj:
+                errors.append(str(obj))
+                return
+            try:
+                folder = None
+                while not len(errors):
+                    try:
+                        ftpfolder,filename = tasks.get_nowait()
+                    except queue.Empty:
+                        break
+                    if ftpfolder != folder:
+                        ftp.cwd(ftpfolder)
+                        folder = ftpfolder
+                    self.__sendfile(filename,ftp,ftpfolder)
+            except Exception,obj:
+                errors.append(str(obj))
+            finally:
+                try:
+                    ftp.quit()
+                except Exception:
+                    ftp.close()
+        threads = []
+        for i in range(0,min(nconnections,len(uploads))):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if len(errors):
+            raise SenderError(errors[0])
+
+    def __sendfile(self,filename,ftp,ftpfolder=''):
         fbase,fpath = os.path.split(filename)
         cmd = "STOR " + fpath #we don't tell the ftp server about the local path to the file
-        ftp.storbinary(cmd,open(filename,"rb"),1024) #actually send the file
+        blocksize = int(self.properties.get('blocksize',DEFAULT_BLOCKSIZE))
+        t1 = time.time()
+        f = open(filename,"rb")
+        try:
+            ftp.storbinary(cmd,f,blocksize) #actually send the file
+        finally:
+            f.close()
+        self.timings.append((posixpath.join(ftpfolder,fpath),os.path.getsize(filename),time.time()-t1))
                               
-
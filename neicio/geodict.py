@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+
+#third party imports
+import numpy as np
+
+#fields every GeoDict has, in the order keys() lists them
+FIELDS = ['nrows','ncols','nbands','bandnames','xmin','xmax','ymin','ymax','xdim','ydim','time']
+REQUIRED = ['nrows','ncols','xmin','xmax','ymin','ymax','xdim','ydim']
+
+class GeoDictError(Exception):
+    "used to indicate an error in GeoDict"
+    def __str__(self):
+        return repr(self.args[0])
+
+class GeoDict(object):
+    """
+    Immutable geo-referencing data for a pixel-registered Grid (see Grid.geodict).
+
+    A GeoDict can be used anywhere a geodict dictionary is expected - geodict['xmin'], keys(), items(),
+    'time' in geodict, etc. all work - but cannot be modified; use copy() to get a (modifiable) dictionary,
+    or replace() to get a new GeoDict with some fields changed.  The fields are also available as
+    attributes (geodict.xmin), and the transforms between row/column and lat/lon are precomputed.
+    example:
+    geodict = GeoDict({'xmin':-120.0,'xmax':-110.0,'ymin':30.0,'ymax':40.0,'xdim':0.5,'ydim':0.5,
+                       'nrows':21,'ncols':21})
+    rows,cols = geodict.rowcol(lats,lons)
+    """
+    __slots__ = FIELDS + ['extras','crossesMeridian','_colscale','_coloffset','_rowscale','_rowoffset']
+
+    def __init__(self,geodict=None,**kwargs):
+        """
+        @keyword geodict: Dictionary (or GeoDict) with at least the keys nrows, ncols, xmin, xmax, ymin,
+                          ymax, xdim and ydim (see Grid.geodict).  nbands defaults to the number of
+                          bandnames (or 1), bandnames to 'Unknown' for each band, and time to None.
+                          Any other keys are kept as they are.
+        @param kwargs: Keys to add to (or replace in) geodict.
+        @raise GeoDictError: When a required key is missing, or a value is not valid.
+        """
+        values = {}
+        if geodict is not None:
+            values.update(geodict.items())
+        values.update(kwargs)
+        missing = [key for key in REQUIRED if key not in values]
+        if missing:
+            raise GeoDictError('Missing geodict keys: %s' % ','.join(missing))
+        setter = object.__setattr__
+        try:
+            for key in ['nrows','ncols']:
+                value = values[key]
+                if int(value) != value or value < 0:
+                    raise GeoDictError('%s must be a positive integer, not %s' % (key,str(value)))
+                setter(self,key,int(value))
+            for key in ['xmin','xmax','ymin','ymax','xdim','ydim']:
+                setter(self,key,float(values[key]))
+        except (TypeError,ValueError):
+            raise GeoDictError('Geodict values must be numbers: %s' % str(dict(values)))
+        if self.xdim <= 0 or self.ydim <= 0:
+            raise GeoDictError('xdim and ydim must be greater than zero')
+        bandnames = values.get('bandnames')
+        nbands = values.get('nbands')
+        if nbands is None:
+            nbands = 1
+            if bandnames is not None:
+                nbands = max(1,len(bandnames))
+        if bandnames is None:
+            bandnames = ['Unknown']*int(nbands)
+        setter(self,'nbands',int(nbands))
+        setter(self,'bandnames',tuple(bandnames))
+        setter(self,'time',values.get('time'))
+        setter(self,'extras',dict([(key,value) for key,value in values.items() if key not in FIELDS]))
+        #grids that cross the meridian have their right edge west of their left edge
+        setter(self,'crossesMeridian',self.xmax < self.xmin)
+        #col = lon*colscale + coloffset, row = lat*rowscale + rowoffset
+        setter(self,'_colscale',1.0/self.xdim)
+        setter(self,'_coloffset',-self.xmin/self.xdim)
+        setter(self,'_rowscale',-1.0/self.ydim)
+        setter(self,'_rowoffset',self.ymax/self.ydim)
+
+    def __setattr__(self,name,value):
+        raise GeoDictError('GeoDict objects cannot be modified - use replace() or copy()')
+
+    def __delattr__(self,name):
+        raise GeoDictError('GeoDict objects cannot be modified - use replace() or copy()')
+
+    def __setitem__(self,key,value):
+        raise GeoDictError('GeoDict objects cannot be modified - use replace() or copy()')
+
+    def __delitem__(self,key):
+        raise GeoDictError('GeoDict objects cannot be modified - use replace() or copy()')
+
+    def __getitem__(self,key):
+        if key == 'bandnames':
+            return list(self.bandnames)
+        if key in FIELDS:
+            return getattr(self,key)
+        return self.extras[key]
+
+    def get(self,key,default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def __contains__(self,key):
+        return key in FIELDS or key in self.extras
+
+    has_key = __contains__
+
+    def keys(self):
+        return FIELDS + self.extras.keys()
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key,self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    iterkeys = __iter__
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def __len__(self):
+        return len(FIELDS) + len(self.extras)
+
+    def __eq__(self,other):
+        if isinstance(other,GeoDict):
+            other = other.copy()
+        return self.copy() == other
+
+    def __ne__(self,other):
+        return not self == other
+
+    def __repr__(self):
+        return 'GeoDict(%r)' % self.copy()
+
+    def __reduce__(self):
+        return (GeoDict,(self.copy(),))
+
+    def copy(self):
+        """
+        Return the contents as a new (modifiable) dictionary.
+        """
+        return dict(self.items())
+
+    def replace(self,**kwargs):
+        """
+        Return a new GeoDict with some fields changed.
+        @param kwargs: Keys and their new values.
+        @return: GeoDict.
+        """
+        return GeoDict(self,**kwargs)
+
+    def getShape(self):
+        """
+        Return the (nrows,ncols) shape of the grid.
+        """
+        return (self.nrows,self.ncols)
+
+    def rowcol(self,lat,lon,method='round'):
+        """
+        Return the row and column of the cells containing lat/lon coordinates.
+        @param lat: Latitude (or array of latitudes) in decimal degrees.
+        @param lon: Longitude (or array of longitudes) in decimal degrees.  When the grid crosses the
+                    meridian, longitudes west of xmin are taken to be east of the meridian.
+        @keyword method: 'round' for the nearest cell center (as used by Grid.getValue()), 'floor'
+                         for the cell center up and to the left (as used by Grid.getRowCol()), or
+                         None for fractional rows and columns.
+        @return: Tuple of (row,col), integers (or integer arrays) for 'round', floats otherwise.
+        """
+        #scalars and arrays are used as they are, which is much quicker for scalars than converting them
+        try:
+            col = lon*self._colscale + self._coloffset
+            row = lat*self._rowscale + self._rowoffset
+        except TypeError:
+            return self.rowcol(np.array(lat,dtype=np.float64),np.array(lon,dtype=np.float64),method=method)
+        if self.crossesMeridian:
+            #longitudes west of xmin are east of the meridian
+            if type(col) is np.ndarray:
+                col = np.where(col < 0,col + 360*self._colscale,col)
+            elif col < 0:
+                col += 360*self._colscale
+        if method == 'round':
+            #rint rounds halves to even, like numpy.round
+            return (np.rint(row).astype(int),np.rint(col).astype(int))
+        if method == 'floor':
+            return (np.floor(row),np.floor(col))
+        return (row,col)
+
+    def latlon(self,row,col):
+        """
+        Return the lat/lon coordinates of cell centers.
+        @param row: Row (or array of rows).
+        @param col: Column (or array of columns).
+        @return: Tuple of (lat,lon).  Longitudes are not wrapped for grids that cross the meridian.
+        """
+        try:
+            return (self.ymax - row*self.ydim,self.xmin + col*self.xdim)
+        except TypeError:
+            return self.latlon(np.array(row),np.array(col))
+
+    def contains(self,row,col):
+        """
+        Return whether rows and columns are inside the grid.
+        @param row: Row (or array of rows).
+        @param col: Column (or array of columns).
+        @return: Boolean (or boolean array).
+        """
+        return (row >= 0) & (row < self.nrows) & (col >= 0) & (col < self.ncols)
+
+def asGeoDict(geodict):
+    """
+    Return a geodict as a GeoDict, without copying one that already is.
+    @param geodict: Dictionary or GeoDict (see Grid.geodict).
+    @return: GeoDict.
+    @raise GeoDictError: When a required key is missing, or a value is not valid.
+    """
+    if isinstance(geodict,GeoDict):
+        return geodict
+    return GeoDict(geodict)
@@ -3,15 +3,16 @@
 #stdlib imports
 import struct
 import sys
+import os.path
 
 #third party imports
 import numpy
-from scipy.io import netcdf
-import matplotlib.pyplot as plt
 
 #local imports
 from grid import Grid
+import instrument
 
+@instrument.instrumentClass
 class GMTGrid(Grid):
     def __init__(self,grdfile=None,fmt='f',bandname=None,bounds=None):
         """
@@ -23,7 +24,8 @@ class GMTGrid(Grid):
                       - 'f' (32 bit float)
                       - 'd' (64 bit float)
         @keyword bandname: Short name of data set ("elevation","mmi", etc.)
-        @keyword bounds: Tuple containing (xmin,xmax,ymin,ymax).  Native files not supported yet.
+        @keyword bounds: Tuple containing (xmin,xmax,ymin,ymax) of the cells to read (see
+                         gridwindow.planWindow()).  Defaults to the whole grid.
         """
         self.geodict = {}
         self.griddata = None
@@ -37,7 +39,10 @@ class GMTGrid(Grid):
         if ftype == 'netcdf':
             self.load(bounds=bounds)
             return
-        
+        self.__loadNative(grdfile,fmt,bandname,bounds)
+
+    @instrument.instrumented('gmt.load')
+    def __loadNative(self,grdfile,fmt,bandname,bounds):
         #we're dealing with a binary "native" GMT grid file
         f = open(grdfile,'rb')
         f.seek(0,0)
@@ -72,15 +77,24 @@ class GMTGrid(Grid):
             self.geodict['bandnames'] = [bandname]
         else:
             self.geodict['bandnames'] = ['']
+        self.geodict['nbands'] = 1
+        nrows,ncols = (self.geodict['nrows'],self.geodict['ncols'])
+        window = self._planWindow(self.geodict,bounds)
+        self.geodict = window.geodict
         
-        sfmt = '%i%s' % (self.geodict['ncols']*self.geodict['nrows'],fmt)
-        dwidths = {'i':2,'l':4,'f':4,'d':8}
-        dwidth = dwidths[fmt]
-        dbytes = f.read(self.geodict['ncols']*self.geodict['nrows']*dwidth)
-        data = struct.unpack(sfmt,dbytes)
-        self.griddata = numpy.array(data).reshape(self.geodict['nrows'],-1)
-        self.griddata = (self.griddata * zscale) + zoffset
-        f.close()     
+        #the data follow the header, one row after another
+        offset = f.tell()
+        f.close()
+        dtypes = {'i':numpy.int16,'l':numpy.int32,'f':numpy.float32,'d':numpy.float64}
+        data = numpy.memmap(grdfile,dtype=dtypes[fmt],mode='r',offset=offset,shape=(nrows,ncols))
+        self.griddata = window.read(data,dtype=numpy.float64)
+        del data
+        self.griddata *= zscale
+        self.griddata += zoffset
+        if instrument.ENABLED:
+            #19 header fields, then the rows of the window
+            nbytes = window.shape[0]*ncols*numpy.dtype(dtypes[fmt]).itemsize
+            instrument.count(seeks=1,reads=20,bytes_read=offset+nbytes)
         self.Attributes = {}
 
     def getAttributes(self):
@@ -103,8 +117,12 @@ class GMTGrid(Grid):
             ftype = 'netcdf'
         return ftype
         
+    @instrument.instrumented('gmt.load')
     def load(self,bounds=None):
         if self.ftype == 'netcdf':
+            #scipy.io is slow to import, and only needed for netcdf files
+            from scipy.io import netcdf
+            self.geodict = {}
             cdf = netcdf.netcdf_file(self.gridfile)
             xvarname = None
             if 'x' in cdf.variables.keys():
@@ -129,54 +147,15 @@ class GMTGrid(Grid):
                 #assign x/y resolution
                 self.geodict['xdim'] = numpy.mean(dx)
                 self.geodict['ydim'] = numpy.mean(dy)
-
-                if bounds is not None:
-                    xmin,xmax,ymin,ymax = bounds
-                    cdfarray = BinCDFArray(cdf,len(yvar.data),len(xvar.data))
-                    if xmin > xmax:
-                        #cut user's request into two regions - one from the minimum to the
-                        #meridian, then another from the meridian to the maximum.
-                        (region1,region2) = self.__createSections((xmin,xmax,ymin,ymax))
-
-                        (iulx1,iuly1,ilrx1,ilry1) = region1
-                        (iulx2,iuly2,ilrx2,ilry2) = region2
-                        outcols1 = long(ilrx1-iulx1+1)
-                        outcols2 = long(ilrx2-iulx2+1)
-                        outcols = long(outcols1+outcols2)
-                        outrows = long(ilry1-iuly1+1)
-
-                        section1 = cdfarray[iuly1:ilry1+1,iulx1:ilrx1+1]
-                        section2 = cdfarray[iuly2:ilry2+1,iulx2:ilrx2+1]
-                        self.griddata = numpy.concatenate((section1,section2),axis=1)
-                        xmin = (ulx + iulx1*xdim)
-                        ymax = uly - iuly1*ydim
-                        xmax = ulx + ilrx2*xdim
-                        ymin = bymax - outrows*ydim
-                        
-                    else:
-                        ixmin = numpy.abs(xvar-xmin).argmin()
-                        ixmax = numpy.abs(xvar-xmax).argmin()
-                        iymin = numpy.abs(yvar-ymin).argmin()
-                        iymax = numpy.abs(yvar-ymax).argmin()
-                    self.geodict['xmin'] = xvar[ixmin].copy()
-                    self.geodict['xmax'] = xvar[ixmax].copy()
-                    self.geodict['ymin'] = yvar[iymin].copy()
-                    self.geodict['ymax'] = yvar[iymax].copy()
-                    zvar = cdf.variables['z'][iymin:iymax,ixmin:ixmax]
-                    zvar = zvar.copy()
-                    self.griddata = numpy.flipud(zvar)
-                    m,n = self.griddata.shape
-                    self.geodict['nrows'] = m
-                    self.geodict['ncols'] = n
-                else:
-                    self.geodict['nrows'] = cdf.dimensions[yvarname]
-                    self.geodict['ncols'] = cdf.dimensions[xvarname]
-                    self.geodict['xmin'] = xvar.min().copy()
-                    self.geodict['xmax'] = xvar.max().copy()
-                    self.geodict['ymin'] = yvar.min().copy()
-                    self.geodict['ymax'] = yvar.max().copy()
-                    zdata = cdf.variables['z'].data.copy()
-                    self.griddata = numpy.flipud(zdata)
+                self.geodict['nrows'] = cdf.dimensions[yvarname]
+                self.geodict['ncols'] = cdf.dimensions[xvarname]
+                self.geodict['xmin'] = xvar.min().copy()
+                self.geodict['xmax'] = xvar.max().copy()
+                self.geodict['ymin'] = yvar.min().copy()
+                self.geodict['ymax'] = yvar.max().copy()
+                window = self._planWindow(self.geodict,bounds)
+                #rows are stored from the bottom up
+                self.griddata = window.read(cdf.variables['z'].data,flipud=True)
             else: #the other kind of COARDS netcdf
                 dxmin = cdf.variables['x_range'].data[0]
                 dxmax = cdf.variables['x_range'].data[1]
@@ -186,62 +165,24 @@ class GMTGrid(Grid):
                 xdim,ydim = cdf.variables['spacing'].data
                 self.geodict['xdim'] = xdim
                 self.geodict['ydim'] = ydim
-                if bounds is None:
-                    self.geodict['xmin'] = dxmin
-                    self.geodict['xmax'] = dxmax
-                    self.geodict['ymin'] = dymin
-                    self.geodict['ymax'] = dymax
-                    self.geodict['nrows'] = nrows
-                    self.geodict['ncols'] = ncols
-                    self.griddata = numpy.reshape(cdf.variables['z'].data.copy(),(nrows,ncols))
-                else:
-                    xmin,xmax,ymin,ymax = bounds
-                    xvar = numpy.arange(xmin,xmax+xdim,xdim)
-                    yvar = numpy.arange(ymin,ymax+ydim,ydim)
-                    ixmin = numpy.abs(xvar-xmin).argmin()
-                    ixmax = numpy.abs(xvar-xmax).argmin()
-                    iymin = numpy.abs(yvar-ymin).argmin()
-                    iymax = numpy.abs(yvar-ymax).argmin()
-                    self.geodict['xmin'] = xvar[ixmin]
-                    self.geodict['xmax'] = xvar[ixmax]
-                    self.geodict['ymin'] = yvar[iymin]
-                    self.geodict['ymax'] = yvar[iymax]
-                    #we're reading in the whole array here just to subset it - not very efficient use of memory
-                    self.griddata = numpy.reshape(cdf.variables['z'].data.copy(),nrows,ncols)
-                    self.griddata = self.griddata[iymin:iymax,ixmin:ixmax]
-                    m,n = self.griddata.shape
-                    self.geodict['nrows'] = m
-                    self.geodict['ncols'] = n
+                self.geodict['xmin'] = dxmin
+                self.geodict['xmax'] = dxmax
+                self.geodict['ymin'] = dymin
+                self.geodict['ymax'] = dymax
+                self.geodict['nrows'] = nrows
+                self.geodict['ncols'] = ncols
+                window = self._planWindow(self.geodict,bounds)
+                self.griddata = window.read(numpy.reshape(cdf.variables['z'].data,(nrows,ncols)))
 
-            self.geodict['bandnames'] = ['Unknown']
+            self.geodict = window.geodict.replace(bandnames=['Unknown'],nbands=1)
+            if instrument.ENABLED:
+                #the netcdf file is memory mapped, so count the data copied out of it
+                instrument.count(reads=1,bytes_read=self.griddata.nbytes)
             cdf.close()
         else:
             raise NotImplementedError,'Only COARDS-compliant netcdf files are supported at this time!'            
         return
 
-    def __createSections(self,bounds):
-        (bxmin,bxmax,bymin,bymax) = bounds
-        ulx = self.geodict['xmin']
-        uly = self.geodict['ymax']
-        xdim = self.geodict['xdim']
-        ydim = self.geodict['ydim']
-        ncols = self.geodict['ncols']
-        nrows = self.geodict['nrows']
-        #section 1
-        iulx1 = int(numpy.floor((bxmin - ulx)/xdim))
-        iuly1 = int(numpy.ceil((uly - bymax)/ydim))
-        ilrx1 = int(ncols-1)
-        ilry1 = int(numpy.floor((uly - bymin)/ydim))
-        #section 2
-        iulx2 = 0
-        iuly2 = int(numpy.ceil((uly - bymax)/ydim))
-        ilrx2 = int(numpy.ceil((bxmax - ulx)/xdim))
-        ilry2 = int(numpy.floor((uly - bymin)/ydim))
-        
-        region1 = (iulx1,iuly1,ilrx1,ilry1)
-        region2 = (iulx2,iuly2,ilrx2,ilry2)
-        return(region1,region2)
-
     def setDimArray(self,nelements,dmin,dmax,ddim):
         data = numpy.arange(dmin,dmax+ddim,ddim)
         tmax = dmax+ddim
@@ -263,6 +204,7 @@ class GMTGrid(Grid):
             data = numpy.append(data,data[-1]+ddim)
         return (data,ddim)
             
+    @instrument.instrumented('gmt.save')
     def save(self,filename,fmt='netcdf'):
         nrows,ncols = self.griddata.shape
         xmin = self.geodict['xmin'] - self.geodict['xdim']/2.0
@@ -271,6 +213,7 @@ class GMTGrid(Grid):
         ymin = self.geodict['ymin'] - self.geodict['ydim']/2.0
         
         if fmt != 'binary':
+            from scipy.io import netcdf
             cdf = netcdf.netcdf_file(filename,'w')
             cdf.node_offset = 1
             cdf.Conventions = 'COARDS, CF-1.5'
@@ -297,6 +240,8 @@ class GMTGrid(Grid):
             z[:] = numpy.flipud(self.griddata)
             cdf.flush()
             cdf.close()
+            if instrument.ENABLED:
+                instrument.count(writes=1,bytes_written=os.path.getsize(filename))
             return
         if not len(self.geodict):
             raise Exception,'This grid contains no data!'
@@ -348,81 +293,19 @@ class GMTGrid(Grid):
         nrows,ncols = self.griddata.shape
         sfmt = '%i%s' % (nrows*ncols,self.griddata.dtype.kind)
         f.write(struct.pack(sfmt,*self.griddata.transpose().flatten()))
+        if instrument.ENABLED:
+            #13 header numbers, 6 padded strings (two writes each) and the data
+            instrument.count(writes=26,bytes_written=f.tell())
         f.close()
         return
 
-class BinCDFArray(object):
-    def __init__(self,array,nrows,ncols):
-        self.array = array
-        self.nrows = nrows
-        self.ncols = ncols
-
-    def __getitem__(self,*args):
-        """Allows slicing of CDF data array in the same way as a numpy array."""
-        if len(args) == 1 and isinstance(args[0][0],int):
-            #user has passed in a tuple of row,col - they only want one value
-            row = args[0][0]
-            col = args[0][1]
-            nrows = self.nrows
-            ncols = self.ncols
-            if row < 0 or row > nrows-1:
-                raise Exception,"Row index out of bounds"
-            if col < 0 or col > ncols-1:
-                raise Exception,"Row index out of bounds"
-            idx = ncols * row + col
-            offset = 0
-            return self.array[idx]
-
-        if len(args) == 1 and isinstance(args[0][0],slice): #they want a non-scalar subset of the data
-            nrows = self.nrows
-            ncols = self.ncols
-            #calculate offset to first data element
-            key1 = args[0][0]
-            key2 = args[0][1]
-            rowstart = key1.start
-            rowend = key1.stop
-            rowstep = key1.step
-            colstart = key2.start
-            colend = key2.stop
-            colstep = key2.step
-            
-            if rowstep is None:
-                rowstep = 1
-            if colstep is None:
-                colstep = 1
-
-            #error checking
-            if rowstart < 0 or rowstart > nrows-1:
-                raise Exception,"Row index out of bounds"
-            if rowend < 0 or rowend > nrows:
-                raise Exception,"Row index out of bounds"
-            if colstart < 0 or colstart > ncols-1:
-                raise Exception,"Col index out of bounds"
-            if colend < 0 or colend > ncols:
-                raise Exception,"Col index out of bounds"
-
-            colcount = (colend-colstart)
-            rowcount = (rowend-rowstart)
-            outrows = numpy.ceil(rowcount/rowstep)
-            outcols = numpy.ceil(colcount/colstep)
-            data = numpy.zeros([outrows,outcols],dtype=self.dtype)
-            outrow = 0
-            for row in range(int(rowstart),int(rowend),int(rowstep)):
-                #just go to the beginning of the row, we're going to read in the whole line
-                idx = ncols*row 
-                offset = self.dwidth*idx #beginning of row
-                line = self.array[idx:idx+ncols]
-                data[outrow,:] = line[colstart:colend:colstep]
-                outrow = outrow+1
-        else:
-            raise Exception, "Unsupported __getitem__ input %s" % (str(key))
-        return(data)
 
 def test():
     pass
     
     
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
     filename = sys.argv[1]
     subset = False
     bounds = None
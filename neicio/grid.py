@@ -2,16 +2,28 @@
 
 #stdlib
 import sys
+import mmap
+import types
 
 #third party
 import numpy as np
-from scipy import interpolate
+
+#local
+import instrument
+from geodict import GeoDict,asGeoDict
+from binfile import BinFile
+from gridwindow import planWindow,GridWindowError
+
+GRID_STATE_VERSION = 1
+#grid data is pickled in pieces of about this many bytes
+PICKLE_CHUNK_BYTES = 16*1024*1024
 
 class GridError(Exception):
     "used to indicate an error in Grid"
     def __str__(self):
         return repr(self.args[0])
 
+@instrument.instrumentClass
 class Grid:
     """
     Abstract Grid object.  This should be extended by other subclasses that handle loading and/or saving of 
@@ -23,7 +35,7 @@ class Grid:
     """
     geodict = {}
     """
-    @ivar: Geo-referencing data takes the form of a dictionary, with the following keys:
+    @ivar: Geo-referencing data takes the form of a dictionary (usually an immutable GeoDict), with the following keys:
           - nrows - Number of rows of internal numpy array.
           - ncols - Number of columns of internal numpy array.
           - nbands - Number of 'bands' (z dimension) of internal numpy array.
@@ -52,14 +64,137 @@ class Grid:
         """Does nothing (can be implemented by subclasses.)"""
         pass
 
+    def __getstate__(self):
+        """
+        Return the state of the Grid for pickling (and so for sending to other processes).
+
+        The state is a compact header of the Grid's attributes, plus its data as raw bytes in pieces
+        of about PICKLE_CHUNK_BYTES, which are quicker to pickle and unpickle than a numpy array.
+        Private caches, open files and memory maps (which cannot be pickled) are left out, and memory
+        mapped data is pickled as ordinary data.  To share a large grid between processes without
+        pickling it at all, see sharedgrid.publishGrid().
+        """
+        attributes = {}
+        for key,value in self.__dict__.items():
+            if key == 'griddata' or key.startswith('_') or isinstance(value,(file,mmap.mmap,BinFile)):
+                continue
+            attributes[key] = value
+        return (GRID_STATE_VERSION,attributes,_packArray(self.__dict__.get('griddata')))
+
+    def __setstate__(self,state):
+        """
+        Restore the state returned by __getstate__().
+        @param state: State tuple (or, for Grids pickled before __getstate__() was added, attribute
+                      dictionary).
+        @raise GridError: When the state was saved by an incompatible version.
+        """
+        if isinstance(state,dict):
+            self.__dict__.update(state)
+            return
+        if state[0] != GRID_STATE_VERSION:
+            raise GridError, 'Grid was pickled by an incompatible version (%s)' % str(state[0])
+        version,attributes,packed = state
+        self.__dict__.update(attributes)
+        self.griddata = _unpackArray(packed)
+
+    def __copy__(self):
+        #a shallow copy shares griddata, as it did before __getstate__() was added
+        return types.InstanceType(self.__class__,self.__dict__.copy())
+
+    @instrument.instrumented('grid.loadFromGrid')
     def loadFromGrid(self,grid):
         """
         Instantiate a grid from another grid.
         @param grid: Any subclass of the Grid object.
         """
-        self.geodict = grid.geodict.copy()
+        #GeoDicts cannot be modified, so can be shared
+        if isinstance(grid.geodict,GeoDict):
+            self.geodict = grid.geodict
+        else:
+            self.geodict = grid.geodict.copy()
         self.griddata = grid.griddata.copy()
 
+    def window(self,bounds,copy=False):
+        """
+        Return the part of this grid inside some geographic bounds, without copying any data.
+
+        The window holds every cell whose center is inside the bounds (edges included - see
+        gridwindow.planWindow()).  Bounds may use either longitude convention (-180 to 180 or 0 to 360),
+        and may cross the meridian.
+        example:
+        japan = globalgrid.window((128.0,146.0,30.0,46.0))
+        @param bounds: Tuple of (xmin,xmax,ymin,ymax) in decimal degrees.  Bounds extending past the grid
+                       are clipped to it.
+        @keyword copy: Return a copy of the data instead of a view (see subgrid()).  Windows that wrap
+                       around the edge of a global grid cannot be views, so are always (read-only, unless
+                       copy is True) copies.
+        @return: Grid of the same class, with a view of this grid's data and an adjusted geodict.
+        @raise GridError: When no cells are inside the bounds.
+        """
+        window = self._planWindow(self._getGeoDict(),bounds)
+        if window.isContiguous():
+            rows,cols = window.getSlices()
+            return self._newGrid(self.griddata[rows,cols],window.geodict,copy)
+        #a window that wraps around is a new array anyway, so is only marked read-only if need be
+        grid = self._newGrid(window.read(self.griddata),window.geodict,False)
+        grid.griddata.flags.writeable = copy
+        return grid
+
+    def subgrid(self,rows,cols,copy=False):
+        """
+        Return a rectangular part of this grid, without copying any data.
+
+        The data of the new grid is a read-only view of this grid's data, so making one costs nothing,
+        changes to this grid's data show through, and the view itself cannot be changed by accident.
+        Callers that need to modify the data should pass copy=True.
+        example:
+        corner = grid.subgrid(slice(0,100),slice(0,100))
+        coarse = grid.subgrid(slice(None,None,10),slice(None,None,10)) #every 10th row and column
+        @param rows: slice of rows.  A step of n takes every nth row (with n times the cell height).
+        @param cols: slice of columns.
+        @keyword copy: Return a (modifiable) copy of the data instead of a view.
+        @return: Grid of the same class, with the same attributes and an adjusted geodict.
+        @raise GridError: When the slices do not select any cells, or have a negative step.
+        """
+        geodict = self._getGeoDict()
+        row1,row2,rowstep = rows.indices(geodict.nrows)
+        col1,col2,colstep = cols.indices(geodict.ncols)
+        if rowstep < 1 or colstep < 1:
+            raise GridError, 'Subgrid rows and columns cannot be reversed'
+        nrows = len(xrange(row1,row2,rowstep))
+        ncols = len(xrange(col1,col2,colstep))
+        if not nrows or not ncols:
+            raise GridError, 'Subgrid does not contain any cells'
+        xdim = geodict.xdim*colstep
+        ydim = geodict.ydim*rowstep
+        xmin = geodict.xmin + col1*geodict.xdim
+        xmax = xmin + (ncols-1)*xdim
+        ymax = geodict.ymax - row1*geodict.ydim
+        ymin = ymax - (nrows-1)*ydim
+        #grids that cross the meridian keep their longitudes between -180 and 180
+        if geodict.crossesMeridian:
+            if xmin > 180:
+                xmin -= 360
+            if xmax > 180:
+                xmax -= 360
+        geodict = geodict.replace(nrows=nrows,ncols=ncols,xmin=xmin,xmax=xmax,ymin=ymin,ymax=ymax,
+                                  xdim=xdim,ydim=ydim)
+        return self._newGrid(self.griddata[row1:row2:rowstep,col1:col2:colstep],geodict,copy)
+
+    def _newGrid(self,griddata,geodict,copy):
+        #a grid of the same class and attributes, with a read-only view (or a copy) of some data
+        if copy:
+            griddata = griddata.copy()
+        elif griddata.flags.writeable:
+            griddata = griddata.view()
+            griddata.flags.writeable = False
+        grid = self.__copy__()
+        grid.__dict__.pop('_geodictCache',None)
+        grid.griddata = griddata
+        grid.geodict = geodict
+        return grid
+
+    @instrument.instrumented('grid.binToGrid')
     def binToGrid(self,geodict):
         """
         Given a geodict specifying another (coarser) grid extent and resolution, DOWNSAMPLE current grid to match.
@@ -132,33 +267,32 @@ class Grid:
                 newgriddata[i,j] = np.nanmean(zcell*weights)
             
         self.griddata = newgriddata.copy()
-        self.geodict = geodict.copy()
+        self.geodict = GeoDict(geodict)
                 
 
     def _getInterpCoords(self,geodict):
         #get the cell coordinates of the grid we want to interpolate to
-        dims = self.griddata.shape
-        nrows1 = dims[0]
-        ncols1 = dims[1]
-        ulx1 = self.geodict['xmin']
-        uly1 = self.geodict['ymax']
-        xdim1 = self.geodict['xdim']
-        ydim1 = self.geodict['ydim']
+        base = self._getGeoDict()
+        ulx1 = base.xmin
+        uly1 = base.ymax
+        xdim1 = base.xdim
+        ydim1 = base.ydim
         
         #extract the geographic information about the grid we're sampling to
-        nrows = geodict['nrows']
-        ncols = geodict['ncols']
-        ulx = geodict['xmin']
-        uly = geodict['ymax']
-        xdim = geodict['xdim']
-        ydim = geodict['ydim']
+        geodict = asGeoDict(geodict)
+        nrows = geodict.nrows
+        ncols = geodict.ncols
+        ulx = geodict.xmin
+        uly = geodict.ymax
+        xdim = geodict.xdim
+        ydim = geodict.ydim
 
         #make sure that base grid is completely contained within the grid to be
         #resampled
-        lry = geodict['ymin']
-        lrx = geodict['xmax']
-        lry1 = self.geodict['ymin']
-        lrx1 = self.geodict['xmax']
+        lry = geodict.ymin
+        lrx = geodict.xmax
+        lry1 = base.ymin
+        lrx1 = base.xmax
 
         if (lry < lry1 or lrx > lrx1):
             raise GridError, 'Error:  Base grid is not completely contained by resampling grid.'
@@ -196,6 +330,7 @@ class Grid:
 
         return (xi,yi)
         
+    @instrument.instrumented('grid.interpolateToGrid')
     def interpolateToGrid(self,geodict,method='linear'): #implement here
         """
         Given a geodict specifying another grid extent and resolution, resample current grid to match.
@@ -208,6 +343,8 @@ class Grid:
 
         This function modifies the internal griddata and geodict object variables.
         """
+        #scipy.interpolate is slow to import, so only load it when it's needed
+        from scipy import interpolate
         xi,yi = self._getInterpCoords(geodict)
 
         #now using scipy interpolate functions
@@ -255,14 +392,10 @@ class Grid:
             msg = "Interpolation failed!  Results (%i,%i) don't match (%i,%i)!" % (nrows_new,ncols_new,nrows,ncols)
             raise GridError, msg
         #now the extents and resolution of the two grids should be identical...
-        self.geodict['nrows'] = geodict['nrows']
-        self.geodict['ncols'] = geodict['ncols']
-        self.geodict['xmin'] = geodict['xmin']
-        self.geodict['xmax'] = geodict['xmax']
-        self.geodict['ymin'] = geodict['ymin']
-        self.geodict['ymax'] = geodict['ymax']
-        self.geodict['xdim'] = geodict['xdim']
-        self.geodict['ydim'] = geodict['ydim']
+        newdict = dict(self.geodict.items())
+        for key in ['nrows','ncols','xmin','xmax','ymin','ymax','xdim','ydim']:
+            newdict[key] = geodict[key]
+        self.geodict = GeoDict(newdict)
         return
 
     def getData(self):
@@ -276,12 +409,8 @@ class Grid:
         """Return a tuple (xmin,xmax,ymin,ymax) containing the extent of the data in this grid.
         @return: Tuple (xmin,xmax,ymin,ymax) containing the extent of the data in this grid.
         """
-        (nrows,ncols) = (self.geodict['nrows'],self.geodict['ncols'])
-        xmin = self.geodict['xmin']
-        xmax = self.geodict['xmax']
-        ymax = self.geodict['ymax']
-        ymin = self.geodict['ymin']
-        return (xmin,xmax,ymin,ymax)
+        geodict = self._getGeoDict()
+        return (geodict.xmin,geodict.xmax,geodict.ymin,geodict.ymax)
 
     def getGeoDict(self):
         """
@@ -302,33 +431,41 @@ class Grid:
         """
         return self.geodict
 
+    def _planWindow(self,geodict,bounds):
+        #gridwindow.planWindow(), raising the GridError callers of grid methods expect
+        try:
+            return planWindow(geodict,bounds)
+        except GridWindowError,msg:
+            raise GridError,str(msg.args[0])
+
+    def _getGeoDict(self):
+        #the geodict as a GeoDict.  Plain dictionaries can be changed at any time, so the GeoDict made from
+        #one is only reused while its contents are the same.
+        geodict = self.geodict
+        if isinstance(geodict,GeoDict):
+            return geodict
+        items = geodict.items()
+        cached = getattr(self,'_geodictCache',None)
+        if cached is None or cached[0] is not geodict or cached[1] != items:
+            cached = (geodict,items,GeoDict(geodict))
+            self._geodictCache = cached
+        return cached[2]
+
     def getLatLon(self,row,col):
         """Return geographic coordinates (lat/lon decimal degrees) for given data row and column.
-        @param row: Row dimension index into internal data array.
-        @param col: Column dimension index into internal data array.
+        @param row: Row dimension index (or array of indices) into internal data array.
+        @param col: Column dimension index (or array of indices) into internal data array.
         @return: Tuple of latitude and longitude.
         """
-        ulx = self.geodict['xmin']
-        uly = self.geodict['ymax']
-        xdim = self.geodict['xdim']
-        ydim = self.geodict['ydim']
-        lon = ulx + col*xdim
-        lat = uly - row*ydim
-        return (lat,lon)
+        return self._getGeoDict().latlon(row,col)
 
     def getRowCol(self,lat,lon):
         """Return data row and column from given geographic coordinates (lat/lon decimal degrees).
-        @param lat: Input latitude.
-        @param lon: Input longitude.
+        @param lat: Input latitude (or array of latitudes).
+        @param lon: Input longitude (or array of longitudes).
         @return: Tuple of row and column.
         """
-        ulx = self.geodict['xmin']
-        uly = self.geodict['ymax']
-        xdim = self.geodict['xdim']
-        ydim = self.geodict['ydim']
-        col = np.floor((lon-ulx)/xdim)
-        row = np.floor((uly-lat)/ydim)
-        return (row,col)
+        return self._getGeoDict().rowcol(lat,lon,method='floor')
 
 
     def getAttributes(self):
@@ -344,19 +481,10 @@ class Grid:
         @param lon: Longitude (in decimal degrees) of desired data value.
         @return: Value at input latitude,longitude position.
         """
-        ulx = self.geodict['xmin']
-        uly = self.geodict['ymax']
-        xdim = self.geodict['xdim']
-        ydim = self.geodict['ydim']
         dims = self.griddata.shape
         nrows = dims[0]
         ncols = dims[1]
-        #check to see if we're in a scenario where the grid crosses the meridian
-        if self.geodict['xmax'] < ulx and lon < ulx:
-            lon += 360
-
-        col = np.round(((lon - ulx)/xdim)).astype(int)
-        row = np.round(((uly - lat)/ydim)).astype(int)
+        row,col = self._getGeoDict().rowcol(lat,lon)
         if (row < 0).any() or (row > nrows-1).any() or (col < 0).any() or (col > ncols-1).any():
             msg = 'One of more of your lat/lon values is outside Grid boundaries: %s' % (str(self.getRange()))
             raise GridError, msg
@@ -372,19 +500,10 @@ class Grid:
         @param lon: Longitude (in decimal degrees) of desired data value.
         @return: Value at input latitude,longitude position.
         """
-        ulx = self.geodict['xmin']
-        uly = self.geodict['ymax']
-        xdim = self.geodict['xdim']
-        ydim = self.geodict['ydim']
         dims = self.griddata.shape
         nrows = dims[0]
         ncols = dims[1]
-        #check to see if we're in a scenario where the grid crosses the meridian
-        if self.geodict['xmax'] < ulx and lon < ulx:
-            lon += 360
-
-        col = np.round(((lon - ulx)/xdim)).astype(int)
-        row = np.round(((uly - lat)/ydim)).astype(int)
+        row,col = self._getGeoDict().rowcol(lat,lon)
         if (row < 0).any() or (row > nrows-1).any() or (col < 0).any() or (col > ncols-1).any():
             safe_row = np.array(row)
             safe_col = np.array(col)
@@ -405,6 +524,34 @@ class Grid:
             else:
                 return self.griddata[row,col]
 
+def _packArray(array):
+    #(dtype,shape,fortran,list of byte strings) for numeric arrays, or (None,array) for anything else.
+    #The dtype itself is kept, as its string form loses the field names of structured arrays.
+    if type(array) not in (np.ndarray,np.memmap) or array.dtype.hasobject:
+        return (None,array)
+    if array.ndim == 0:
+        return (array.dtype,array.shape,False,[array.tostring()])
+    fortran = array.flags.f_contiguous and not array.flags.c_contiguous
+    if fortran:
+        array = array.T
+    step = max(1,PICKLE_CHUNK_BYTES//max(1,array[0:1].nbytes))
+    chunks = [array[i:i+step].tostring() for i in range(0,len(array),step)]
+    return (array.dtype,array.shape,fortran,chunks)
+
+def _unpackArray(packed):
+    if packed[0] is None:
+        return packed[1]
+    dtype,shape,fortran,chunks = packed
+    array = np.empty(shape,dtype=np.dtype(dtype))
+    flat = array.reshape(-1).view(np.uint8)
+    offset = 0
+    for chunk in chunks:
+        flat[offset:offset+len(chunk)] = np.frombuffer(chunk,dtype=np.uint8)
+        offset += len(chunk)
+    if fortran:
+        array = array.T
+    return array
+
 def testBin():
     grid = Grid()
     grid.griddata = np.arange(1,31).reshape(5,6)
@@ -430,6 +577,27 @@ def testBin():
                        [ 13.6875,  14.4375,  15.375 ]])
     assert(np.equal(grid.griddata,answer).all())
 
+def testPickle():
+    import cPickle
+    base = np.arange(0,60,dtype=np.float64).reshape(6,10)
+    arrays = [base,
+              np.asfortranarray(base),
+              base[1:5:2,::3],
+              np.zeros((0,10)),
+              base.astype('>i4'),
+              np.array([[(1,2.5),(3,4.5)]],dtype=[('count','<i4'),('value','<f8')])]
+    for array in arrays:
+        grid = Grid()
+        grid.griddata = array
+        grid.geodict = {'nrows':array.shape[0],'ncols':array.shape[1]}
+        copies = [cPickle.loads(cPickle.dumps(grid,2)),types.InstanceType(Grid,{})]
+        copies[1].__setstate__(grid.__getstate__())
+        for copy in copies:
+            assert(copy.griddata.dtype == array.dtype and copy.griddata.dtype.names == array.dtype.names)
+            assert(copy.griddata.shape == array.shape and (copy.griddata == array).all())
+            assert(copy.griddata.flags.f_contiguous == array.flags.f_contiguous)
+            assert(copy.geodict == grid.geodict)
+
 def testInterp():
     grid = Grid()
     initialdata = np.arange(1,17).reshape(4,4)
@@ -472,6 +640,7 @@ def testInterp():
         
 if __name__ == '__main__':
     testBin()
+    testPickle()
     testInterp()
 
     
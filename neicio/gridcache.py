@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import os.path
+import json
+import tempfile
+
+#third party imports
+import numpy as np
+
+#local imports
+import instrument
+
+CACHE_VERSION = 1
+
+def getCacheFiles(sourcefile):
+    """
+    Return the names of the sidecar cache files for a given source file.
+    @param sourcefile: Path to source data file.
+    @return: Tuple of (data file,header file) names.
+    """
+    return (sourcefile + '.cache.npy',sourcefile + '.cache.json')
+
+def loadGridCache(sourcefile):
+    """
+    Load grid data and geodict from the sidecar cache of a source file, if that cache is still valid.
+    @param sourcefile: Path to source data file.
+    @return: Tuple of (griddata,geodict), or None if there is no valid cache.  griddata is a copy-on-write
+             memory map of the cached array, so it is only read from disk as it is used.
+    """
+    datafile,hdrfile = getCacheFiles(sourcefile)
+    cached = _readGridCache(sourcefile,datafile,hdrfile)
+    if instrument.ENABLED:
+        if cached is None:
+            instrument.count(cache_misses=1)
+        else:
+            instrument.count(cache_hits=1)
+    return cached
+
+def _readGridCache(sourcefile,datafile,hdrfile):
+    if not os.path.isfile(datafile) or not os.path.isfile(hdrfile):
+        return None
+    try:
+        f = open(hdrfile,'rt')
+        try:
+            header = json.load(f)
+        finally:
+            f.close()
+        stat = os.stat(sourcefile)
+        if header['version'] != CACHE_VERSION or header['size'] != stat.st_size or header['mtime'] != stat.st_mtime:
+            return None
+        griddata = np.load(datafile,mmap_mode='c')
+    except (IOError,OSError,ValueError,KeyError):
+        return None
+    return (griddata,header['geodict'])
+
+def saveGridCache(sourcefile,griddata,geodict):
+    """
+    Save grid data and geodict to a sidecar cache next to a source file.
+    @param sourcefile: Path to source data file.
+    @param griddata: numpy array of grid data.
+    @param geodict: Grid geodict (see Grid).  All values must be numbers, strings, lists of strings or None.
+    @return: True if the cache was written, False if it could not be (i.e., read-only directory).
+    """
+    datafile,hdrfile = getCacheFiles(sourcefile)
+    header = {'version':CACHE_VERSION,'geodict':{}}
+    for key,value in geodict.items():
+        if isinstance(value,np.generic):
+            value = value.item()
+        header['geodict'][key] = value
+    cachedir = os.path.dirname(os.path.abspath(sourcefile))
+    tmpfiles = []
+    try:
+        stat = os.stat(sourcefile)
+        header['size'] = stat.st_size
+        header['mtime'] = stat.st_mtime
+        #write to temporary files and rename them, so readers never see a partial cache
+        fd,tmpdata = tempfile.mkstemp(suffix='.npy',dir=cachedir)
+        tmpfiles.append(tmpdata)
+        f = os.fdopen(fd,'wb')
+        try:
+            np.save(f,griddata)
+        finally:
+            f.close()
+        fd,tmphdr = tempfile.mkstemp(suffix='.json',dir=cachedir)
+        tmpfiles.append(tmphdr)
+        f = os.fdopen(fd,'wt')
+        try:
+            json.dump(header,f)
+        finally:
+            f.close()
+        #temporary files are only readable by us, so give the cache the permissions of any other new file
+        mode = 0o666 & ~_getUmask()
+        os.chmod(tmpdata,mode)
+        os.chmod(tmphdr,mode)
+        os.rename(tmpdata,datafile)
+        os.rename(tmphdr,hdrfile)
+        if instrument.ENABLED:
+            instrument.count(writes=2,bytes_written=os.path.getsize(datafile)+os.path.getsize(hdrfile))
+    except (IOError,OSError,TypeError):
+        for tmpfile in tmpfiles:
+            if os.path.isfile(tmpfile):
+                os.remove(tmpfile)
+        return False
+    return True
+
+def _getUmask():
+    #the only way to read the umask is to set it
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
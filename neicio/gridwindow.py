@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+#third party imports
+import numpy as np
+
+#local imports
+from geodict import asGeoDict
+
+#fraction of a cell by which bounds may miss a cell center and still include it
+WINDOW_TOLERANCE = 1e-6
+
+class GridWindowError(Exception):
+    "used to indicate an error in GridWindow"
+    def __str__(self):
+        return repr(self.args[0])
+
+class GridWindow(object):
+    """
+    Plan for reading the cells of a grid that are inside some geographic bounds (see planWindow()).
+
+    A window is a range of rows, and one or more sections of columns - more than one when the window
+    wraps around the edge of a global grid.  Each section is a tuple of (col1,col2,outcol): source
+    columns col1 up to (not including) col2 go to the window's columns starting at outcol.
+    example:
+    window = planWindow(grid.geodict,(170.0,-170.0,-20.0,-10.0))
+    data = window.read(binfile,dtype=numpy.float64)
+    geodict = window.geodict
+    """
+    def __init__(self,rows,sections,geodict):
+        """
+        @param rows: Tuple of (row1,row2) source rows - row1 up to (not including) row2.
+        @param sections: List of (col1,col2,outcol) column sections.
+        @param geodict: GeoDict of the window.
+        """
+        self.rows = rows
+        self.sections = sections
+        self.geodict = geodict
+        self.shape = (rows[1]-rows[0],sum([col2-col1 for col1,col2,outcol in sections]))
+
+    def __repr__(self):
+        return 'GridWindow(rows=%s,sections=%s)' % (str(self.rows),str(self.sections))
+
+    def isContiguous(self):
+        """
+        Return whether the window is a single block of the source (and so can be a view of it).
+        """
+        return len(self.sections) == 1
+
+    def getSlices(self):
+        """
+        Return the source slices of a contiguous window.
+        @return: Tuple of (row slice,column slice).
+        @raise GridWindowError: When the window is not contiguous.
+        """
+        if not self.isContiguous():
+            raise GridWindowError('Window wraps around the edge of the grid, so is not one block of it')
+        col1,col2,outcol = self.sections[0]
+        return (slice(self.rows[0],self.rows[1]),slice(col1,col2))
+
+    def read(self,source,rows=None,out=None,dtype=None,flipud=False):
+        """
+        Read the window from a source, one section at a time, straight into one output array.
+        @param source: numpy array, memory map, BinFile, or anything else that can be sliced like a
+                       2 (or more) dimensional array, with the same rows and columns as the geodict the
+                       window was planned for.
+        @keyword rows: Optional tuple of (row1,row2) rows of the window to read (for reading a window a
+                       strip at a time).  Defaults to all of them.
+        @keyword out: Optional array to read into, of the shape of the rows read.
+        @keyword dtype: Data type of the output array, when out is not given.  Defaults to that of
+                        the source.  Values are converted as they are copied.
+        @keyword flipud: True when the rows of the source are stored from the bottom up (netcdf, etc.)
+        @return: Array of the window (or its rows).
+        """
+        row1,row2 = self.rows
+        if rows is not None:
+            row1,row2 = (row1+rows[0],row1+rows[1])
+        if flipud:
+            nrows = source.shape[0]
+            row1,row2 = (nrows-row2,nrows-row1)
+        if out is None:
+            if dtype is None:
+                dtype = source.dtype
+            out = np.empty((row2-row1,self.shape[1])+tuple(source.shape[2:]),dtype=dtype)
+        for col1,col2,outcol in self.sections:
+            section = source[row1:row2,col1:col2]
+            if flipud:
+                section = section[::-1]
+            out[:,outcol:outcol+col2-col1] = section
+        return out
+
+def planWindow(geodict,bounds=None):
+    """
+    Plan the reading of the cells of a grid whose centers are inside some geographic bounds.
+
+    Bounds may use either longitude convention (-180 to 180, or 0 to 360), whatever the convention of
+    the grid, and may cross the meridian (xmin > xmax).  Windows of global grids may wrap around the
+    edge of the grid; windows of other grids are clipped to them.  The longitudes of the window's
+    geodict follow the convention of the bounds.
+    @param geodict: Dictionary or GeoDict of the grid to be read (see Grid.geodict).
+    @keyword bounds: Tuple of (xmin,xmax,ymin,ymax) in decimal degrees, or None for the whole grid.
+    @return: GridWindow object.
+    @raise GridWindowError: When no cells of the grid are inside the bounds, or the bounds cover both
+                            edges of a grid that is not global.
+    """
+    geodict = asGeoDict(geodict)
+    nrows,ncols = geodict.nrows,geodict.ncols
+    if bounds is None:
+        return GridWindow((0,nrows),[(0,ncols,0)],geodict)
+    bxmin,bxmax,bymin,bymax = bounds
+    xdim,ydim = geodict.xdim,geodict.ydim
+    row1 = max(0,int(np.ceil((geodict.ymax - bymax)/ydim - WINDOW_TOLERANCE)))
+    row2 = min(nrows-1,int(np.floor((geodict.ymax - bymin)/ydim + WINDOW_TOLERANCE)))
+    #columns repeat every 360 degrees, so put the western bound in the first repeat at or after the
+    #western edge of the grid, and its eastern bound width degrees east of that
+    period = 360.0/xdim
+    width = (bxmax - bxmin) % 360.0
+    if width == 0 and bxmax != bxmin:
+        width = 360.0
+    start = ((bxmin - geodict.xmin)/xdim + 0.5) % period - 0.5
+    end = start + width/xdim
+    #columns of global grids repeat every ncols columns (or every ncols-1, when the last column is the
+    #first one again, 360 degrees on)
+    repeat = int(round(period))
+    if ncols >= repeat:
+        col1 = int(np.ceil(start - WINDOW_TOLERANCE))
+        col2 = min(int(np.floor(end + WINDOW_TOLERANCE)),col1+repeat-1)
+    else:
+        repeat = ncols
+        col1 = max(0,int(np.ceil(start - WINDOW_TOLERANCE)))
+        col2 = min(ncols-1,int(np.floor(end + WINDOW_TOLERANCE)))
+        #the part of the window in the next repeat
+        wrapcol2 = min(ncols-1,int(np.floor(end - period + WINDOW_TOLERANCE)))
+        if wrapcol2 >= 0:
+            if col1 <= col2:
+                raise GridWindowError('Bounds %s cover both edges of a grid that is not global' % str(bounds))
+            col1,col2 = (0,wrapcol2)
+    if row1 > row2 or col1 > col2:
+        raise GridWindowError('Bounds %s do not contain any cells of the grid' % str(bounds))
+    sections = []
+    col = col1
+    while col <= col2:
+        srccol = col % repeat
+        count = min(col2-col+1,ncols-srccol)
+        sections.append((srccol,srccol+count,col-col1))
+        col += count
+    outrows = row2-row1+1
+    outcols = col2-col1+1
+    #put xmin in the same convention as the bounds
+    xmin = geodict.xmin + col1*xdim
+    xmin -= 360*np.floor((xmin - bxmin + xdim*WINDOW_TOLERANCE)/360.0)
+    xmax = xmin + (outcols-1)*xdim
+    #windows crossing the meridian keep their longitudes between -180 and 180, so have their right
+    #edge west of their left edge
+    if bxmin > bxmax or geodict.crossesMeridian:
+        if xmin > 180:
+            xmin -= 360
+        if xmax > 180:
+            xmax -= 360
+    ymax = geodict.ymax - row1*ydim
+    window = geodict.replace(nrows=outrows,ncols=outcols,xmin=xmin,xmax=xmax,
+                             ymin=ymax-(outrows-1)*ydim,ymax=ymax)
+    return GridWindow((row1,row2+1),sections,window)
@@ -6,13 +6,29 @@ import sys
 
 #third party imports
 import numpy as np
-from matplotlib import pyplot as plt
 
 #local imports
 from grid import Grid
+from geodict import GeoDict
+from gridcache import loadGridCache,saveGridCache
+import instrument
 
+@instrument.instrumentClass
 class HazCurveGrid(Grid):
-    def __init__(self,probtextfile):
+    @instrument.instrumented('hazcurve.load')
+    def __init__(self,probtextfile,cache=True):
+        """
+        Read in a USGS hazard curve text file.
+        @param probtextfile: Hazard curve text file.
+        @keyword cache: If True, load the grid from a binary sidecar cache next to probtextfile when that cache
+                        is up to date, and write one when it isn't (see gridcache).
+        """
+        if cache:
+            cached = loadGridCache(probtextfile)
+            if cached is not None:
+                self.griddata,geodict = cached
+                self.geodict = GeoDict(geodict)
+                return
         #about the only thing we can depend on is that the first three
         #rows have stuff (maybe commented, maybe not).  This is followed by N lines
         #of single values, where N becomes the number of bands of data
@@ -40,6 +56,8 @@ class HazCurveGrid(Grid):
             
         #read in the data using numpy's very fast loadtxt function!
         self.griddata = np.loadtxt(f)
+        if instrument.ENABLED:
+            instrument.count(seeks=1,reads=2,bytes_read=f.tell())
         f.close()
         
         lat = self.griddata[:,0]
@@ -61,6 +79,7 @@ class HazCurveGrid(Grid):
         #first reshape by columns then rows then bands
         self.griddata = np.reshape(self.griddata,(m,n,p))
 
+        self.geodict = {}
         self.geodict['xmin'] = xmin
         self.geodict['xmax'] = xmax
         self.geodict['ymin'] = ymin
@@ -69,9 +88,116 @@ class HazCurveGrid(Grid):
         self.geodict['ydim'] = ydim
         self.geodict['ncols'] = n
         self.geodict['nrows'] = m
+        self.geodict['nbands'] = p
         self.geodict['bandnames'] = xvalues
+        self.geodict = GeoDict(self.geodict)
+        if cache:
+            saveGridCache(probtextfile,self.griddata,self.geodict)
+
+    def getGroundMotion(self,probability,years=None):
+        """
+        Invert every hazard curve at once to find the ground motion level at a given probability.
+        Curves are interpolated linearly in log(level)/log(probability) space between bands.
+        @param probability: Probability (or rate) of exceedance, in the same units as the hazard curves.
+        @keyword years: If supplied, probability is instead the probability of exceedance in this many years
+                        (i.e., 0.02 in 50 years), and is converted to an annual rate first.
+        @return: 2D Grid of ground motion levels.  Cells where the probability is outside the range of the
+                 curve are NaN.
+        """
+        if years is not None:
+            probability = -np.log(1-probability)/years
+        levels = self.getLevels()
+        nbands = len(levels)
+        cube = self.griddata
+        #curves decrease with increasing level, so the number of bands above the target probability
+        #tells us which pair of bands brackets it
+        ibelow = (cube >= probability).sum(axis=2) - 1
+        valid = (ibelow >= 0) & (ibelow < nbands-1)
+        ilow = np.clip(ibelow,0,nbands-2)
+        rows,cols = np.indices(ilow.shape)
+        p0 = cube[rows,cols,ilow]
+        p1 = cube[rows,cols,ilow+1]
+        loglevels = np.log(levels)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            frac = (np.log(probability) - np.log(p0))/(np.log(p1) - np.log(p0))
+            #the inverse of the linear interpolation getProbability() uses when the upper band is zero
+            zero = p1 == 0
+            frac[zero] = ((p0-probability)/(p0-p1))[zero]
+            frac[~np.isfinite(frac)] = 0
+            gm = np.exp(loglevels[ilow] + frac*(loglevels[ilow+1]-loglevels[ilow]))
+        gm[~valid] = np.nan
+        return self.__makeGrid(gm,'%g' % probability)
+
+    def getProbability(self,level):
+        """
+        Evaluate every hazard curve at once at an arbitrary ground motion level.
+        Curves are interpolated linearly in log(level)/log(probability) space between bands.
+        @param level: Ground motion level, in the same units as the band names.
+        @return: 2D Grid of probabilities.  All cells are NaN if level is outside the range of the bands.
+        """
+        levels = self.getLevels()
+        nrows,ncols,nbands = self.griddata.shape
+        if level < levels[0] or level > levels[-1]:
+            return self.__makeGrid(np.ones((nrows,ncols))*np.nan,'%g' % level)
+        ilow = min(np.searchsorted(levels,level,side='right')-1,nbands-2)
+        frac = (np.log(level)-np.log(levels[ilow]))/(np.log(levels[ilow+1])-np.log(levels[ilow]))
+        p0 = self.griddata[:,:,ilow]
+        p1 = self.griddata[:,:,ilow+1]
+        with np.errstate(divide='ignore',invalid='ignore'):
+            prob = np.exp(np.log(p0) + frac*(np.log(p1)-np.log(p0)))
+        #zero probabilities can't be interpolated in log space, so interpolate linearly between a
+        #probability and zero (which gives zero between two zeros)
+        zero = (p0 == 0) | (p1 == 0)
+        prob[zero] = p0[zero] + frac*(p1[zero]-p0[zero])
+        if frac == 0:
+            prob = p0.copy()
+        return self.__makeGrid(prob,'%g' % level)
+
+    def getLevels(self):
+        """
+        Return the ground motion levels of each band.
+        @return: numpy array of the band names converted to floats.
+        """
+        return np.array([float(band) for band in self.geodict['bandnames']])
+
+    def __makeGrid(self,data,bandname):
+        grid = Grid()
+        grid.griddata = data
+        grid.geodict = self.geodict.replace(nbands=1,bandnames=[bandname])
+        return grid
+
+def testZeroTail():
+    import tempfile
+    levels = ['0.1','0.2','0.4','0.8']
+    curve = '0.1 0.01 0 0'
+    fd,txtfile = tempfile.mkstemp(suffix='.txt')
+    f = os.fdopen(fd,'wt')
+    f.write('#header\n#header\n#header\n')
+    f.write('\n'.join(levels)+'\n')
+    for lat in [1.0,0.0]:
+        for lon in [0.0,1.0]:
+            f.write('%.1f %.1f %s\n' % (lat,lon,curve))
+    f.close()
+    try:
+        grid = HazCurveGrid(txtfile,cache=False)
+    finally:
+        os.remove(txtfile)
+    #both bracketing probabilities are zero
+    assert((grid.getProbability(0.6).griddata == 0).all())
+    #only the upper one is, so interpolate linearly
+    prob = grid.getProbability(np.exp((np.log(0.2)+np.log(0.4))/2)).griddata
+    assert(np.allclose(prob,0.005))
+    assert(np.allclose(grid.getProbability(0.2).griddata,0.01))
+    #ground motions invert the probabilities, on both sides of the zero tail
+    for probability in [0.05,0.005,0.0005,0.0001]:
+        gm = grid.getGroundMotion(probability).griddata
+        assert(np.isfinite(gm).all() and (gm == gm[0,0]).all())
+        assert(np.allclose(grid.getProbability(gm[0,0]).griddata,probability))
+    assert(grid.getGroundMotion(0.0005).griddata[0,0] > grid.getGroundMotion(0.005).griddata[0,0])
 
 if __name__ == '__main__':
+    testZeroTail()
+    from matplotlib import pyplot as plt
     txtfile = sys.argv[1]
     grid = HazCurveGrid(txtfile)
     imax = grid.griddata[:,:,0].argmax()
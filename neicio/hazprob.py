@@ -3,40 +3,48 @@
 #stdlib imports
 import os.path
 import sys
+import gzip
+import re
 
 #third party imports
 import numpy as np
-from neicutil.matutil import sub2ind
-from matplotlib import pyplot as plt
 
 #local imports
 from grid import Grid
+from geodict import GeoDict
+from gridcache import loadGridCache,saveGridCache
+import instrument
 
+#a line with nothing but whitespace on it
+BLANK_LINE = re.compile(b'\n[ \t\r\f\v]*\n')
+
+@instrument.instrumentClass
 class HazProbGrid(Grid):
-    def __init__(self,probtextfile):
+    @instrument.instrumented('hazprob.load')
+    def __init__(self,probtextfile,cache=True):
         """
         Read in a USGS Gridded Hazard Map text file
         (found here: http://earthquake.usgs.gov/hazards/products/conterminous/2008/data/
         AND
         here: http://earthquake.usgs.gov/hazards/products/conterminous/2002/data/
-        @param probtextfile: Text file as found on above web pages. (Must gunzip first)
+        @param probtextfile: Text file as found on above web pages (gzipped or not).
+        @keyword cache: If True, load the grid from a binary sidecar cache next to probtextfile when that cache
+                        is up to date, and write one when it isn't (see gridcache).
         """
+        if cache:
+            cached = loadGridCache(probtextfile)
+            if cached is not None:
+                self.griddata,geodict = cached
+                self.geodict = GeoDict(geodict)
+                return
         fpath,ffile = os.path.split(probtextfile)
         ffile,fext = os.path.splitext(ffile)
-        lats = []
-        lons = []
-        z = []
-        f = open(probtextfile,'rt')
-        for line in f.readlines():
-            parts = line.split()
-            lons.append(float(parts[0]))
-            lats.append(float(parts[1]))
-            z.append(float(parts[2]))
-        f.close()
-
-        lats = np.array(lats)
-        lons = np.array(lons)
-        self.griddata = np.array(z)
+        if fext == '.gz':
+            ffile,fext = os.path.splitext(ffile)
+        data = readHazardText(probtextfile)
+        lons = data[:,0]
+        lats = data[:,1]
+        z = data[:,2]
         ulat = np.unique(lats)
         ulon = np.unique(lons)
         xdim = ulon[1] - ulon[0]
@@ -45,24 +53,69 @@ class HazProbGrid(Grid):
         xmax = lons.max()
         ymin = lats.min()
         ymax = lats.max()
-        ncols = np.int32(np.floor(((xmax+xdim)-xmin)/xdim))
-        nrows = np.int32(np.floor(((ymax+ydim)-ymin)/ydim))
+        ncols = int(np.round((xmax-xmin)/xdim)) + 1
+        nrows = int(np.round((ymax-ymin)/ydim)) + 1
+        self.geodict = {}
         self.geodict['xmin'] = xmin
         self.geodict['xmax'] = xmax
         self.geodict['ymin'] = ymin
         self.geodict['ymax'] = ymax
         self.geodict['xdim'] = xdim
         self.geodict['ydim'] = ydim
+        self.geodict['nrows'] = nrows
+        self.geodict['ncols'] = ncols
         self.geodict['nbands'] = 1
         self.geodict['bandnames'] = [ffile]
-        rows,cols = self.getRowCol(lats,lons)
-        index = np.int32(sub2ind((ncols,nrows),(cols,rows)))
-        self.griddata[index] = self.griddata
-        self.griddata = np.reshape(self.griddata,(nrows,ncols))
-        
-        
+        #scatter the points into the grid - any cells missing from the file are NaN
+        rows = np.round((ymax-lats)/ydim).astype(np.int64)
+        cols = np.round((lons-xmin)/xdim).astype(np.int64)
+        self.griddata = np.empty(nrows*ncols)
+        self.griddata.fill(np.nan)
+        self.griddata[rows*ncols + cols] = z
+        self.griddata = self.griddata.reshape((nrows,ncols))
+        self.geodict = GeoDict(self.geodict)
+        if cache:
+            saveGridCache(probtextfile,self.griddata,self.geodict)
+
+def readHazardText(textfile):
+    """
+    Read a whitespace-delimited text file of numbers (gzipped or not) into a 2D array.
+    @param textfile: Path to text file.  Files ending in .gz are decompressed as they are read.
+    @return: 2D numpy array with one row per line of the file.
+    @raise ValueError: When the lines in the file do not all have the same number of numeric columns.
+    """
+    if textfile.endswith('.gz'):
+        f = gzip.open(textfile,'rb')
+    else:
+        f = open(textfile,'rb')
+    try:
+        text = f.read()
+    finally:
+        f.close()
+    if instrument.ENABLED:
+        instrument.count(reads=1,bytes_read=len(text))
+    text = text.strip()
+    if BLANK_LINE.search(text):
+        #blank lines don't count as rows, but splitting the file into lines is slow, so only do it if need be
+        lines = [line for line in text.splitlines() if line.strip()]
+        firstline = lines[0]
+        nlines = len(lines)
+        del lines
+    else:
+        #a file of a single line may not end with a newline
+        end = text.find(b'\n')
+        if end < 0:
+            end = len(text)
+        firstline = text[0:end]
+        nlines = text.count(b'\n') + 1
+    ncolumns = len(firstline.split())
+    data = np.fromstring(text,sep=' ')
+    if not ncolumns or data.size != nlines*ncolumns:
+        raise ValueError('Could not read %s as %i columns of numbers' % (textfile,ncolumns))
+    return data.reshape((-1,ncolumns))
 
 if __name__ == '__main__':
+    from matplotlib import pyplot as plt
     txtfile = sys.argv[1]
     grid = HazProbGrid(txtfile)
     lat,lon = grid.getLatLon(10,10)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import time
+import threading
+import functools
+
+#counters kept for every instrumented operation
+COUNTERS = ['bytes_read','bytes_written','seeks','reads','writes','cache_hits','cache_misses']
+
+#True while anyone is listening.  Instrumented code checks this flag before counting anything.
+ENABLED = False
+
+_listeners = []
+_registry = []
+_lock = threading.Lock()
+_local = threading.local()
+
+class Operation(object):
+    """
+    Measurements for one call of an instrumented function.
+
+    Counters are inclusive: I/O done by a nested instrumented call (for example, the BinFile reads
+    made by EsriGrid.load()) is counted against both the nested and the outer operation.
+    """
+    def __init__(self,name):
+        """
+        @param name: Operation name ('esri.load','binfile.read', etc.)
+        """
+        self.name = name
+        self.seconds = 0.0
+        self.peak_array_bytes = 0
+        self.counters = dict.fromkeys(COUNTERS,0)
+        self.parent = None
+
+class ProfileStats(object):
+    """
+    Per-operation totals collected by profile().
+    example:
+    with neicio.profile() as stats:
+        grid = EsriGrid('population.flt')
+        grid.load(bounds=(135,140,33,38))
+    print stats.report()
+    print stats['esri.load']['bytes_read']
+    """
+    def __init__(self):
+        self.operations = {}
+        self.__lock = threading.Lock()
+
+    def add(self,op):
+        """
+        Add the measurements of one finished operation to the totals.
+        @param op: Operation object.
+        """
+        self.__lock.acquire()
+        try:
+            if op.name not in self.operations:
+                totals = dict.fromkeys(COUNTERS,0)
+                totals.update({'calls':0,'seconds':0.0,'max_seconds':0.0,'peak_array_bytes':0})
+                self.operations[op.name] = totals
+            totals = self.operations[op.name]
+            totals['calls'] += 1
+            totals['seconds'] += op.seconds
+            totals['max_seconds'] = max(totals['max_seconds'],op.seconds)
+            totals['peak_array_bytes'] = max(totals['peak_array_bytes'],op.peak_array_bytes)
+            for key in COUNTERS:
+                totals[key] += op.counters[key]
+        finally:
+            self.__lock.release()
+
+    def __getitem__(self,name):
+        return self.operations[name]
+
+    def __contains__(self,name):
+        return name in self.operations
+
+    def keys(self):
+        return sorted(self.operations.keys())
+
+    def toDict(self):
+        """
+        Return a copy of the totals as a dictionary of dictionaries (suitable for JSON).
+        """
+        return dict([(name,dict(totals)) for name,totals in self.operations.items()])
+
+    def report(self):
+        """
+        Return a text table of the totals, slowest operation first.
+        """
+        header = '%-28s %6s %10s %12s %12s %7s %7s %7s %12s %5s %5s' % ('operation','calls','seconds','read',
+                                                                     'written','seeks','reads','writes',
+                                                                     'peak array','hits','miss')
+        lines = [header]
+        names = sorted(self.operations.keys(),key=lambda name: -self.operations[name]['seconds'])
+        for name in names:
+            t = self.operations[name]
+            lines.append('%-28s %6i %10.4f %12i %12i %7i %7i %7i %12i %5i %5i' % (name,t['calls'],t['seconds'],
+                                                                                 t['bytes_read'],t['bytes_written'],
+                                                                                 t['seeks'],t['reads'],t['writes'],
+                                                                                 t['peak_array_bytes'],
+                                                                                 t['cache_hits'],
+                                                                                 t['cache_misses']))
+        return '\n'.join(lines)
+
+class profile(object):
+    """
+    Context manager that collects statistics on all instrumented neicio operations (in all threads)
+    while it is active.
+    example:
+    with neicio.profile() as stats:
+        shakegrid = ShakeGrid('grid.xml')
+        shakegrid.interpolateToGrid(popgrid.getGeoDict())
+    print stats.report()
+    """
+    def __init__(self,callback=None):
+        """
+        @keyword callback: Optional function called with each finished Operation, in the thread that ran it.
+        """
+        self.callback = callback
+        self.stats = ProfileStats()
+
+    def __enter__(self):
+        addListener(self.__record)
+        return self.stats
+
+    def __exit__(self,*args):
+        removeListener(self.__record)
+        return False
+
+    def __record(self,op):
+        self.stats.add(op)
+        if self.callback is not None:
+            self.callback(op)
+
+def addListener(listener):
+    """
+    Start calling a function with every finished instrumented operation.
+    @param listener: Function taking one Operation argument.  It is called in the thread that ran the
+                     operation, so must be thread-safe.
+    """
+    global ENABLED
+    _lock.acquire()
+    try:
+        _listeners.append(listener)
+        if not ENABLED:
+            for cls,attr,func,name in _registry:
+                setattr(cls,attr,_wrap(func,name))
+        ENABLED = True
+    finally:
+        _lock.release()
+
+def removeListener(listener):
+    """
+    Stop calling a function added with addListener().  Instrumentation is switched off when no
+    listeners remain.
+    @param listener: Function previously passed to addListener().
+    """
+    global ENABLED
+    _lock.acquire()
+    try:
+        if listener in _listeners:
+            _listeners.remove(listener)
+        if ENABLED and not _listeners:
+            for cls,attr,func,name in _registry:
+                setattr(cls,attr,func)
+        ENABLED = len(_listeners) > 0
+    finally:
+        _lock.release()
+
+def instrumented(name):
+    """
+    Decorator marking a method to be timed as operation 'name'.  The class must also be decorated
+    with instrumentClass().
+    @param name: Operation name.
+    """
+    def mark(func):
+        func.instrumentName = name
+        return func
+    return mark
+
+def instrumentClass(cls):
+    """
+    Class decorator registering the methods marked with instrumented().
+
+    Marked methods are only replaced with timing wrappers while instrumentation is enabled, and are
+    put back when the last listener is removed, so they cost nothing at all the rest of the time.
+    """
+    _lock.acquire()
+    try:
+        for attr,func in cls.__dict__.items():
+            name = getattr(func,'instrumentName',None)
+            if name is None:
+                continue
+            _registry.append((cls,attr,func,name))
+            if ENABLED:
+                setattr(cls,attr,_wrap(func,name))
+    finally:
+        _lock.release()
+    return cls
+
+def count(**counters):
+    """
+    Add to the counters of every instrumented operation in progress in this thread.  Callers should
+    check ENABLED first, so that nothing is done when instrumentation is off.
+    @param counters: Any of the names in COUNTERS, with the amount to add.
+    """
+    op = getattr(_local,'current',None)
+    while op is not None:
+        for key,value in counters.items():
+            op.counters[key] += value
+        op = op.parent
+
+def recordArray(array):
+    """
+    Note the size of an array allocated by the current operations, which keep the largest as their
+    peak_array_bytes.
+    @param array: numpy array (anything with an nbytes attribute).
+    """
+    nbytes = getattr(array,'nbytes',0)
+    op = getattr(_local,'current',None)
+    while op is not None:
+        if nbytes > op.peak_array_bytes:
+            op.peak_array_bytes = nbytes
+        op = op.parent
+
+def _wrap(func,name):
+    @functools.wraps(func)
+    def wrapper(*args,**kwargs):
+        return _call(name,func,args,kwargs)
+    return wrapper
+
+def _call(name,func,args,kwargs):
+    op = Operation(name)
+    op.parent = getattr(_local,'current',None)
+    _local.current = op
+    t1 = time.time()
+    try:
+        result = func(*args,**kwargs)
+        #grid methods leave their results in griddata
+        if len(args) and hasattr(args[0],'griddata'):
+            recordArray(args[0].griddata)
+        recordArray(result)
+    finally:
+        op.seconds = time.time()-t1
+        _local.current = op.parent
+        for listener in list(_listeners):
+            listener(op)
+    return result
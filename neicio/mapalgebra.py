@@ -0,0 +1,616 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import os.path
+import struct
+
+#third party imports
+import numpy as np
+
+#local imports
+from grid import Grid
+from geodict import GeoDict
+from gridwindow import planWindow,GridWindowError
+
+#target size of the strips expressions are evaluated in
+STRIP_BYTES = 16*1024*1024
+
+#geodicts whose corners and resolutions differ by less than this fraction of a cell are aligned
+ALIGN_TOLERANCE = 1e-4
+
+class MapAlgebraError(Exception):
+    "used to indicate an error in map algebra expressions"
+    def __str__(self):
+        return repr(self.args[0])
+
+class Expression(object):
+    """
+    Lazy, cell-by-cell expression over aligned grids.
+
+    Arithmetic, comparison and logical operators, numpy ufuncs (np.log(expr), np.minimum(a,b)),
+    where() and apply() build an expression graph instead of computing anything.  The graph is
+    evaluated strip by strip (a band of rows at a time) by compute(), save() and the reductions
+    (sum(), min(), max(), mean()), so no full-size intermediate grid is ever allocated.
+    example:
+    pop = lazy('landscan.bil')                  #read from disk, a strip at a time
+    mmi = lazy(shakegrid)                       #already resampled to the population grid
+    deaths = pop * apply(fatalityRate,mmi) * 0.8
+    print deaths.sum()
+    deaths.save('deaths.bil')
+    """
+    #make numpy hand binary operations with arrays to us, rather than broadcasting over us
+    __array_priority__ = 1000
+
+    geodict = None
+
+    def getGeoDict(self):
+        """
+        Return the geodict shared by all of the grids in this expression.
+        """
+        return self.geodict
+
+    def getSources(self):
+        """
+        Return the grid sources (leaves) of this expression.
+        """
+        sources = []
+        for child in self.getChildren():
+            for source in child.getSources():
+                if not [s for s in sources if s is source]:
+                    sources.append(source)
+        return sources
+
+    def getChildren(self):
+        return []
+
+    def evaluate(self,row1,row2,memo):
+        """
+        Evaluate the expression for a strip of rows.
+        @param row1: First row of the strip.
+        @param row2: Row after the last row of the strip.
+        @param memo: Dictionary of results already computed for this strip, keyed by node, with the
+                     reference counts of the nodes (by id) under the key None.
+        @return: Tuple of (array,owned), where owned is True when the array is a temporary that the
+                 caller may overwrite.
+        """
+        raise NotImplementedError('evaluate() must be implemented by subclasses')
+
+    def getStripRows(self,stripbytes=STRIP_BYTES):
+        """
+        Return the number of rows in each strip, so that a strip of float64 values is about stripbytes long.
+        """
+        return max(1,int(stripbytes/(8*self.geodict['ncols'])))
+
+    def iterStrips(self,stripbytes=STRIP_BYTES):
+        """
+        Evaluate the expression strip by strip.
+        @keyword stripbytes: Approximate size of each strip of results, in bytes.
+        @return: Generator of (row1,row2,array) tuples, where array holds rows row1 to row2-1.
+        """
+        for row1,row2,strips in iterStrips([self],stripbytes):
+            yield (row1,row2,strips[0])
+
+    def compute(self,stripbytes=STRIP_BYTES,dtype=None):
+        """
+        Evaluate the whole expression into a new Grid.
+        @keyword stripbytes: Approximate size of each strip, in bytes.
+        @keyword dtype: Data type of the output array.  Defaults to the type of the first strip.
+        @return: Grid object holding the results, with this expression's geodict.
+        """
+        griddata = None
+        for row1,row2,data in self.iterStrips(stripbytes):
+            if griddata is None:
+                if dtype is None:
+                    dtype = data.dtype
+                griddata = np.empty((self.geodict['nrows'],self.geodict['ncols']),dtype=dtype)
+            griddata[row1:row2] = data
+        grid = Grid()
+        grid.geodict = GeoDict(self.geodict,nbands=1,bandnames=['Expression'])
+        grid.griddata = griddata
+        return grid
+
+    def save(self,filename,stripbytes=STRIP_BYTES):
+        """
+        Evaluate the expression into a float32 ESRI grid file (with .hdr file), a strip at a time.
+        @param filename: Output grid file name (i.e., deaths.bil or deaths.flt).
+        @keyword stripbytes: Approximate size of each strip, in bytes.
+        """
+        f = open(filename,'wb')
+        try:
+            for row1,row2,data in self.iterStrips(stripbytes):
+                data.astype('<f4').tofile(f)
+        finally:
+            f.close()
+        hdrfile = os.path.splitext(filename)[0]+'.hdr'
+        f = open(hdrfile,'wt')
+        f.write('byteorder I\n')
+        f.write('layout bil\n')
+        f.write('nrows %i\n' % self.geodict['nrows'])
+        f.write('ncols %i\n' % self.geodict['ncols'])
+        f.write('nbands 1\n')
+        f.write('nbits 32\n')
+        f.write('pixeltype float\n')
+        f.write('ulxmap %.10f\n' % self.geodict['xmin'])
+        f.write('ulymap %.10f\n' % self.geodict['ymax'])
+        f.write('xdim %.10f\n' % self.geodict['xdim'])
+        f.write('ydim %.10f\n' % self.geodict['ydim'])
+        f.close()
+
+    def sum(self,stripbytes=STRIP_BYTES):
+        """Return the sum of all non-NaN cells, evaluated a strip at a time."""
+        return self.__reduce(np.nansum,lambda a,b: a+b,stripbytes)
+
+    def min(self,stripbytes=STRIP_BYTES):
+        """Return the minimum of all non-NaN cells, evaluated a strip at a time."""
+        return self.__reduce(np.nanmin,min,stripbytes)
+
+    def max(self,stripbytes=STRIP_BYTES):
+        """Return the maximum of all non-NaN cells, evaluated a strip at a time."""
+        return self.__reduce(np.nanmax,max,stripbytes)
+
+    def count(self,stripbytes=STRIP_BYTES):
+        """Return the number of non-NaN (and, for boolean expressions, True) cells."""
+        def countStrip(data):
+            if data.dtype == np.bool_:
+                return np.count_nonzero(data)
+            return np.count_nonzero(~np.isnan(data))
+        return self.__reduce(countStrip,lambda a,b: a+b,stripbytes)
+
+    def mean(self,stripbytes=STRIP_BYTES):
+        """Return the mean of all non-NaN cells."""
+        return self.sum(stripbytes)/float(self.count(stripbytes))
+
+    def __reduce(self,stripfunc,combine,stripbytes):
+        result = None
+        for row1,row2,data in self.iterStrips(stripbytes):
+            if data.dtype != np.bool_ and np.isnan(data).all():
+                continue
+            value = stripfunc(data)
+            if result is None:
+                result = value
+            else:
+                result = combine(result,value)
+        if result is None:
+            return np.nan
+        return result
+
+    def __add__(self,other): return Apply(np.add,self,other)
+    def __radd__(self,other): return Apply(np.add,other,self)
+    def __sub__(self,other): return Apply(np.subtract,self,other)
+    def __rsub__(self,other): return Apply(np.subtract,other,self)
+    def __mul__(self,other): return Apply(np.multiply,self,other)
+    def __rmul__(self,other): return Apply(np.multiply,other,self)
+    def __div__(self,other): return Apply(np.true_divide,self,other)
+    def __rdiv__(self,other): return Apply(np.true_divide,other,self)
+    __truediv__ = __div__
+    __rtruediv__ = __rdiv__
+    def __pow__(self,other): return Apply(np.power,self,other)
+    def __rpow__(self,other): return Apply(np.power,other,self)
+    def __neg__(self): return Apply(np.negative,self)
+    def __abs__(self): return Apply(np.absolute,self)
+    def __lt__(self,other): return Apply(np.less,self,other)
+    def __le__(self,other): return Apply(np.less_equal,self,other)
+    def __gt__(self,other): return Apply(np.greater,self,other)
+    def __ge__(self,other): return Apply(np.greater_equal,self,other)
+    def __eq__(self,other): return Apply(np.equal,self,other)
+    def __ne__(self,other): return Apply(np.not_equal,self,other)
+    def __and__(self,other): return Apply(np.logical_and,self,other)
+    def __rand__(self,other): return Apply(np.logical_and,other,self)
+    def __or__(self,other): return Apply(np.logical_or,self,other)
+    def __ror__(self,other): return Apply(np.logical_or,other,self)
+    def __invert__(self): return Apply(np.logical_not,self)
+
+    #__eq__ is overloaded, so expressions are hashed (as memo keys) by identity
+    def __hash__(self):
+        return id(self)
+
+    def __array_ufunc__(self,ufunc,method,*inputs,**kwargs):
+        #np.log(expr), np.maximum(expr,0), etc.
+        if method != '__call__' or kwargs or ufunc.nout != 1:
+            return NotImplemented
+        return Apply(ufunc,*inputs)
+
+class GridSource(Expression):
+    """
+    Expression leaf wrapping an in-memory Grid object.
+    """
+    def __init__(self,grid):
+        """
+        @param grid: Any Grid object with 2D griddata.
+        """
+        if np.ndim(grid.griddata) != 2:
+            raise MapAlgebraError('Only 2D grids can be used in expressions')
+        self.grid = grid
+        self.geodict = _getGeoDict(grid.geodict,grid.griddata.shape)
+
+    def getSources(self):
+        return [self]
+
+    def evaluate(self,row1,row2,memo):
+        return (self.grid.griddata[row1:row2],False)
+
+class EsriSource(Expression):
+    """
+    Expression leaf reading an ESRI grid file (see EsriGrid), or a window of one, a strip at a time
+    through a memory map.  Values are float64, with NaN for nodata cells.
+    """
+    def __init__(self,gridfilename,bounds=None):
+        """
+        @param gridfilename: Valid path to ESRI grid file (with .hdr file, or world file).
+        @keyword bounds: Optional tuple of (xmin,xmax,ymin,ymax) - only the cells EsriGrid.load() would
+                         read with these bounds are used.  xmin > xmax means the window crosses the meridian.
+        """
+        from esri import EsriGrid
+        header = EsriGrid(gridfilename).getHeader()
+        nrows = int(header['nrows'])
+        ncols = int(header['ncols'])
+        dtype = np.dtype(header['precision'])
+        if header['byteorder'] == 'b':
+            dtype = dtype.newbyteorder('>')
+        else:
+            dtype = dtype.newbyteorder('<')
+        self.nodata = header['nodata']
+        self.data = np.memmap(gridfilename,dtype=dtype,mode='r',offset=int(header['skip']),shape=(nrows,ncols))
+        xdim,ydim = header['xdim'],header['ydim']
+        geodict = {'nrows':nrows,'ncols':ncols,'xdim':xdim,'ydim':ydim,
+                   'xmin':header['ulxmap'],'xmax':header['ulxmap']+(ncols-1)*xdim,
+                   'ymin':header['ulymap']-(nrows-1)*ydim,'ymax':header['ulymap']}
+        if bounds is not None:
+            bymin,bymax = bounds[2:]
+            if max(bymin,geodict['ymin']) >= min(bymax,geodict['ymax']):
+                raise MapAlgebraError('Latitude minimum (%f) is greater than latitude maximum (%f)' % (bymin,bymax))
+        try:
+            self.window = planWindow(geodict,bounds)
+        except GridWindowError as error:
+            raise MapAlgebraError(error.args[0])
+        self.geodict = self.window.geodict
+
+    def getSources(self):
+        return [self]
+
+    def evaluate(self,row1,row2,memo):
+        data = self.window.read(self.data,rows=(row1,row2),dtype=np.float64)
+        if self.nodata is not None:
+            data[data == self.nodata] = np.nan
+        return (data,True)
+
+class GMTSource(Expression):
+    """
+    Expression leaf reading a GMT grid file (native or netcdf, see GMTGrid) a strip at a time, through
+    a memory map.  Values are float64.
+    """
+    def __init__(self,grdfile,fmt='f'):
+        """
+        @param grdfile: Valid path to GMT grid file.
+        @keyword fmt: Data type of native files (see GMTGrid).
+        """
+        f = open(grdfile,'rb')
+        header = f.read(92)
+        f.close()
+        offset = struct.unpack('I',header[8:12])[0]
+        self.cdf = None
+        if offset in [0,1]:
+            #native file: header then rows of data, as read by GMTGrid
+            ncols,nrows = struct.unpack('2I',header[0:8])
+            xmin,xmax,ymin,ymax,zmin,zmax,xdim,ydim,zscale,zoffset = struct.unpack('10d',header[12:92])
+            dtypes = {'i':np.int16,'l':np.int32,'f':np.float32,'d':np.float64}
+            self.data = np.memmap(grdfile,dtype=dtypes[fmt],mode='r',offset=892,shape=(nrows,ncols))
+            self.flip = False
+            self.zscale = zscale
+            self.zoffset = zoffset
+            #the extent in the header is for the grid edges
+            self.geodict = {'nrows':nrows,'ncols':ncols,'xdim':xdim,'ydim':ydim,
+                            'xmin':xmin+xdim/2.0,'xmax':xmax-xdim/2.0,
+                            'ymin':ymin+ydim/2.0,'ymax':ymax-ydim/2.0}
+        else:
+            from scipy.io import netcdf
+            self.cdf = netcdf.netcdf_file(grdfile,mmap=True)
+            names = self.cdf.variables.keys()
+            if 'x' in names:
+                xvar,yvar = self.cdf.variables['x'].data,self.cdf.variables['y'].data
+            elif 'lon' in names:
+                xvar,yvar = self.cdf.variables['lon'].data,self.cdf.variables['lat'].data
+            else:
+                raise MapAlgebraError('Only COARDS-compliant netcdf files with x/y or lon/lat variables are supported')
+            #rows are stored from the bottom up
+            self.data = self.cdf.variables['z'].data
+            self.flip = True
+            self.zscale = 1.0
+            self.zoffset = 0.0
+            nrows,ncols = self.data.shape
+            self.geodict = {'nrows':nrows,'ncols':ncols,
+                            'xmin':float(xvar.min()),'xmax':float(xvar.max()),
+                            'ymin':float(yvar.min()),'ymax':float(yvar.max()),
+                            'xdim':float(np.mean(np.diff(xvar))),'ydim':float(np.mean(np.diff(yvar)))}
+
+    def getSources(self):
+        return [self]
+
+    def evaluate(self,row1,row2,memo):
+        if self.flip:
+            nrows = self.geodict['nrows']
+            data = self.data[nrows-row2:nrows-row1][::-1].astype(np.float64)
+        else:
+            data = self.data[row1:row2].astype(np.float64)
+        if self.zscale != 1.0 or self.zoffset != 0.0:
+            data *= self.zscale
+            data += self.zoffset
+        return (data,True)
+
+class Resampled(Expression):
+    """
+    Expression leaf sampling a (usually coarser) in-memory Grid at the cells of another geodict, a strip
+    at a time, so that the resampled grid is never held in memory.  Linear sampling is bilinear between
+    the four surrounding cells, which matches Grid.interpolateToGrid() on grids without NaN values; NaN
+    cells spread to the samples around them.  Samples outside the grid are NaN.
+    """
+    def __init__(self,grid,geodict,method='linear'):
+        """
+        @param grid: Any Grid object with 2D griddata.
+        @param geodict: geodict dictionary of the cells to sample.
+        @keyword method: 'linear' or 'nearest'.
+        @raise MapAlgebraError: When the method is not supported.
+        """
+        if method not in ['linear','nearest']:
+            raise MapAlgebraError('Unsupported resampling method %s - choose linear or nearest' % method)
+        if np.ndim(grid.griddata) != 2:
+            raise MapAlgebraError('Only 2D grids can be used in expressions')
+        self.grid = grid
+        self.geodict = _getGeoDict(geodict,(geodict['nrows'],geodict['ncols']))
+        nrows,ncols = grid.griddata.shape
+        if nrows < 2 or ncols < 2:
+            method = 'nearest'
+        self.method = method
+        gdict = grid.geodict
+        lons = geodict['xmin'] + np.arange(0,geodict['ncols'])*geodict['xdim']
+        dx = lons - gdict['xmin']
+        #sample longitudes on the other side of the meridian from the grid's left edge
+        dx[dx < -gdict['xdim']/2.0] += 360
+        self.cols,self.colweights,self.colvalid = self.__getIndices(dx/gdict['xdim'],ncols)
+
+    def getSources(self):
+        return [self]
+
+    def __getIndices(self,fractional,n):
+        #first of the two surrounding cells (or nearest cell), and the weight of the second
+        valid = (fractional > -ALIGN_TOLERANCE) & (fractional < n-1+ALIGN_TOLERANCE)
+        if self.method == 'nearest':
+            index = np.clip(np.round(fractional),0,n-1).astype(np.intp)
+            return (index,None,valid)
+        index = np.clip(np.floor(fractional),0,n-2).astype(np.intp)
+        weight = np.clip(fractional-index,0.0,1.0)
+        return (index,weight,valid)
+
+    def evaluate(self,row1,row2,memo):
+        gdict = self.grid.geodict
+        griddata = self.grid.griddata
+        lats = self.geodict['ymax'] - np.arange(row1,row2)*self.geodict['ydim']
+        rows,rowweights,rowvalid = self.__getIndices((gdict['ymax']-lats)/gdict['ydim'],griddata.shape[0])
+        if self.method == 'nearest':
+            data = griddata[rows][:,self.cols].astype(np.float64)
+        else:
+            #interpolate the few grid rows this strip needs across, then down
+            first = rows.min()
+            band = griddata[first:rows.max()+2]
+            across = band[:,self.cols].astype(np.float64)
+            across += (band[:,self.cols+1]-across)*self.colweights
+            down = np.diff(across,axis=0)
+            rows = rows-first
+            data = across[rows]
+            data += down[rows]*rowweights.reshape(-1,1)
+        data[~rowvalid] = np.nan
+        data[:,~self.colvalid] = np.nan
+        return (data,True)
+
+class Apply(Expression):
+    """
+    Expression node applying a function (a numpy ufunc, or any function that works cell by cell on
+    arrays) to the strips of one or more expressions, arrays or scalars.
+    """
+    def __init__(self,func,*args):
+        """
+        @param func: Function taking as many array arguments as there are args, and returning an
+                     array of the same shape.
+        @param args: Expressions, Grid objects, or scalars.
+        """
+        self.func = func
+        self.args = [_asNode(arg) for arg in args]
+        self.geodict = _getSharedGeoDict(self.args)
+
+    def getChildren(self):
+        return [arg for arg in self.args if isinstance(arg,Expression)]
+
+    def evaluate(self,row1,row2,memo):
+        values = []
+        for arg in self.args:
+            if isinstance(arg,Expression):
+                values.append(_evaluate(arg,row1,row2,memo))
+            else:
+                values.append((arg,False))
+        result = self.call(values)
+        return (result,isinstance(result,np.ndarray))
+
+    def call(self,values):
+        """
+        Apply the function to the evaluated arguments.
+        @param values: List of (value,owned) tuples, as returned by evaluate().
+        @return: Result array.
+        """
+        if isinstance(self.func,np.ufunc) and self.func.nout == 1:
+            #write into a temporary argument when the result would fit in it
+            args = [value for value,owned in values]
+            temps = [value for value,owned in values if owned]
+            if temps:
+                shape = np.broadcast(*args).shape
+                dtype = self.func(*[_empty(arg) for arg in args]).dtype
+                for value in temps:
+                    if value.shape == shape and value.dtype == dtype:
+                        return self.func(*args,out=value)
+            return self.func(*args)
+        return self.func(*[value for value,owned in values])
+
+def iterStrips(expressions,stripbytes=STRIP_BYTES):
+    """
+    Evaluate several aligned expressions together, strip by strip.  Nodes they share are only
+    evaluated once per strip.
+    @param expressions: List of expressions, Grid objects or grid file names.
+    @keyword stripbytes: Approximate size of each strip of results (for one expression), in bytes.
+    @return: Generator of (row1,row2,arrays) tuples, where arrays holds rows row1 to row2-1 of each
+             expression.  The arrays may be views of the source grids, so must not be modified.
+    @raise MapAlgebraError: When the expressions are not aligned.
+    """
+    nodes = [lazy(expression) for expression in expressions]
+    geodict = _getSharedGeoDict(nodes)
+    nrows,ncols = geodict['nrows'],geodict['ncols']
+    nstrip = nodes[0].getStripRows(stripbytes)
+    refs = _countReferences(nodes)
+    for row1 in range(0,nrows,nstrip):
+        row2 = min(nrows,row1+nstrip)
+        memo = {None:refs}
+        strips = []
+        for node in nodes:
+            data,owned = _evaluate(node,row1,row2,memo)
+            strips.append(_toStrip(data,row2-row1,ncols))
+        yield (row1,row2,strips)
+
+def where(condition,x,y):
+    """
+    Lazy equivalent of numpy.where(condition,x,y).
+    @param condition: Boolean expression (or grid or scalar).
+    @param x: Value where condition is True - expression, grid or scalar.
+    @param y: Value where condition is False - expression, grid or scalar.
+    @return: Expression.
+    """
+    return Apply(np.where,condition,x,y)
+
+def apply(func,*args):
+    """
+    Lazily apply a cell-by-cell function (for example, a fatality rate as a function of MMI) to
+    expressions, grids or scalars.
+    @param func: Function of as many arrays as there are args, returning an array of the same shape.
+    @param args: Expressions, Grid objects, grid file names or scalars.
+    @return: Expression.
+    """
+    return Apply(func,*args)
+
+def resample(grid,geodict,method='linear'):
+    """
+    Lazily resample a Grid to the cells of another geodict (see Resampled).
+    example:
+    pop = EsriSource('landscan.bil',bounds=(xmin,xmax,ymin,ymax))
+    mmi = resample(shakegrid,pop.getGeoDict())
+    (pop*(mmi > 6)).sum() #population exposed to MMI 6.5 and up
+    @param grid: Any Grid object with 2D griddata.
+    @param geodict: geodict dictionary of the cells to sample.
+    @keyword method: 'linear' or 'nearest'.
+    @return: Expression.
+    """
+    return Resampled(grid,geodict,method=method)
+
+def lazy(source,fmt='f'):
+    """
+    Turn a Grid, or a grid file, into an expression.
+    @param source: A Grid object, a GMT grid file name (.grd), or an ESRI grid file name (any other extension).
+    @keyword fmt: Data type of native GMT files (see GMTGrid).
+    @return: Expression.
+    @raise MapAlgebraError: When source cannot be used in an expression.
+    """
+    if isinstance(source,Expression):
+        return source
+    if isinstance(source,Grid):
+        return GridSource(source)
+    if isinstance(source,basestring):
+        if os.path.splitext(source)[1].lower() == '.grd':
+            return GMTSource(source,fmt=fmt)
+        return EsriSource(source)
+    raise MapAlgebraError('Cannot make an expression from %s' % type(source))
+
+def _asNode(value):
+    if isinstance(value,(Expression,Grid,basestring)):
+        return lazy(value)
+    if isinstance(value,np.ndarray) and value.ndim > 1:
+        raise MapAlgebraError('Arrays must be wrapped in a Grid to be used in expressions')
+    return value
+
+def _getGeoDict(geodict,shape):
+    nrows,ncols = shape
+    keys = ['xmin','xmax','ymin','ymax','xdim','ydim']
+    gdict = dict([(key,geodict[key]) for key in keys])
+    gdict['nrows'] = nrows
+    gdict['ncols'] = ncols
+    return gdict
+
+def _getSharedGeoDict(args):
+    geodict = None
+    for arg in args:
+        if not isinstance(arg,Expression):
+            continue
+        if geodict is None:
+            geodict = arg.geodict
+        elif not isAligned(geodict,arg.geodict):
+            raise MapAlgebraError('Grids in an expression must share the same geodict (%s vs %s)' %
+                                  (_describe(geodict),_describe(arg.geodict)))
+    if geodict is None:
+        raise MapAlgebraError('An expression needs at least one grid')
+    return geodict
+
+def isAligned(geodict1,geodict2):
+    """
+    Check whether two geodicts describe the same grid cells.
+    @param geodict1: geodict dictionary.
+    @param geodict2: geodict dictionary.
+    @return: True if the grids have the same shape, and their corners and resolutions agree to within
+             ALIGN_TOLERANCE of a cell.
+    """
+    if geodict1['nrows'] != geodict2['nrows'] or geodict1['ncols'] != geodict2['ncols']:
+        return False
+    xtol = geodict1['xdim']*ALIGN_TOLERANCE
+    ytol = geodict1['ydim']*ALIGN_TOLERANCE
+    for key,tol in [('xmin',xtol),('xdim',xtol),('ymax',ytol),('ydim',ytol)]:
+        if abs(geodict1[key]-geodict2[key]) > tol:
+            return False
+    return True
+
+def _countReferences(nodes):
+    #how many times each node is used, keyed by node id
+    refs = {}
+    stack = []
+    for node in nodes:
+        refs[id(node)] = refs.get(id(node),0)+1
+        if refs[id(node)] == 1:
+            stack.append(node)
+    while stack:
+        node = stack.pop()
+        for child in node.getChildren():
+            refs[id(child)] = refs.get(id(child),0)+1
+            #only descend the first time a shared node is seen
+            if refs[id(child)] == 1:
+                stack.append(child)
+    return refs
+
+def _evaluate(node,row1,row2,memo):
+    #evaluate a node for a strip, only once if it is used more than once
+    if node in memo:
+        return (memo[node],False)
+    data,owned = node.evaluate(row1,row2,memo)
+    #results used by more than one node are kept for the others, and must not be overwritten
+    if memo.get(None,{}).get(id(node),1) > 1:
+        memo[node] = data
+        return (data,False)
+    return (data,owned)
+
+def _describe(geodict):
+    return '%ix%i at (%g,%g)' % (geodict['nrows'],geodict['ncols'],geodict['xmin'],geodict['ymax'])
+
+def _empty(value):
+    #zero-size stand-in, used to find the type of a ufunc's result
+    if isinstance(value,np.ndarray):
+        return value[:0,:0]
+    return value
+
+def _toStrip(data,nrows,ncols):
+    #scalar (or broadcast) results still fill the strip
+    data = np.asarray(data)
+    if data.shape != (nrows,ncols):
+        data = np.broadcast_to(data,(nrows,ncols))
+    return data
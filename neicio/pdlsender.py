@@ -3,6 +3,8 @@
 #stdlib imports
 import os.path
 import tempfile
+import shutil
+from multiprocessing.pool import ThreadPool
 
 #third party
 from neicio.cmdoutput import getCommandOutput
@@ -17,14 +19,58 @@ from sender import Sender,SenderError
 
 class PDLSender(Sender):
     required_properties = ['jarfile','source','type','keyfile','configfile','code']
-    def send(self):
+    def send(self,batch=True):
+        """
+        Send a PDL product.
+        @keyword batch: If True (the default), all of the files in filesToSend are linked (or, where links
+                        can't be made, copied) into a temporary directory and sent in one Java invocation
+                        with --directory.  If False, each file is sent in its own invocation.
+        @return: Number of files sent.
+        @raise SenderError: When required properties or files are missing, or the PDL command fails.
+        """
         #is it possible to send a directory and a file in the same command?
         #let's assume it isn't
         if self.filesToSend is not None and self.directoryToSend is not None:
             raise SenderError('For PDL, you must choose files OR a directory to send, not both')
+        cmd = self.getCommand()
+        nfiles = 0
+        #pdl can be used to send information without sending any files
+        if self.directoryToSend is None and self.filesToSend is None:
+            #this is ok - PDL products can be defined completely on the command line
+            retcode,stdout,stderr = getCommandOutput(cmd)
+            if not retcode:
+                raise SenderError('Could not send directory "%s" due to error "%s"' % (self.directoryToSend,stdout+stderr))
+        if self.directoryToSend is not None:
+            nfiles += self.__sendDirectory(cmd,self.directoryToSend,'directory "%s"' % self.directoryToSend)
+        elif self.filesToSend is not None and batch:
+            names = [os.path.basename(f) for f in self.filesToSend]
+            if len(set(names)) != len(names):
+                raise SenderError('Files to send in one PDL product must have unique names')
+            tmpdir = tempfile.mkdtemp()
+            try:
+                for f in self.filesToSend:
+                    _stageFile(f,tmpdir)
+                nfiles += self.__sendDirectory(cmd,tmpdir,'files "%s"' % ','.join(self.filesToSend))
+            finally:
+                shutil.rmtree(tmpdir)
+        elif self.filesToSend is not None:
+            for f in self.filesToSend:
+                filecmd = cmd + '--file=%s ' % f
+                retcode,stdout,stderr = getCommandOutput(filecmd)
+                if not retcode:
+                    raise SenderError('PDL command: "%s"\nCould not send file "%s" due to error "%s"' % (filecmd,f,stdout+stderr))
+                nfiles += 1
+        return nfiles
+
+    def getCommand(self):
+        """
+        Build the PDL command line (without any --file or --directory options) from the properties.
+        @return: Command line string.
+        @raise SenderError: When required properties, files, or the Java binary are missing.
+        """
         for prop in self.required_properties:
             if prop not in self.properties.keys():
-                raise SenderError('"%s" property must be supplied to send via PDL')
+                raise SenderError('"%s" property must be supplied to send via PDL' % prop)
         jarfile = self.properties['jarfile']
         source = self.properties['source']
         ptype = self.properties['type']
@@ -44,7 +90,7 @@ class PDLSender(Sender):
         basecmd = '%s -jar %s --send --source=%s --type=%s --privateKey=%s --configFile=%s --code=%s ' % (javabin,jarfile,source,ptype,keyfile,configfile,code)
         nuggets = []
         for key,value in self.properties.iteritems():
-            if key in self.required_properties:
+            if key in self.required_properties or key == 'manifest':
                 continue
             if isinstance(value,int):
                 vstr = '%i' % value
@@ -53,29 +99,20 @@ class PDLSender(Sender):
             else:
                 vstr = value
             nuggets.append('--%s=%s' % (key,vstr))
-        cmd = basecmd + ' '.join(nuggets) + ' '
-        nfiles = 0
-        #pdl can be used to send information without sending any files
-        if self.directoryToSend is None and self.filesToSend is None:
-            #this is ok - PDL products can be defined completely on the command line
-            retcode,stdout,stderr = getCommandOutput(cmd)
-            if not retcode:
-                raise SenderError('Could not send directory "%s" due to error "%s"' % (self.directoryToSend,stdout+stderr))
-        if self.directoryToSend is not None:
-            cmd = cmd + '--directory=%s ' % self.directoryToSend
-            retcode,stdout,stderr = getCommandOutput(cmd)
-            if not retcode:
-                raise SenderError('Could not send directory "%s" due to error "%s"' % (self.directoryToSend,stdout+stderr))
-            nfiles += len(os.walk(self.directoryToSend).next()[2])
-        elif self.filesToSend is not None:
-            for f in self.filesToSend:
-                cmd = cmd + '--file=%s ' % f
-                retcode,stdout,stderr = getCommandOutput(cmd)
-                if not retcode:
-                    raise SenderError('PDL command: "%s"\nCould not send file "%s" due to error "%s"' % (cmd,f,stdout+stderr))
-                nfiles += 1
-        return nfiles
-        
+        return basecmd + ' '.join(nuggets) + ' '
+
+    def __sendDirectory(self,cmd,directory,description):
+        cmd = cmd + '--directory=%s ' % directory
+        retcode,stdout,stderr = getCommandOutput(cmd)
+        if not retcode:
+            raise SenderError('Could not send %s due to error "%s"' % (description,stdout+stderr))
+        return len(os.walk(directory).next()[2])
+
+    def getDestination(self):
+        #PDL products are sent whole, so incremental sends (see Sender.sendIncremental()) re-send the whole
+        #product whenever any of its files has changed
+        return 'pdl:%s/%s/%s' % (self.properties['source'],self.properties['type'],self.properties['code'])
+
     def findjava(self):
         javabin = None
         for p in os.environ['PATH'].split(':'):
@@ -85,5 +122,104 @@ class PDLSender(Sender):
                 break
         return javabin
 
-                              
+def sendProducts(senders,nprocesses=4):
+    """
+    Send several PDL products concurrently.
+    @param senders: List of PDLSender objects, one per product.
+    @keyword nprocesses: Maximum number of PDL (Java) processes to run at once.
+    @return: List of the number of files sent for each product.
+    @raise SenderError: When any of the products could not be sent (after all of them have been tried),
+                        with the error messages from all of the failed products.
+    """
+    def send(sender):
+        try:
+            return (sender.send(),None)
+        except SenderError,obj:
+            return (None,str(obj.value))
+    pool = ThreadPool(max(1,min(nprocesses,len(senders))))
+    try:
+        results = pool.map(send,senders)
+    finally:
+        pool.close()
+        pool.join()
+    errors = [error for nfiles,error in results if error is not None]
+    if len(errors):
+        raise SenderError('Could not send %i of %i products: %s' % (len(errors),len(senders),'\n'.join(errors)))
+    return [nfiles for nfiles,error in results]
+
+def _stageFile(filename,directory):
+    #link a file into a staging directory rather than copying it, falling back to a copy
+    #(i.e., on Windows, or across file systems)
+    target = os.path.join(directory,os.path.basename(filename))
+    for link in [getattr(os,'symlink',None),getattr(os,'link',None)]:
+        if link is None:
+            continue
+        try:
+            link(os.path.abspath(filename),target)
+            return
+        except OSError:
+            pass
+    shutil.copy2(filename,target)
+
+#stand-in for java, which records each invocation (and the directory it was asked to send) in a file
+STUB_JAVA = '''#!/bin/sh
+out=`mktemp "$(dirname "$0")/call.XXXXXX"`
+echo "$@" > "$out"
+for arg in "$@"; do
+    case "$arg" in
+        --code=fail) exit 1;;
+        --directory=*) ls -l "${arg#--directory=}" >> "$out";;
+    esac
+done
+'''
+
+def testBatch():
+    import glob
+    tmpdir = tempfile.mkdtemp()
+    path = os.environ['PATH']
+    try:
+        def write(filename,text):
+            f = open(os.path.join(tmpdir,filename),'wt')
+            f.write(text)
+            f.close()
+            return os.path.join(tmpdir,filename)
+        os.chmod(write('java',STUB_JAVA),0o755)
+        properties = {'jarfile':write('ProductClient.jar',''),'source':'us','type':'test',
+                      'keyfile':write('key',''),'configfile':write('config.ini',''),'code':'us1'}
+        files = [write('a.txt','a'),write('b.txt','b')]
+        os.environ['PATH'] = tmpdir + ':' + path
+        def getCalls():
+            calls = []
+            for callfile in glob.glob(os.path.join(tmpdir,'call.*')):
+                calls.append(open(callfile,'rt').read())
+                os.remove(callfile)
+            return calls
+        #batched: one invocation, with the files staged in a directory that is removed afterwards
+        assert(PDLSender(properties=dict(properties),filesToSend=files).send() == 2)
+        calls = getCalls()
+        assert(len(calls) == 1 and '--directory=' in calls[0] and ' a.txt' in calls[0] and ' b.txt' in calls[0])
+        stagedir = calls[0].split('--directory=')[1].split()[0]
+        assert(not os.path.exists(stagedir))
+        #one invocation per file
+        assert(PDLSender(properties=dict(properties),filesToSend=files).send(batch=False) == 2)
+        calls = getCalls()
+        assert(len(calls) == 2 and len([call for call in calls if '--file=' in call]) == 2)
+        #concurrent products, one of which fails
+        senders = []
+        for code in ['us1','us2','us3']:
+            senders.append(PDLSender(properties=dict(properties,code=code),filesToSend=files))
+        assert(sendProducts(senders,nprocesses=3) == [2,2,2])
+        assert(len(getCalls()) == 3)
+        senders.append(PDLSender(properties=dict(properties,code='fail'),filesToSend=files))
+        try:
+            sendProducts(senders,nprocesses=4)
+            assert(False)
+        except SenderError,obj:
+            assert('Could not send 1 of 4 products' in str(obj.value))
+        assert(len(getCalls()) == 4)
+    finally:
+        os.environ['PATH'] = path
+        shutil.rmtree(tmpdir)
 
+if __name__ == '__main__':
+    testBatch()
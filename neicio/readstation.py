@@ -3,7 +3,20 @@
 #stdlib imports
 import sys
 from xml.dom import minidom
-import urllib2
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+#third party imports
+import numpy as np
+
+#component amplitude fields, and the element names that hold them
+AMPFIELDS = ['pga','pgv','psa03','psa10','psa30']
+AMPTAGS = {'pga':'pga','acc':'pga','pgv':'pgv','vel':'pgv',
+           'psa03':'psa03','psa10':'psa10','psa30':'psa30'}
+STATIONDTYPE = np.dtype([('code',object),('station_name',object),('lat',np.float64),('lon',np.float64),
+                         ('intensity',np.float64),('name',object)]+[(f,np.float64) for f in AMPFIELDS])
 
 def readStation(stationfile):
     '''Read a ShakeMap station list file from disk or a url, return station coordinates and observed data.
@@ -21,6 +34,7 @@ def readStation(stationfile):
        - psa30 Array of station observed PSA 3.0 values
     '''
     if stationfile.startswith('http:'):
+        import urllib2
         fh = urllib2.urlopen(stationfile)
         data = fh.read()
         fh.close()
@@ -52,6 +66,75 @@ def readStation(stationfile):
     root.unlink()
     return compdict
 
+def readStationComponents(stationfile):
+    '''Read all station components from a ShakeMap station list file on disk or a url, in a single pass.
+    Input:
+     - stationfile - A string path to a file on disk, a URL, or a file-like object.
+
+    Output:
+     - numpy structured array with one record per station component (stations without components, like
+       DYFI entries, get one record with an empty component name), with fields:
+       - code Station code
+       - station_name Station name
+       - lat Station latitude
+       - lon Station longitude
+       - intensity Station intensity (NaN if missing)
+       - name Component name
+       - pga Component observed PGA value (from "pga" or "acc" elements, NaN if missing)
+       - pgv Component observed PGV value (from "pgv" or "vel" elements, NaN if missing)
+       - psa03 Component observed PSA 0.3 value (NaN if missing)
+       - psa10 Component observed PSA 1.0 value (NaN if missing)
+       - psa30 Component observed PSA 3.0 value (NaN if missing)
+
+    Elements are discarded as soon as each station has been read, so memory use is bounded by the output
+    rather than by the size of the document.
+    '''
+    fh = stationfile
+    if not hasattr(stationfile,'read'):
+        if stationfile.startswith('http:'):
+            import urllib2
+            fh = urllib2.urlopen(stationfile)
+        else:
+            fh = open(stationfile,'rb')
+    rows = []
+    nan = float('nan')
+    try:
+        #elements still open, so that each station can be removed from its parent once read
+        parents = []
+        for event,element in ElementTree.iterparse(fh,events=('start','end')):
+            if event == 'start':
+                parents.append(element)
+                continue
+            parents.pop()
+            if element.tag != 'station':
+                continue
+            station = (element.get('code',''),element.get('name',''),
+                       getFloat(element,'lat'),getFloat(element,'lon'),getFloat(element,'intensity'))
+            comps = element.findall('comp')
+            if not len(comps):
+                rows.append(station + ('',) + (nan,)*len(AMPFIELDS))
+            for comp in comps:
+                amps = dict.fromkeys(AMPFIELDS,nan)
+                for amp in comp:
+                    if amp.tag in AMPTAGS:
+                        amps[AMPTAGS[amp.tag]] = getFloat(amp,'value')
+                rows.append(station + (comp.get('name',''),) + tuple([amps[f] for f in AMPFIELDS]))
+            #throw away everything we've read so far
+            element.clear()
+            if len(parents):
+                del parents[-1][:]
+    finally:
+        if fh is not stationfile:
+            fh.close()
+    return np.array(rows,dtype=STATIONDTYPE)
+
+def getFloat(element,key):
+    try:
+        return float(element.get(key))
+    except (TypeError,ValueError):
+        return float('nan')
+
+
 if __name__ == '__main__':
     compdict = readStation(sys.argv[1])
     assert(len(compdict['lat']) == len(compdict['pga']))
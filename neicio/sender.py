@@ -3,6 +3,8 @@
 #stdlib imports
 import os.path
 import tempfile
+import hashlib
+import json
 
 # TODO 
 # - Add delete method
@@ -16,8 +18,15 @@ class SenderError(Exception):
     def __str__(self):
         return repr(self.value)
 
+MANIFEST_DIR = os.path.join(os.path.expanduser('~'),'.neicio','manifests')
+HASH_BLOCKSIZE = 1024*1024
+
 class Sender(object):
     '''Base class for concrete subclasses that wrap around different methods of transmitting files.
+
+    Incremental sending (see sendIncremental()) keeps a manifest of the content hashes of the files last
+    sent to each destination.  The manifest file can be set with the "manifest" property, and defaults
+    to a file in ~/.neicio/manifests named after the destination.
     '''
     def __init__(self,properties=None,filesToSend=None,directoryToSend=None):
         self.properties = properties
@@ -41,6 +50,131 @@ class Sender(object):
         pass
 
     #this is implemented in the subclasses
-    def delete(self):
+    def delete(self,files=None):
         pass
 
+    def getDestination(self):
+        '''Return a string identifying where files are sent to, used to name the default manifest file.
+        Subclasses should override this with the properties that identify their destination.
+        '''
+        properties = self.properties
+        if properties is None:
+            properties = {}
+        keys = sorted([key for key in properties.keys() if key not in ['password','manifest']])
+        return ','.join(['%s=%s' % (key,properties[key]) for key in keys])
+
+    def getLocalFiles(self):
+        '''Return the files that send() would transmit.
+        @return: List of (relative path,local path) tuples, where relative path is the '/' separated
+                 path of the file at the destination.  Files from directoryToSend are relative to the
+                 parent of that directory (i.e., they start with its name).
+        '''
+        localfiles = []
+        if self.filesToSend is not None:
+            for f in self.filesToSend:
+                localfiles.append((os.path.basename(f),f))
+        if self.directoryToSend is not None:
+            root = os.path.dirname(os.path.abspath(self.directoryToSend))
+            for path,subdirs,files in os.walk(self.directoryToSend):
+                relpath = os.path.relpath(os.path.abspath(path),root).split(os.sep)
+                for f in files:
+                    localfiles.append(('/'.join(relpath+[f]),os.path.join(path,f)))
+        return localfiles
+
+    def sendIncremental(self,deleteRemoved=False,verifyRemote=False):
+        '''Send only the files that are new or have changed since the last send to this destination.
+        @keyword deleteRemoved: Also delete (using delete()) files at the destination that were sent last
+                                time but are no longer among the local files.
+        @keyword verifyRemote: Re-send unchanged files whose size at the destination (see getRemoteSizes())
+                               does not match the local file.
+        @return: Number of files sent.
+        @raise SenderError: When sending or deleting fails.  The manifest is only updated after success.
+        '''
+        manifestfile = self.getManifestFile()
+        manifest = {}
+        if os.path.isfile(manifestfile):
+            f = open(manifestfile,'rt')
+            try:
+                manifest = json.load(f)
+            finally:
+                f.close()
+        localfiles = self.getLocalFiles()
+        newmanifest = {}
+        #changed files, in the order of localfiles, and the same as a set for quick lookups
+        changed = []
+        changedset = set()
+        for relpath,localfile in localfiles:
+            entry = self.__getFileEntry(localfile,manifest.get(relpath))
+            newmanifest[relpath] = entry
+            old = manifest.get(relpath)
+            if old is None or old['md5'] != entry['md5']:
+                changed.append(relpath)
+                changedset.add(relpath)
+        if verifyRemote:
+            unchanged = [relpath for relpath,localfile in localfiles if relpath not in changedset]
+            remotesizes = self.getRemoteSizes(unchanged)
+            for relpath in unchanged:
+                if remotesizes.get(relpath) != newmanifest[relpath]['size']:
+                    changed.append(relpath)
+        removed = [relpath for relpath in manifest.keys() if relpath not in newmanifest]
+        nfiles = 0
+        if len(changed):
+            nfiles = self.sendFiles(changed)
+        if deleteRemoved and len(removed):
+            self.delete(files=removed)
+        self.__saveManifest(manifestfile,newmanifest)
+        return nfiles
+
+    def sendFiles(self,relpaths):
+        '''Send a subset of the local files (see getLocalFiles()).
+        The default implementation sends everything with send(), which is what subclasses whose
+        products must be sent whole should do.
+        @param relpaths: List of relative paths of the files to send.
+        @return: Number of files sent.
+        '''
+        return self.send()
+
+    def getRemoteSizes(self,relpaths):
+        '''Return the sizes of files at the destination, where the transport can find them.
+        @param relpaths: List of relative paths (see getLocalFiles()).
+        @return: Dictionary of relative paths and sizes in bytes.  The default implementation can't find
+                 any sizes, and returns the local manifest sizes instead.
+        '''
+        relpaths = set(relpaths)
+        return dict([(relpath,os.path.getsize(localfile)) for relpath,localfile in self.getLocalFiles()
+                     if relpath in relpaths])
+
+    def getManifestFile(self):
+        if self.properties is not None and 'manifest' in self.properties:
+            return self.properties['manifest']
+        digest = hashlib.md5(self.getDestination().encode('utf-8')).hexdigest()
+        return os.path.join(MANIFEST_DIR,'%s.json' % digest)
+
+    def __getFileEntry(self,localfile,old):
+        #don't re-hash files whose size and modification time haven't changed
+        stat = os.stat(localfile)
+        if old is not None and old['size'] == stat.st_size and old['mtime'] == stat.st_mtime:
+            return old
+        md5 = hashlib.md5()
+        f = open(localfile,'rb')
+        try:
+            block = f.read(HASH_BLOCKSIZE)
+            while len(block):
+                md5.update(block)
+                block = f.read(HASH_BLOCKSIZE)
+        finally:
+            f.close()
+        return {'md5':md5.hexdigest(),'size':stat.st_size,'mtime':stat.st_mtime}
+
+    def __saveManifest(self,manifestfile,manifest):
+        manifestdir = os.path.dirname(os.path.abspath(manifestfile))
+        if not os.path.isdir(manifestdir):
+            os.makedirs(manifestdir)
+        #write to a temporary file and rename it, so an interrupted write can't corrupt the manifest
+        fd,tmpfile = tempfile.mkstemp(suffix='.json',dir=manifestdir)
+        f = os.fdopen(fd,'wt')
+        try:
+            json.dump(manifest,f)
+        finally:
+            f.close()
+        os.rename(tmpfile,manifestfile)
@@ -3,6 +3,8 @@ from numpy import *
 import xml.dom.minidom as minidom
 from xml.parsers.expat import ExpatError
 from grid import Grid
+from geodict import GeoDict
+import instrument
 import re
 import sys
 import datetime
@@ -13,6 +15,7 @@ class ShakeGridError(Exception):
     def __str__(self):
         return repr(self.args[0])
 
+@instrument.instrumentClass
 class ShakeGrid(Grid):
     """
     ShakeGrid encapsulates ShakeMap objects and allows access to data and metadata, 
@@ -22,6 +25,7 @@ class ShakeGrid(Grid):
     smgrid.load('grid.xml')
     griddata = smgrid.getData()
     """
+    @instrument.instrumented('shake.load')
     def __init__(self,shakefilename,variable=None):
         """Load shakemap or secondary hazards grid data from file.
         @param shakefilename: Path to valid ShakeMap/Secondary Hazards XML file OR file-like object.
@@ -69,6 +73,9 @@ class ShakeGrid(Grid):
         
         #read in grid values
         self.__loadGridData(shakefile,didx)
+        if instrument.ENABLED:
+            #the whole file is read once to sniff the grid type, then again to parse it
+            instrument.count(seeks=1,reads=2,bytes_read=len(data)+shakefile.tell())
 
         #close file object
         shakefile.close()
@@ -187,6 +194,7 @@ class ShakeGrid(Grid):
         self.geodict['time'] = smdict['event']['event_timestamp']
         #make the bandnames list 
         self.geodict['bandnames'] = [variable]
+        self.geodict = GeoDict(self.geodict)
 
     def getAttributes(self):
         """
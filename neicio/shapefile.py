@@ -7,10 +7,12 @@ from collections import OrderedDict
 import math
 
 #third party imports
-from mpl_toolkits.basemap import shapefile
 from numpy import array,concatenate,nan
 import numpy as np
 
+#local imports
+from shapereader import ShapeReader,ShapeReaderError
+
 def rectint(r1,r2):
     #rects are xmin,xmax,ymin,ymax
     c1 = r1[1] < r2[:,0]
@@ -88,23 +90,37 @@ class PagerShapeFile(object):
     # reader = None
     # bounds = None
     # shpfilename = None
-    shpdict = {1:'point',3:'line',5:'polygon',8:'multipoint'}
+    shpdict = {1:'point',3:'line',5:'polygon',8:'multipoint',
+               11:'point',13:'line',15:'polygon',18:'multipoint',
+               21:'point',23:'line',25:'polygon',28:'multipoint'}
     dbfdict = {'C':'string','N':'number','F':'float','D':'double'}
     # shapeType = None
     # nShapes = 0
     # attributes = OrderedDict()
     hasIndex = False
-    def __init__(self,shapefilename):
+    def __init__(self,shapefilename,backend='native'):
         """
         Construct a PagerShapeFile object.
         @param shapefile: Name of shape file (.shp).  Must be accompanied by .shx, .dbf files.
+        @keyword backend: Shapefile reader to use - 'native' (ShapeReader) or 'basemap' (basemap's pyshp Reader).
+        @raise IOError: When the shapefile cannot be read.
         """
-        try:
-            #force shapefilename to be ascii string - reader bombs on unicode
-            shapefilename = str(shapefilename)
-            self.reader = shapefile.Reader(shapefilename) 
-        except:
-            raise IOError, 'error reading shapefile %s.shp' % shapefile
+        #force shapefilename to be ascii string - reader bombs on unicode
+        shapefilename = str(shapefilename)
+        if backend == 'native':
+            try:
+                self.reader = ShapeReader(shapefilename)
+            except (ShapeReaderError,IOError,ValueError),msg:
+                raise IOError, 'error reading shapefile %s: %s' % (shapefilename,msg)
+        elif backend == 'basemap':
+            #basemap is slow to import, so only load it when it's asked for
+            from mpl_toolkits.basemap import shapefile
+            try:
+                self.reader = shapefile.Reader(shapefilename) 
+            except:
+                raise IOError, 'error reading shapefile %s' % shapefilename
+        else:
+            raise ValueError, 'backend must be one of native,basemap'
         self.shapefilename = shapefilename
         self.shapeType = self.shpdict[self.reader.shape(0).shapeType]
         self.bounds = (self.reader.bbox[0],self.reader.bbox[2],self.reader.bbox[1],self.reader.bbox[3])
@@ -117,6 +133,10 @@ class PagerShapeFile(object):
                 
 
     def getBoundingBoxes(self):
+        if hasattr(self.reader,'getBoundingBoxes'):
+            #the native reader gets these from the record headers, without reading any points
+            bboxes = self.reader.getBoundingBoxes()[:,[0,2,1,3]]
+            return [tuple(bbox) for bbox in bboxes.tolist()]
         bounding_boxes = []
         for shape in self.getShapes():
             bounding_boxes.append(shape['boundingbox'])
@@ -235,31 +255,18 @@ class PagerShapeFile(object):
         """
         shape = self.reader.shape(index)
         shapedict = {}
-        shapedict['geometry'] = self.shpdict[self.reader.shape(index).shapeType]
-        bbox = self.reader.shape(index).bbox
+        shapedict['geometry'] = self.shpdict[shape.shapeType]
+        bbox = shape.bbox
         shapedict['boundingbox'] = (bbox[0],bbox[2],bbox[1],bbox[3])
-        points = shape.points
-        parts = shape.parts
-        parts.append(len(points))
-        istart = parts[0]
-        xpoints = []
-        ypoints = []
-        for j in range(0,len(parts)-1):
-            if len(parts) == 1:
-                iend = len(points)
-            else:
-                iend = parts[j+1]
-            sx = [p[0] for p in points[istart:iend]]
-            sy = [p[1] for p in points[istart:iend]]
-            if len(xpoints):
-                xpoints = xpoints + [float('nan')] + sx
-                ypoints = ypoints + [float('nan')] + sy
-            else:
-                xpoints = xpoints + sx
-                ypoints = ypoints + sy
-        shapedict['x'] = array(xpoints)
-        shapedict['y'] = array(ypoints)
-        shapedict['nparts'] = len(shape.parts)
+        points = np.array(shape.points,dtype=np.float64).reshape((-1,2))
+        parts = list(getattr(shape,'parts',[]))
+        if not len(parts):
+            parts = [0]
+        #separate the parts with NaNs
+        breaks = [p for p in parts[1:] if p > 0 and p < len(points)]
+        shapedict['x'] = np.insert(points[:,0],breaks,nan)
+        shapedict['y'] = np.insert(points[:,1],breaks,nan)
+        shapedict['nparts'] = len(parts)
         try:
             record = self.reader.record(index)
         except:
@@ -301,6 +308,9 @@ class PagerShapeFile(object):
             raise LookupError, 'Field %s not in shapefile attributes: %s' % (field, str(keys))
         keyidx = keys.index(field)
         shapes = []
+        if hasattr(self.reader,'getColumn'):
+            indices = np.nonzero(self.reader.getColumn(field) == value)[0]
+            return [self.getShape(i) for i in indices.tolist()]
         for i in range(0,self.nShapes):
             record = self.reader.record(i)
             if record[keyidx] == value:
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import os.path
+import struct
+
+#third party imports
+import numpy as np
+
+#shape types, and which of them have parts, bounding boxes, Z and M values
+NULL = 0
+POINT = 1
+POLYLINE = 3
+POLYGON = 5
+MULTIPOINT = 8
+POINTZ = 11
+POLYLINEZ = 13
+POLYGONZ = 15
+MULTIPOINTZ = 18
+POINTM = 21
+POLYLINEM = 23
+POLYGONM = 25
+MULTIPOINTM = 28
+POINTTYPES = [POINT,POINTZ,POINTM]
+PARTTYPES = [POLYLINE,POLYGON,POLYLINEZ,POLYGONZ,POLYLINEM,POLYGONM]
+MULTIPOINTTYPES = [MULTIPOINT,MULTIPOINTZ,MULTIPOINTM]
+ZTYPES = [POINTZ,POLYLINEZ,POLYGONZ,MULTIPOINTZ]
+MTYPES = [POINTM,POLYLINEM,POLYGONM,MULTIPOINTM]
+
+#measures less than this are "no data"
+NODATA_M = -1e38
+
+class ShapeReaderError(Exception):
+    "used to indicate an error in ShapeReader"
+    def __str__(self):
+        return repr(self.args[0])
+
+class Shape(object):
+    """
+    One shape from a shapefile, with the same attributes as the basemap (pyshp) shapefile reader's shapes.
+    """
+    def __init__(self,shapeType,bbox=None,parts=None,points=None,z=None,m=None):
+        """
+        @param shapeType: Integer shape type (see POINT, POLYLINE, etc.)
+        @keyword bbox: List of [xmin,ymin,xmax,ymax].
+        @keyword parts: List of indices into points where each part starts.
+        @keyword points: (npoints,2) numpy array of x,y coordinates.
+        @keyword z: numpy array of Z values (Z types only).
+        @keyword m: numpy array of measures (M and Z types, when present), with NaN for no data.
+        """
+        self.shapeType = shapeType
+        self.bbox = bbox
+        self.parts = parts
+        self.points = points
+        self.z = z
+        self.m = m
+
+class ShapeReader(object):
+    """
+    Read ESRI shapefiles (.shp, .shx, .dbf) of point, multipoint, polyline and polygon shapes, and their
+    Z and M variants.
+
+    Record offsets come from the .shx index, and the .shp file is memory mapped, so opening a file
+    does not read its shapes.  Bounding boxes and attribute columns are decoded for all records at once.
+    example:
+    reader = ShapeReader('countries.shp')
+    bboxes = reader.getBoundingBoxes()
+    names = reader.getColumn('NAME')
+    shape = reader.shape(10)
+    """
+    def __init__(self,shapefilename):
+        """
+        Open a shapefile.
+        @param shapefilename: Name of .shp file (or the base name, without extension).  It must be
+                              accompanied by .shx and .dbf files.
+        @raise ShapeReaderError: When any of the files is missing or is not a shapefile.
+        """
+        base,ext = os.path.splitext(shapefilename)
+        if ext.lower() not in ['.shp','.shx','.dbf']:
+            base = shapefilename
+        self.shpfile = self.__findFile(base,'.shp')
+        self.shxfile = self.__findFile(base,'.shx')
+        self.dbffile = self.__findFile(base,'.dbf')
+
+        f = open(self.shpfile,'rb')
+        header = f.read(100)
+        f.close()
+        if len(header) < 100 or struct.unpack('>i',header[0:4])[0] != 9994:
+            raise ShapeReaderError('%s is not a shapefile' % self.shpfile)
+        self.shapeType = struct.unpack('<i',header[32:36])[0]
+        self.bbox = list(struct.unpack('<4d',header[36:68]))
+
+        #the .shx file is a header followed by (offset,length) pairs, in 16 bit words
+        index = np.fromfile(self.shxfile,dtype='>i4')[25:].reshape((-1,2))
+        self.offsets = index[:,0].astype(np.int64)*2 + 8 #skip the record header
+        self.lengths = index[:,1].astype(np.int64)*2
+        self.numRecords = len(self.offsets)
+        self.shp = np.memmap(self.shpfile,dtype=np.uint8,mode='r')
+        if self.numRecords and self.offsets[-1] + self.lengths[-1] > len(self.shp):
+            raise ShapeReaderError('%s is shorter than its index says' % self.shpfile)
+
+        self.__loadFields()
+        self.columns = None
+
+    def __findFile(self,base,ext):
+        for filename in [base+ext,base+ext.upper()]:
+            if os.path.isfile(filename):
+                return filename
+        raise ShapeReaderError('Could not find file %s' % (base+ext))
+
+    def __loadFields(self):
+        f = open(self.dbffile,'rb')
+        header = f.read(32)
+        if len(header) < 32:
+            f.close()
+            raise ShapeReaderError('%s is not a dbf file' % self.dbffile)
+        nrecords,headerlength,recordlength = struct.unpack('<IHH',header[4:12])
+        fieldbytes = f.read(headerlength-32)
+        f.close()
+        #the first "field" is the deletion flag, as in the pyshp reader
+        self.fields = [('DeletionFlag','C',1,0)]
+        offset = 1
+        self.fieldoffsets = []
+        for i in range(0,len(fieldbytes)/32):
+            desc = fieldbytes[i*32:(i+1)*32]
+            if desc[0] == '\r':
+                break
+            name = desc[0:11].split('\x00')[0].strip()
+            ftype = desc[11]
+            size,decimal = struct.unpack('<BB',desc[16:18])
+            self.fields.append([name,ftype,size,decimal])
+            self.fieldoffsets.append(offset)
+            offset += size
+        if nrecords != self.numRecords:
+            raise ShapeReaderError('%s has %i records, but %s has %i' % (self.dbffile,nrecords,self.shxfile,
+                                                                        self.numRecords))
+        self.dbfheaderlength = headerlength
+        self.dbfrecordlength = recordlength
+
+    def __gather(self,offsets,nbytes,dtype):
+        #read nbytes starting at each offset into the .shp file, as an (n,nbytes/itemsize) array of dtype
+        idx = offsets[:,np.newaxis] + np.arange(nbytes)
+        return self.shp[idx].view(dtype)
+
+    def getShapeTypes(self):
+        """
+        Return the shape type of every record.
+        @return: numpy integer array of shape types (zero for null shapes).
+        """
+        if not self.numRecords:
+            return np.zeros(0,dtype=np.int32)
+        return self.__gather(self.offsets,4,'<i4')[:,0]
+
+    def getBoundingBoxes(self):
+        """
+        Return the bounding boxes of all records, without reading their points.
+        @return: (numRecords,4) numpy array of xmin,ymin,xmax,ymax.  Null shapes have NaN boxes.
+        """
+        bboxes = np.empty((self.numRecords,4))
+        bboxes.fill(np.nan)
+        if not self.numRecords:
+            return bboxes
+        types = self.getShapeTypes()
+        ispoint = np.in1d(types,POINTTYPES)
+        isbox = np.in1d(types,PARTTYPES+MULTIPOINTTYPES)
+        if isbox.any():
+            bboxes[isbox] = self.__gather(self.offsets[isbox]+4,32,'<f8')
+        if ispoint.any():
+            xy = self.__gather(self.offsets[ispoint]+4,16,'<f8')
+            bboxes[ispoint] = xy[:,[0,1,0,1]]
+        return bboxes
+
+    def shape(self,index):
+        """
+        Read one shape.
+        @param index: Record index, from 0 to numRecords-1.
+        @return: Shape object.
+        @raise ShapeReaderError: When the record is of an unsupported shape type (i.e., MultiPatch).
+        """
+        if index < 0:
+            index += self.numRecords
+        offset = int(self.offsets[index])
+        length = int(self.lengths[index])
+        content = self.shp[offset:offset+length]
+        shapeType = int(content[0:4].view('<i4')[0])
+        if shapeType == NULL:
+            return Shape(NULL,bbox=[],parts=[],points=np.zeros((0,2)))
+        if shapeType in POINTTYPES:
+            values = content[4:].view('<f8')
+            points = values[0:2].reshape((1,2))
+            shape = Shape(shapeType,parts=[0],points=points)
+            shape.bbox = [float(values[0]),float(values[1]),float(values[0]),float(values[1])]
+            if shapeType == POINTZ:
+                shape.z = values[2:3]
+                shape.m = self.__getMeasures(values[3:4])
+            elif shapeType == POINTM:
+                shape.m = self.__getMeasures(values[2:3])
+            return shape
+        if shapeType in PARTTYPES:
+            nparts,npoints = content[36:44].view('<i4')
+            parts = content[44:44+4*nparts].view('<i4').tolist()
+            start = 44+4*nparts
+        elif shapeType in MULTIPOINTTYPES:
+            npoints = content[36:40].view('<i4')[0]
+            parts = [0]
+            start = 40
+        else:
+            raise ShapeReaderError('Unsupported shape type %i' % shapeType)
+        bbox = content[4:36].view('<f8').tolist()
+        end = start + 16*npoints
+        points = content[start:end].view('<f8').reshape((-1,2))
+        shape = Shape(shapeType,bbox=bbox,parts=parts,points=points)
+        #Z values (Z types), then measures (M types, and optionally Z types), each after a min/max pair
+        if shapeType in ZTYPES:
+            shape.z = content[end+16:end+16+8*npoints].view('<f8')
+            end = end + 16 + 8*npoints
+        if shapeType in MTYPES or shapeType in ZTYPES:
+            if end + 16 + 8*npoints <= length:
+                shape.m = self.__getMeasures(content[end+16:end+16+8*npoints].view('<f8'))
+        return shape
+
+    def __getMeasures(self,m):
+        if not len(m):
+            return None
+        m = np.array(m)
+        m[m < NODATA_M] = np.nan
+        return m
+
+    def getColumns(self):
+        """
+        Decode every attribute column in the .dbf file.
+        @return: Dictionary of numpy arrays, keyed by field name.  Character fields are strings, numeric
+                 fields with no decimals are integers (or floats with NaN for blanks, if there are any),
+                 other numeric fields are floats (NaN for blanks), logical fields are objects (True,False,None),
+                 and dates are 'YYYYMMDD' strings.
+        """
+        if self.columns is not None:
+            return self.columns
+        nrecords = self.numRecords
+        recordlength = self.dbfrecordlength
+        data = np.fromfile(self.dbffile,dtype=np.uint8,count=self.dbfheaderlength+nrecords*recordlength)
+        data = data[self.dbfheaderlength:].reshape((nrecords,recordlength))
+        self.columns = {}
+        for i in range(1,len(self.fields)):
+            name,ftype,size,decimal = self.fields[i]
+            offset = self.fieldoffsets[i-1]
+            raw = np.ascontiguousarray(data[:,offset:offset+size]).view('S%i' % size)[:,0]
+            raw = np.char.strip(raw)
+            if ftype in ['N','F']:
+                self.columns[name] = self.__getNumbers(raw,ftype == 'N' and decimal == 0)
+            elif ftype == 'L':
+                logical = np.empty(nrecords,dtype=object)
+                upper = np.char.upper(raw)
+                logical[np.in1d(upper,['T','Y'])] = True
+                logical[np.in1d(upper,['F','N'])] = False
+                self.columns[name] = logical
+            else:
+                self.columns[name] = raw
+        return self.columns
+
+    def __getNumbers(self,raw,isInteger):
+        blank = (raw == '') | (np.char.count(raw,'*') > 0)
+        if blank.any():
+            raw = raw.copy()
+            raw[blank] = 'nan'
+            return raw.astype(np.float64)
+        if isInteger:
+            try:
+                return raw.astype(np.int64)
+            except ValueError:
+                pass
+        return raw.astype(np.float64)
+
+    def getColumn(self,name):
+        """
+        Return one decoded attribute column.
+        @param name: Field name.
+        @return: numpy array (see getColumns()).
+        @raise LookupError: When there is no such field.
+        """
+        columns = self.getColumns()
+        if name not in columns:
+            raise LookupError('Field %s not in %s' % (name,self.dbffile))
+        return columns[name]
+
+    def record(self,index):
+        """
+        Return the attributes of one record.
+        @param index: Record index, from 0 to numRecords-1.
+        @return: List of attribute values, in field order.  Blank numbers are None.
+        """
+        columns = self.getColumns()
+        values = []
+        for name,ftype,size,decimal in self.fields[1:]:
+            value = columns[name][index]
+            if isinstance(value,np.generic):
+                value = value.item()
+            #blank numbers are None, and integer columns with blanks still give integers, as in pyshp
+            if isinstance(value,float):
+                if value != value:
+                    value = None
+                elif ftype == 'N' and decimal == 0:
+                    value = int(value)
+            values.append(value)
+        return values
+
+    def records(self):
+        """
+        Return the attributes of all records.
+        @return: List of lists of attribute values (see record()).
+        """
+        return [self.record(i) for i in range(0,self.numRecords)]
+
+    def shapes(self):
+        """
+        Return all shapes.
+        @return: List of Shape objects.
+        """
+        return [self.shape(i) for i in range(0,self.numRecords)]
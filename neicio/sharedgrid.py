@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+#stdlib imports
+import os
+import os.path
+import cPickle
+import mmap
+import tempfile
+import binascii
+
+#third party imports
+import numpy as np
+
+#local imports
+from grid import Grid
+from geodict import asGeoDict
+
+#shared segments are files in memory (tmpfs) where there is one, so publishing a grid does not touch disk
+if os.path.isdir('/dev/shm'):
+    SHARED_DIR = '/dev/shm'
+else:
+    SHARED_DIR = tempfile.gettempdir()
+
+SHARED_VERSION = 1
+
+class SharedGridError(Exception):
+    "used to indicate an error in SharedGrid"
+    def __str__(self):
+        return repr(self.args[0])
+
+def getSharedFiles(name,directory=None):
+    """
+    Return the names of the files holding a shared grid segment.
+    @param name: Segment name, as returned by publishGrid().
+    @keyword directory: Directory holding shared segments (defaults to SHARED_DIR).
+    @return: Tuple of (data file,header file) names.
+    @raise SharedGridError: When the name is not a plain file name.
+    """
+    if not name or os.path.basename(name) != name:
+        raise SharedGridError('Shared grid names cannot contain directories: %s' % name)
+    if directory is None:
+        directory = SHARED_DIR
+    base = os.path.join(directory,name)
+    return (base + '.shared.npy',base + '.shared.hdr')
+
+def publishGrid(grid,name=None,directory=None):
+    """
+    Publish a Grid's data and geodict in a named shared segment, so that other processes can attach to
+    it (with attachGrid()) without copying or re-reading it.
+
+    The data are copied once into the segment, unless the grid data is already a read-only memory map
+    of a whole file (i.e., numpy.memmap(filename,mode='r')), in which case the segment just refers to
+    that file.  Either way, every process that attaches to the segment shares the same pages of memory.
+    example:
+    popgrid = EsriGrid('landscan.bil')
+    popgrid.load()
+    name = publishGrid(popgrid)
+    del popgrid
+    pool = multiprocessing.Pool(8,initializer=initWorker,initargs=(name,)) #initWorker calls attachGrid(name)
+    ...
+    unlinkGrid(name)
+    @param grid: Any subclass of the Grid object.
+    @keyword name: Segment name.  Defaults to a new unique name.  An existing segment of the same name is
+                   replaced, although processes already attached to it keep the old data.
+    @keyword directory: Directory holding shared segments (defaults to SHARED_DIR).  It must be on the
+                        same machine as every process that attaches to the segment.
+    @return: Segment name, to pass to attachGrid() in other processes.
+    @raise SharedGridError: When the segment could not be written.
+    """
+    if name is None:
+        name = 'neicio-grid-%s' % binascii.hexlify(os.urandom(16))
+    datafile,hdrfile = getSharedFiles(name,directory)
+    griddata = grid.griddata
+    header = {'version':SHARED_VERSION,'geodict':asGeoDict(grid.geodict)}
+    tmpfiles = []
+    try:
+        #write to temporary files and rename them, so attaching processes never see a partial segment
+        if _isFileMap(griddata):
+            header['source'] = (os.path.abspath(griddata.filename),griddata.offset,griddata.dtype.str,
+                                griddata.shape,_getOrder(griddata))
+        else:
+            fd,tmpdata = tempfile.mkstemp(suffix='.shared.npy',dir=os.path.dirname(datafile))
+            os.close(fd)
+            tmpfiles.append(tmpdata)
+            shared = np.lib.format.open_memmap(tmpdata,mode='w+',dtype=griddata.dtype,shape=griddata.shape,
+                                               fortran_order=_getOrder(griddata) == 'F')
+            shared[...] = griddata
+            shared.flush()
+            del shared
+            header['source'] = None
+        fd,tmphdr = tempfile.mkstemp(suffix='.shared.hdr',dir=os.path.dirname(hdrfile))
+        tmpfiles.append(tmphdr)
+        f = os.fdopen(fd,'wb')
+        try:
+            cPickle.dump(header,f,2)
+        finally:
+            f.close()
+        if header['source'] is None:
+            os.rename(tmpfiles[0],datafile)
+        elif os.path.isfile(datafile):
+            os.remove(datafile)
+        os.rename(tmphdr,hdrfile)
+    except (IOError,OSError,cPickle.PicklingError),msg:
+        for tmpfile in tmpfiles:
+            if os.path.isfile(tmpfile):
+                os.remove(tmpfile)
+        raise SharedGridError('Could not publish shared grid %s: %s' % (name,str(msg)))
+    return name
+
+def attachGrid(name,directory=None):
+    """
+    Attach to a grid published (possibly by another process) with publishGrid().
+    @param name: Segment name, as returned by publishGrid().
+    @keyword directory: Directory holding shared segments (defaults to SHARED_DIR).
+    @return: Grid object whose griddata is a read-only memory map of the shared data, with the geodict
+             of the published grid.  It stays valid after the segment is unlinked.
+    @raise SharedGridError: When there is no such segment, or it cannot be read.
+    """
+    datafile,hdrfile = getSharedFiles(name,directory)
+    try:
+        f = open(hdrfile,'rb')
+        try:
+            header = cPickle.load(f)
+        finally:
+            f.close()
+        if header['version'] != SHARED_VERSION:
+            raise SharedGridError('Shared grid %s was published by an incompatible version' % name)
+        if header['source'] is None:
+            griddata = np.load(datafile,mmap_mode='r')
+        else:
+            filename,offset,dtype,shape,order = header['source']
+            griddata = np.memmap(filename,mode='r',dtype=np.dtype(dtype),shape=shape,offset=offset,order=order)
+    except (IOError,OSError,ValueError,KeyError,EOFError,cPickle.UnpicklingError),msg:
+        raise SharedGridError('Could not attach to shared grid %s: %s' % (name,str(msg)))
+    grid = Grid()
+    grid.griddata = griddata
+    grid.geodict = header['geodict']
+    return grid
+
+def unlinkGrid(name,directory=None):
+    """
+    Remove a shared grid segment.  Processes already attached to it keep their (read-only) data, and
+    its memory is freed once the last of them is done with it.  Data files referred to by a segment
+    (see publishGrid()) are not removed.
+    @param name: Segment name, as returned by publishGrid().
+    @keyword directory: Directory holding shared segments (defaults to SHARED_DIR).
+    """
+    for filename in getSharedFiles(name,directory):
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+def _isFileMap(griddata):
+    #only a read-only map of a whole file can be shared by name - views of maps, and copy-on-write maps
+    #(which might have been changed in this process) must be copied
+    return (isinstance(griddata,np.memmap) and isinstance(griddata.base,mmap.mmap) and
+            griddata.mode == 'r' and griddata.filename is not None)
+
+def _getOrder(griddata):
+    if griddata.flags.f_contiguous and not griddata.flags.c_contiguous:
+        return 'F'
+    return 'C'
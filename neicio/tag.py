@@ -3,11 +3,96 @@
 from __future__ import print_function
 
 from xml.dom import minidom
-import copy
+import xml.parsers.expat
+from xml.sax.saxutils import escape,quoteattr
 import datetime
+import re
 import sys
 
 TIMEFMT = '%Y-%m-%d %H:%M:%S'
+XMLHEADER = '<?xml version="1.0" encoding="US-ASCII" standalone="yes"?>\n'
+
+if sys.version_info.major == 2:
+    STRING_TYPES = (str,unicode)
+else:
+    STRING_TYPES = (str,)
+
+NONASCII = re.compile(u'[^\x00-\x7f]')
+
+def asciiText(text):
+    """
+    Return text with any non-ASCII characters replaced by XML character references (as documents are
+    declared US-ASCII, see XMLHEADER).
+    @param text: String.  Byte strings are taken to be UTF-8 (or, failing that, Latin-1).
+    @return: ASCII string.
+    """
+    if not NONASCII.search(text):
+        return text
+    if isinstance(text,bytes):
+        try:
+            text = text.decode('utf-8')
+        except UnicodeDecodeError:
+            text = text.decode('latin-1')
+    return str(text.encode('ascii','xmlcharrefreplace').decode('ascii'))
+
+def convertAttribute(key,value):
+    """
+    Convert an XML attribute string to a float or (for keys containing 'time' or 'date') a datetime,
+    if possible.
+    @param key: Attribute name.
+    @param value: Attribute string value.
+    @return: float, datetime, or the input string.
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    #this may be a time field - let's assume it is and try to parse it
+    if isinstance(value,STRING_TYPES) and (key.lower().count('time') or key.lower().count('date')):
+        try:
+            value = datetime.datetime.strptime(value,TIMEFMT)
+        except ValueError:
+            pass #oh, well, I guess it isn't
+    return value
+
+PATHCACHE = {}
+STEPPATTERN = re.compile(r'^([^\[\]/@]+)((?:\[[^\]]*\])*)$')
+CONDITIONPATTERN = re.compile(r'\[@([^=\]]+?)\s*(?:=\s*(?:"([^"]*)"|'+"'([^']*)'"+r'|([^\]]*?))\s*)?\]')
+
+def parsePath(path):
+    """
+    Parse a path expression (see Tag.findAll()) into a list of (name,[(attribute,value),...]) steps.
+    Value is None for conditions that only check for the presence of an attribute.
+    @param path: Path expression.
+    @return: List of steps.
+    @raise Exception: When path cannot be parsed.
+    """
+    if path in PATHCACHE:
+        return PATHCACHE[path]
+    steps = []
+    for step in path.strip('/').split('/'):
+        match = STEPPATTERN.match(step.strip())
+        if match is None:
+            raise Exception('Could not parse path step "%s" in "%s"' % (step,path))
+        name,condstr = match.groups()
+        conditions = []
+        parsed = ''
+        for condition in CONDITIONPATTERN.finditer(condstr):
+            key,dquoted,squoted,bare = condition.groups()
+            value = dquoted
+            if value is None:
+                value = squoted
+            if value is None:
+                value = bare
+            conditions.append((key.strip(),value))
+            parsed += condition.group()
+        if parsed != condstr:
+            raise Exception('Could not parse conditions "%s" in "%s"' % (condstr,path))
+        steps.append((name.strip(),conditions))
+    if len(PATHCACHE) > 1000:
+        PATHCACHE.clear()
+    PATHCACHE[path] = steps
+    return steps
 
 class Tag(object):
     def __init__(self,name,attributes={},data=None,root=None,schema=None):
@@ -18,15 +103,32 @@ class Tag(object):
         self.name = name
         self.schema = schema
         self.children = []
+        #lazily built {name:[children]} index, and the list/length it was built from
+        self._childindex = None
+        self._indexedchildren = (None,0)
 
     def addAttribute(self,key,value):
         self.attributes[key] = value
         
-    def loadFromFile(self,xmlfile):
+    def loadFromFile(self,xmlfile,parser='expat'):
+        if parser == 'expat':
+            f = open(xmlfile,'rb')
+            try:
+                return self.__loadWithExpat(f)
+            finally:
+                f.close()
         xmlstr = open(xmlfile,'rt').read()
-        return self.loadFromString(xmlstr)
+        return self.loadFromString(xmlstr,parser=parser)
 
-    def loadFromString(self,xmlstr):
+    def loadFromString(self,xmlstr,parser='expat'):
+        """
+        Populate this Tag (and its children) from an XML string.
+        @param xmlstr: String containing an XML document.
+        @keyword parser: 'expat' (default) builds the Tag tree in a single pass with an event-driven
+                         parser, 'minidom' builds a DOM first and converts it.
+        """
+        if parser == 'expat':
+            return self.__loadWithExpat(xmlstr)
         dom = minidom.parseString(xmlstr)
         #try to detect which child node of the dom is an actual XML element
         for root in dom.childNodes:
@@ -47,8 +149,55 @@ class Tag(object):
             self.data = root.firstChild.nodeValue.strip()
         for child in root.childNodes:
             if child.nodeType == child.ELEMENT_NODE:
-                self.children.append(copy.deepcopy(self.convertNode(child)))
+                self.children.append(self.convertNode(child))
 
+    def __loadWithExpat(self,xmlsource):
+        """
+        Populate this Tag from an XML string or binary file object using expat.
+        Children are built as their end tags are reached, with the same attribute conversion as convertNode().
+        """
+        #each stack entry is [name,attributes,text,children,inLeadingText]
+        stack = []
+        def startElement(name,attrs):
+            if len(stack):
+                stack[-1][4] = False
+                attributes = {}
+                for key,value in attrs.items():
+                    attributes[key] = convertAttribute(key,value)
+            else:
+                attributes = attrs
+            stack.append([name,attributes,[],[],True])
+        def endElement(name):
+            name,attributes,text,children,leading = stack.pop()
+            data = ''.join(text).strip()
+            if not len(data):
+                data = None
+            if not len(stack):
+                self.name = name
+                self.attributes.update(attributes)
+                if data is not None:
+                    self.data = data
+                self.children.extend(children)
+                return
+            t = Tag(name,attributes,data)
+            for child in children:
+                t.addChild(child)
+            stack[-1][3].append(t)
+        def characterData(text):
+            #only text that comes before the first child element is treated as Tag data
+            if len(stack) and stack[-1][4]:
+                stack[-1][2].append(text)
+        expat = xml.parsers.expat.ParserCreate()
+        expat.buffer_text = True
+        expat.StartElementHandler = startElement
+        expat.EndElementHandler = endElement
+        expat.CharacterDataHandler = characterData
+        if hasattr(xmlsource,'read'):
+            expat.ParseFile(xmlsource)
+        else:
+            if not isinstance(xmlsource,bytes):
+                xmlsource = xmlsource.encode('utf-8')
+            expat.Parse(xmlsource,True)
 
     def convertNode(self,child):
         name = child.nodeName
@@ -68,28 +217,14 @@ class Tag(object):
             for item in atts.items():
                 key = item[0]
                 value = item[1]
-                try:
-                    value = float(value)
-                except ValueError(msg):
-                    try:
-                        value = int(value)
-                    except ValueError(msg):
-                        pass
-                #this may be a time field - let's assume it is and try to parse it
-                if (isinstance(value,str) or isinstance(value,unicode)) and (key.lower().count('time') or key.lower().count('date')): 
-                    try:
-                        value = datetime.datetime.strptime(value,TIMEFMT)
-                    except ValueError:
-                        pass #oh, well, I guess it isn't
-                    
-                attributes[key] = value
+                attributes[key] = convertAttribute(key,value)
         data = None
         if hasData:
             data = child.firstChild.nodeValue.strip()
         children = []
         for child2 in child.childNodes:
             if child2.nodeType == child2.ELEMENT_NODE:
-                children.append(copy.deepcopy(self.convertNode(child2)))
+                children.append(self.convertNode(child2))
         t = Tag(name,attributes,data)
         for child in children:
             t.addChild(child)
@@ -102,11 +237,105 @@ class Tag(object):
         return repstr
 
     def getChildren(self,name):
-        children = []
-        for child in self.children:
-            if child.name == name:
-                children.append(child)
-        return children
+        return list(self.__getIndex().get(name,[]))
+
+    def __getIndex(self):
+        """
+        Return the {name:[children]} index for this Tag, (re)building it if the children have changed.
+
+        Changes are noticed when made with addChild() or deleteChildren(), by appending to or removing
+        from children, or by replacing the children list.  Changing children in place (children[i] = tag,
+        children.sort(), etc.) or renaming a child is not noticed, so rebuild the index afterwards by
+        replacing the list (tag.children = list(tag.children)).
+        """
+        children,nchildren = self._indexedchildren
+        if self._childindex is None or children is not self.children or nchildren != len(self.children):
+            index = {}
+            for child in self.children:
+                index.setdefault(child.name,[]).append(child)
+            self._childindex = index
+            self._indexedchildren = (self.children,len(self.children))
+        return self._childindex
+
+    def find(self,path):
+        """
+        Return the first Tag matching a simple path expression, relative to this Tag.
+        @param path: Path expression (see findAll()).
+        @return: First matching Tag, or None if nothing matches.
+        """
+        matches = self.findAll(path,first=True)
+        if not len(matches):
+            return None
+        return matches[0]
+
+    def findAll(self,path,first=False):
+        """
+        Return all Tags matching a simple path expression, relative to this Tag.
+        @param path: Slash-separated list of child names, where each name may be '*' (any child) and may be
+                     followed by attribute conditions, i.e.:
+                     - 'event/origin' - All origin children of all event children.
+                     - 'event/origin[@type=preferred]' - As above, only origins whose type attribute is 'preferred'.
+                     - 'event[@id="us1234"]/*[@lat]' - All children with a lat attribute, of event us1234.
+                     Attribute values are compared as numbers or times where the attribute itself is one.
+        @keyword first: Stop after the first match.
+        @return: List of matching Tags, in document order.
+        @raise Exception: When path cannot be parsed.
+        """
+        steps = parsePath(path)
+        if first:
+            for tag in self.__iterMatches(steps,0):
+                return [tag]
+            return []
+        tags = [self]
+        for name,conditions in steps:
+            matches = []
+            for tag in tags:
+                if name == '*':
+                    candidates = tag.children
+                else:
+                    candidates = tag.__getIndex().get(name,[])
+                for candidate in candidates:
+                    if candidate.__matches(conditions):
+                        matches.append(candidate)
+            tags = matches
+            if not len(tags):
+                break
+        return tags
+
+    def __iterMatches(self,steps,istep):
+        #generate the Tags matching steps[istep:] below this one, depth first (which is document order)
+        if istep == len(steps):
+            yield self
+            return
+        name,conditions = steps[istep]
+        if name == '*':
+            candidates = self.children
+        else:
+            candidates = self.__getIndex().get(name,[])
+        for candidate in candidates:
+            if candidate.__matches(conditions):
+                for tag in candidate.__iterMatches(steps,istep+1):
+                    yield tag
+
+    def __matches(self,conditions):
+        for key,value in conditions:
+            if key not in self.attributes:
+                return False
+            if value is None:
+                continue
+            attvalue = self.attributes[key]
+            if isinstance(attvalue,datetime.datetime):
+                attvalue = attvalue.strftime(TIMEFMT)
+            elif isinstance(attvalue,(int,float)):
+                try:
+                    value = float(value)
+                except ValueError:
+                    return False
+            elif not isinstance(attvalue,STRING_TYPES):
+                attvalue = str(attvalue)
+            if attvalue != value:
+                return False
+        return True
 
     def addChild(self,tag):
         if not isinstance(tag,Tag):
@@ -114,6 +343,7 @@ class Tag(object):
         if self.data is not None:
             raise Exception('You can have child elements or tag data, but not both!')
         self.children.append(tag)
+        self._childindex = None
 
     def deleteChildren(self,tagname):
         if not isinstance(tagname,str):
@@ -122,57 +352,68 @@ class Tag(object):
         goodchildren = []
         for child in self.children:
             if child.name != tagname:
-                goodchildren.append(copy.deepcopy(child))
+                goodchildren.append(child)
             else:
                 numchildren += 1
         
         self.children = goodchildren
+        self._childindex = None
         return numchildren
 
-    def renderTag(self,ntabs):
-        hasAttributes = bool(len(self.attributes))
-        hasData = self.data is not None
-        hasChildren = bool(len(self.children))
-        if sys.version_info.major == 2:
-            allowed_types = (str,unicode)
-        else:
-            allowed_types = (str)
-        linestr = '\t'*ntabs+'<%s ' % self.name
-        if hasAttributes:
-            attstr = ''
-            for key,value in self.attributes.items():
-                if isinstance(value,datetime.datetime):
-                    value = value.strftime(TIMEFMT)
-                #strip out " (double quotes) from attributes - they'll mess up XML parsing later
-                if isinstance(value,allowed_types):
-                    value = value.replace('"',"'")
-                attstr = attstr + '%s="%s" ' % (key,str(value))
-            linestr = linestr + attstr.strip()
-        if hasData or hasChildren:
-            if hasData:
-                linestr = linestr.rstrip() + '>\n'
-                linestr = linestr + '\t'*(ntabs+1) + self.data + '\n' + '\t'*ntabs + '</%s>\n' % self.name
-            if hasChildren:
-                linestr = linestr.rstrip() + '>\n'
-                for child in self.children:
-                    linestr = linestr + child.renderTag(ntabs+1)
-                linestr = linestr + '\n' + '\t'*ntabs + '</%s>\n' % self.name
-                #linestr = linestr + '\t'*ntabs + '</%s>\n' % self.name
+    def renderChunks(self,ntabs=0):
+        """
+        Generate the XML for this Tag and all of its children, one piece at a time.
+        @keyword ntabs: Number of tabs to indent this Tag by.
+        @return: Generator of strings which, joined together, make up the XML for this Tag.
+        """
+        indent = '\t'*ntabs
+        attlist = []
+        for key,value in self.attributes.items():
+            if isinstance(value,datetime.datetime):
+                value = value.strftime(TIMEFMT)
+            elif not isinstance(value,STRING_TYPES):
+                value = str(value)
+            attlist.append(' %s=%s' % (key,asciiText(quoteattr(value))))
+        start = '%s<%s%s' % (indent,self.name,''.join(attlist))
+        if self.data is not None:
+            yield '%s>\n%s\t%s\n%s</%s>\n' % (start,indent,asciiText(escape(self.data)),indent,self.name)
+        elif len(self.children):
+            yield start + '>\n'
+            for child in self.children:
+                for chunk in child.renderChunks(ntabs+1):
+                    yield chunk
+            yield '%s</%s>\n' % (indent,self.name)
         else:
-            linestr = linestr + '/>\n'
-        return linestr
+            yield start + '/>\n'
+
+    def renderTag(self,ntabs):
+        return ''.join(self.renderChunks(ntabs))
+
+    def writeXML(self,fileobj,ntabs=0):
+        """
+        Write this Tag as an XML document to an open file object, without building the document in memory.
+        @param fileobj: File-like object with a write() method.
+        @keyword ntabs: Number of tabs to indent the root Tag by.
+        """
+        fileobj.write(XMLHEADER)
+        for chunk in self.renderChunks(ntabs):
+            fileobj.write(chunk)
 
     def renderToXML(self,filename=None,ntabs=0):
-        xmlstr = '<?xml version="1.0" encoding="US-ASCII" standalone="yes"?>\n'
-        xmlstr = xmlstr + self.renderTag(ntabs)
-        xmlstr2 = ''
-        for line in xmlstr.split('\n'):
-            if len(line.strip()):
-                xmlstr2 = xmlstr2 + line + '\n'
+        """
+        Render this Tag as an XML document (see writeXML() to write large documents without building them
+        in memory).
+        @keyword filename: Optional file to write the document to.
+        @keyword ntabs: Number of tabs to indent the root Tag by.
+        @return: The XML document.
+        """
+        xmlstr = XMLHEADER + self.renderTag(ntabs)
         if filename is not None:
             f = open(filename,'wt')
-            f.write(xmlstr2)
-            f.close()
+            try:
+                f.write(xmlstr)
+            finally:
+                f.close()
         return xmlstr
 
 
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+#third party imports
+import numpy as np
+
+#local imports
+from mapalgebra import iterStrips,STRIP_BYTES
+
+STATISTICS = ['sum','count','mean','min','max']
+
+class ZonalError(Exception):
+    "used to indicate an error in zonal statistics"
+    def __str__(self):
+        return repr(self.args[0])
+
+def zonalStats(values,zones,bins=None,weights=None,stats=STATISTICS,stripbytes=STRIP_BYTES):
+    """
+    Summarize a grid of values by zone (or by combination of zones), in one vectorized pass per strip.
+    example - population exposed to each MMI level, by country:
+    mmi = ShakeGrid('grid.xml',variable='MMI')
+    mmi.interpolateToGrid(popgrid.getGeoDict())
+    mmibins = [0.5,1.5,2.5,3.5,4.5,5.5,6.5,7.5,8.5,9.5,10.5] #bin 0 is MMI I, bin 9 is MMI X
+    exposure = zonalStats(popgrid,[isogrid,mmi],bins=[None,mmibins],stats=['sum'])
+    print exposure[(392,5)]['sum'] #population exposed to MMI VI in Japan
+    @param values: Grid object, grid file name, or map algebra expression of values to summarize.
+    @param zones: Zone grid (or file name, or expression) or list of them, aligned with values.
+                  Without bins, zone values are truncated to integer codes (country codes, etc.)
+    @keyword bins: Sequence of bin edges for each zone grid (None for integer codes), or, for a single
+                   zone grid, just its bin edges.  Bin i holds values from edges[i] up to (not including)
+                   edges[i+1], and cells outside the edges are ignored.
+    @keyword weights: Optional aligned grid (or file name, or expression) of weights.  sum is then the
+                      weighted sum, and mean the weighted mean; count, min and max are not weighted.
+    @keyword stats: List of statistics to compute, from STATISTICS.
+    @keyword stripbytes: Approximate size of each strip of each grid, in bytes.
+    @return: Dictionary of dictionaries of statistics, keyed by zone code (or bin index), or by tuple of
+             zone codes when there is more than one zone grid.  Cells where the value, any zone or the
+             weight is NaN are ignored, and zones with no valid cells are left out.
+    @raise ZonalError: When a statistic is not recognized, or bins does not match zones.
+    @raise MapAlgebraError: When the grids are not aligned.
+    """
+    for stat in stats:
+        if stat not in STATISTICS:
+            raise ZonalError('Unknown statistic %s - choose from %s' % (stat,str(STATISTICS)))
+    single = not isinstance(zones,(list,tuple))
+    if single:
+        zones = [zones]
+        bins = [bins]
+    elif bins is None:
+        bins = [None]*len(zones)
+    if len(bins) != len(zones):
+        raise ZonalError('There must be one set of bin edges (or None) for each zone grid')
+    bins = [np.asarray(edges,dtype=np.float64) if edges is not None else None for edges in bins]
+    grids = [values] + list(zones)
+    if weights is not None:
+        grids.append(weights)
+    doextremes = 'min' in stats or 'max' in stats
+    totals = {}
+    for row1,row2,strips in iterStrips(grids,stripbytes):
+        data = strips[0]
+        valid = ~np.isnan(data)
+        if weights is not None:
+            valid &= ~np.isnan(strips[-1])
+        codes = []
+        for zone,edges in zip(strips[1:len(zones)+1],bins):
+            if edges is None:
+                valid &= ~np.isnan(zone)
+                codes.append(zone)
+            else:
+                code = np.searchsorted(edges,zone,side='right')-1
+                valid &= (code >= 0) & (code < len(edges)-1)
+                codes.append(code)
+        wdata = None
+        if weights is not None:
+            wdata = strips[-1]
+        if not valid.all():
+            if not valid.any():
+                continue
+            data = data[valid]
+            codes = [code[valid] for code in codes]
+            if wdata is not None:
+                wdata = wdata[valid]
+        else:
+            data = data.ravel()
+            codes = [code.ravel() for code in codes]
+            if wdata is not None:
+                wdata = wdata.ravel()
+        codes = [code.astype(np.int64) for code in codes]
+        _addStrip(totals,data,codes,wdata,doextremes)
+    results = {}
+    for key,(vsum,count,wsum,vmin,vmax) in totals.items():
+        if single:
+            key = key[0]
+        result = {}
+        for stat in stats:
+            if stat == 'sum':
+                result['sum'] = vsum
+            elif stat == 'count':
+                result['count'] = count
+            elif stat == 'mean':
+                if wsum:
+                    result['mean'] = vsum/wsum
+                else:
+                    result['mean'] = np.nan
+            elif stat == 'min':
+                result['min'] = vmin
+            elif stat == 'max':
+                result['max'] = vmax
+        results[key] = result
+    return results
+
+def _addStrip(totals,data,codes,wdata,doextremes):
+    #number the codes of each zone grid 0..n-1 - directly when their range is small, otherwise by sorting
+    indices = []
+    labels = []
+    for code in codes:
+        cmin,cmax = code.min(),code.max()
+        if cmax-cmin < len(code):
+            labels.append(np.arange(cmin,cmax+1))
+            indices.append(code-cmin)
+        else:
+            label,index = np.unique(code,return_inverse=True)
+            labels.append(label)
+            indices.append(index)
+    dims = tuple([len(label) for label in labels])
+    if len(indices) == 1:
+        flat = indices[0]
+    else:
+        flat = np.ravel_multi_index(indices,dims)
+    if np.prod(dims) <= len(flat):
+        counts = np.bincount(flat,minlength=np.prod(dims))
+        groupids = np.flatnonzero(counts)
+        counts = counts[groupids]
+        sums = np.bincount(flat,weights=data if wdata is None else data*wdata)[groupids]
+        if wdata is not None:
+            wsums = np.bincount(flat,weights=wdata)[groupids]
+    else:
+        groupids,flat = np.unique(flat,return_inverse=True)
+        counts = np.bincount(flat)
+        sums = np.bincount(flat,weights=data if wdata is None else data*wdata)
+        if wdata is not None:
+            wsums = np.bincount(flat,weights=wdata)
+    if wdata is None:
+        wsums = counts
+    if doextremes:
+        #the order within each group does not matter, so the sort need not be stable
+        sorteddata = data[np.argsort(flat,kind='quicksort')]
+        starts = np.concatenate(([0],np.cumsum(counts)[:-1]))
+        mins = np.minimum.reduceat(sorteddata,starts)
+        maxs = np.maximum.reduceat(sorteddata,starts)
+    zoneindices = np.unravel_index(groupids,dims)
+    for i in range(0,len(groupids)):
+        key = tuple([int(labels[j][zoneindices[j][i]]) for j in range(0,len(codes))])
+        vmin = vmax = None
+        if doextremes:
+            vmin = float(mins[i])
+            vmax = float(maxs[i])
+        if key not in totals:
+            totals[key] = [float(sums[i]),int(counts[i]),float(wsums[i]),vmin,vmax]
+            continue
+        total = totals[key]
+        total[0] += float(sums[i])
+        total[1] += int(counts[i])
+        total[2] += float(wsums[i])
+        if doextremes:
+            total[3] = min(total[3],vmin)
+            total[4] = max(total[4],vmax)